@@ -0,0 +1,6 @@
+'''
+Converts award entry docx and html articles to cleaned html.
+convert_articles.py is the cli, and puts the library api together from the modules here.
+'''
+
+__version__ = '0.2.0'
@@ -0,0 +1,923 @@
+'''
+Converting one docx or html article, with the conversion cache and image optimiser it uses.
+'''
+import logging as log
+import os
+import sys
+import re
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from . import __version__
+from .util import atomic_path, copy_atomic, pillow
+from .logger import lgr1, lgr2
+from .pandoc import pandoc_server
+from .markup import HeadingIndex, Rewriter, Sanitizer
+from .rules import Rules
+from .bundle import AssetStore, Manifest
+
+
+class DocxMedia(object):
+    '''
+    # DocxMedia Class
+    Images in a docx, read straight from its zip without unpacking it.
+    The document, footnote and endnote parts map relationship IDs to files under word/media,
+    images are listed in the order those IDs are first used.
+    - Arguments:
+        - docx: path, file object or bytes of the docx.
+    '''
+    TYPES = ('.jpeg', '.jpg', '.png', '.gif', '.emf', '.tiff', '.tif')
+    PARTS = ('document', 'footnotes', 'endnotes')                   # the parts pandoc reads images from
+    IMAGE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+    RID = re.compile(rb'\w+:(?:embed|id|link)="([^"]+)"')          # r:embed on drawings, r:id on vml
+
+    def __init__(self, docx):
+        import io
+        import zipfile
+        self.zip = zipfile.ZipFile(io.BytesIO(docx) if isinstance(docx, bytes) else docx)
+        self.names = set(self.zip.namelist())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.zip.close()
+
+    def relationships(self, part):
+        '''
+        Returns a dict of relationship ID --> zip path of the images in part, e.g. 'rId10' --> 'word/media/image1.png'.
+        Linked images outside the docx are skipped.
+        '''
+        import posixpath
+        import xml.etree.ElementTree as ET
+        try:
+            rels = ET.fromstring(self.zip.read(f'word/_rels/{part}.xml.rels'))
+        except KeyError:
+            return {}
+        images = {}
+        for rel in rels:
+            target = rel.get('Target', '')
+            if rel.get('Type') == self.IMAGE and rel.get('TargetMode') != 'External':
+                # targets are relative to word/ unless they start with /
+                path = target[1:] if target.startswith('/') else posixpath.join('word', target)
+                images[rel.get('Id')] = posixpath.normpath(path)
+        return images
+
+    def images(self):
+        '''
+        Returns the zip paths of the images the document uses, once each, in the order they're used.
+        '''
+        found = {}
+        for part in self.PARTS:
+            images = self.relationships(part)
+            if not images:
+                continue
+            for rid in self.RID.findall(self.zip.read(f'word/{part}.xml')):
+                name = images.get(rid.decode())
+                if name in self.names:
+                    found.setdefault(name, None)
+        return list(found)
+
+    def read(self, name):
+        '''
+        Returns the contents of one file in the zip.
+        '''
+        return self.zip.read(name)
+
+
+class Profiler(object):
+    '''
+    # Profiler Class
+    Records wall time, CPU time and memory of each stage of converting one file.
+    - Stages are timed with `with profiler.stage(name):` and nest, so a stage started inside
+      amend_html is recorded as 'amend_html/amend_images'. Each thread has its own nesting.
+    - A stage run many times (e.g. a rule called per tag) is summed into one row with a call count.
+    - CPU time is the calling thread's plus any subprocesses it waited for, so pandoc and magick count.
+    - rss_kb is the process's peak resident memory when the stage ended, so the stage where it jumps
+      is the one that set a new high. Cheap, but not available on Windows.
+    - With memory, peak_kb is the highest Python allocation (tracemalloc) above where the stage started.
+      It's process wide, so stages running at once on threads see each other's allocations, and
+      memory used inside pandoc or magick isn't included. tracemalloc makes conversion several
+      times slower, so compare times from a run without it.
+    - Arguments:
+        - memory: trace Python allocations for peak_kb.
+        - trace: also keep every stage as an event for a Chrome trace, see write_trace().
+    '''
+
+    def __init__(self, memory=False, trace=False):
+        try:
+            import resource
+            self.resource = resource
+        except ImportError:                                         # Windows
+            self.resource = None
+        self.tracemalloc = None
+        if memory:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        self.trace = trace
+        self.stats = {}                                             # path --> [calls, wall, cpu, rss, peak]
+        self.events = []                                            # (path, thread, start, seconds)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.open = {}                                              # id --> [peak seen] of every running stage
+
+    def rss(self):
+        '''
+        Peak resident memory of the process so far in KB, or None where it can't be read.
+        '''
+        if not self.resource:
+            return None
+        rss = self.resource.getrusage(self.resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 if sys.platform == 'darwin' else rss     # bytes on macOS, KB elsewhere
+
+    def peak(self):
+        '''
+        Current peak allocation, folded into every running stage before it's reset for a new one.
+        '''
+        peak = self.tracemalloc.get_traced_memory()[1]
+        for frame in self.open.values():
+            frame[0] = max(frame[0], peak)
+        return peak
+
+    def path(self):
+        '''
+        Names of the stages running on this thread, outermost first.
+        '''
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Records the body of the with block as stage name, nested under any stage already running on this thread.
+        '''
+        stack = self.path()
+        stack.append(name)
+        path = '/'.join(stack)
+        frame = [0]
+        with self.lock:
+            stats = self.stats.setdefault(path, [0, 0.0, 0.0, None, None])
+            if self.tracemalloc:
+                self.peak()
+                if hasattr(self.tracemalloc, 'reset_peak'):        # 3.9+, otherwise peaks are since start
+                    self.tracemalloc.reset_peak()
+                base = self.tracemalloc.get_traced_memory()[0]
+                self.open[id(frame)] = frame
+        children = os.times()
+        cpu = time.thread_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            cpu = time.thread_time() - cpu
+            ended = os.times()
+            cpu += (ended.children_user - children.children_user) + (ended.children_system - children.children_system)
+            rss = self.rss()
+            with self.lock:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] += cpu
+                if rss is not None:
+                    stats[3] = max(stats[3] or 0, rss)
+                if self.tracemalloc:
+                    self.peak()
+                    del self.open[id(frame)]
+                    stats[4] = max(stats[4] or 0, frame[0] - base)
+                if self.trace:
+                    self.events.append((path, threading.get_ident(), start, seconds))
+            stack.pop()
+
+    def report(self):
+        '''
+        Returns a row per stage in the order they were first started, with times in seconds and memory in KB.
+        '''
+        return [{'stage': path, 'calls': calls, 'wall': round(wall, 6), 'cpu': round(cpu, 6),
+                 'rss_kb': rss and round(rss), 'peak_kb': peak and round(peak / 1024, 1)}
+                for path, (calls, wall, cpu, rss, peak) in self.stats.items()]
+
+
+def staged(method):
+    '''
+    Records an Article method as a stage of the same name when the Article has a PROFILER.
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.stage(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class Article(object):
+    '''
+    # Article Class
+    Converts in memory, nothing is written until write_images() and write_html() unless LOW_MEMORY is set.
+    - Arguments:
+        - IN_FILE: specify docx or html file.
+        - TAGS: specify allowed html tags and attributes in json file.
+        - SUBS: specify substitutions for h3 headings in html.
+        - HEADINGS: HeadingIndex compiled from SUBS, pass one in to share it across a batch.
+        - PROFILER: Profiler to record each stage in, or None.
+        - DATA: docx bytes or html text if already in memory, IN_FILE is then only used for its name.
+        - LOW_MEMORY: keep as little of the article in memory as possible, images are written
+          next to the htm as they're read rather than by write_images(). See build().
+        - MANIFEST: Manifest of the last conversion, images unchanged since then are reused rather than converted.
+        - ASSETS: AssetStore to name images by their contents and write them to, shared with other articles.
+        - RULES: Rules for amend_html, loaded from JSON/rules.json if not given, pass them in to share them.
+    '''
+    CONVERT = ('.emf', '.tiff', '.tif')                             # converted to jpg
+    PILLOW = ('.tiff', '.tif')                                      # converted in-process, emf needs magick
+    IMAGE_WORKERS = 4                                               # image conversions at once, per process
+    TIMEOUT = None                                                  # seconds allowed for each pandoc / magick run
+    LOG_SAMPLE = 5                                                  # debug records of each event, the rest are counted
+    DATA_URI = re.compile(r'''(<img\b[^>]*?)\s+src\s*=\s*(?:"data:[^"]*"|'data:[^']*')''', re.I)
+
+    def __init__(
+        self,
+        IN_FILE,  # user input filename
+        TAGS,     # allowed html tags and attributes, also loaded in from JSON
+        SUBS,     # substitute awards headers, also loaded in from JSON
+        AWARD,    # user input award - warc / media / mena / asia
+        BACKEND='pandoc',  # docx conversion - 'pandoc' subprocess per file or warm 'server'
+        HEADINGS=None,     # compiled heading lookup, built from SUBS if not given
+        PROFILER=None,     # records time and memory of each stage when profiling
+        DATA=None,         # docx bytes or html text, read from IN_FILE if not given
+        LOW_MEMORY=False,  # images go to disk as they're read, the docx is left for pandoc to read
+        MANIFEST=None,     # hashes of the last conversion, to reuse unchanged images
+        ASSETS=None,       # shared image store, images are named by their contents rather than fNN
+        RULES=None         # compiled amend_html rules, loaded from JSON/rules.json if not given
+    ):
+        # super(Article, self).__init__()
+        content = None  # html content variable to update\\\\\\\\\\\\\\\\\\\\\\
+        self.DATA = DATA
+        self.LOW_MEMORY = LOW_MEMORY
+        self.IMGS = {}  # image names for renaming passed in when extracted from docx
+        self.IMAGES = {}  # renamed image name --> contents, or its path once written in low memory mode
+        self.IMAGE_TIMES = {}  # seconds to convert each tiff / emf, None where it failed
+        self.TAGS = TAGS
+        self.SUBS = SUBS
+        self.HEADINGS = HEADINGS or HeadingIndex(SUBS)
+        self.RULES = RULES or Rules.load()
+        self.MISSING = []  # award headings not found in the article
+        self.MANIFEST = MANIFEST
+        self.ASSETS = ASSETS
+        self.SOURCES = {}  # image stem --> hash in the docx, for the MANIFEST
+        self.REUSED = set()  # image stems reused from the last conversion
+        self.CHANGES = None  # what changed since the last conversion, from the MANIFEST
+        self.EVENTS = {}  # per tag / image event --> times seen in this stage, see event()
+        self.ENDNOTES = None  # heading the footnotes rule put before the endnotes, for Document
+        self.OUTPUTS = {}  # Document output name --> path, see process(outputs=)
+        self.AWARD = AWARD
+        self.BACKEND = BACKEND
+        self.PROFILER = PROFILER
+        self.IN_FILE = IN_FILE
+        # award-specific code to go in img src tags
+        self.AWARD_CODE = SUBS[AWARD]['code']
+        # path for writing images and htm to
+        self.MEDIA_PATH = IN_FILE.parent / 'htm'
+        self.OUT_FILE = Path(f"{self.MEDIA_PATH}/{IN_FILE.stem}.htm")
+
+    def read(self):
+        '''
+        Returns the input file's contents, reading IN_FILE the first time if they weren't passed in.
+        '''
+        if self.DATA is None:
+            self.DATA = self.IN_FILE.read_bytes()
+        return self.DATA
+
+    def source(self):
+        '''
+        Returns the docx to read from, IN_FILE itself in low memory mode so its contents are never held in memory.
+        '''
+        if self.LOW_MEMORY and self.DATA is None:
+            return self.IN_FILE
+        return self.read()
+
+    @property
+    def IMAGE_PATH(self):
+        '''
+        The folder images are written to, the htm folder or the shared AssetStore.
+        '''
+        return self.ASSETS.path if self.ASSETS else self.MEDIA_PATH
+
+    def link(self, name):
+        '''
+        Returns the src an image is linked from in the html.
+        '''
+        folder = f'{AssetStore.FOLDER}/' if self.ASSETS else ''
+        return f"/fulltext/{self.AWARD_CODE}/images/{folder}{name}"
+
+    def make_dir(self):
+        '''
+        Ensures the directory for images and the htm exists.
+        '''
+        try:
+            self.MEDIA_PATH.mkdir(exist_ok=False)
+            lgr1.info(f'made dir: {self.MEDIA_PATH}')
+        except FileExistsError as e:
+            lgr1.debug(f'dir exists: {self.MEDIA_PATH}')
+
+    def event(self, logger, name, msg, *args):
+        '''
+        Counts a per-tag or per-image event for log_events(), logging only the first LOG_SAMPLE of each
+        at DEBUG (every one if LOG_SAMPLE is 0). msg is only formatted with args if it's logged.
+        '''
+        n = self.EVENTS[name] = self.EVENTS.get(name, 0) + 1
+        if (not self.LOG_SAMPLE or n <= self.LOG_SAMPLE) and logger.isEnabledFor(log.DEBUG):
+            logger.debug(msg, *args)
+
+    def log_events(self, logger, stage):
+        '''
+        Logs one record counting each event() of a stage, then starts counting afresh.
+        '''
+        counts, self.EVENTS = self.EVENTS, {}
+        if counts and logger.isEnabledFor(log.DEBUG):
+            logger.debug('%s: %s', stage, ', '.join(f'{k} x{n}' for k, n in counts.items()),
+                         extra={'stage': stage, 'counts': counts})
+
+    def stage(self, name):
+        '''
+        Context manager recording its block as a stage in the PROFILER, or doing nothing without one.
+        '''
+        return self.PROFILER.stage(name) if self.PROFILER else nullcontext()
+
+    @staged
+    def convert_docx(self):
+        '''
+        Uses the pypandoc module to convert docx file to html content for parsing.
+        Images are left as media/... paths in the docx, rename_docx_images extracts them.
+        '''
+        import pypandoc
+        if self.BACKEND == 'server':
+            return self.convert_docx_server()
+        lgr1.debug('converting docx to html...')
+        source = self.source()
+        if self.TIMEOUT:
+            return self.run_pandoc(source)
+        if isinstance(source, Path):
+            return pypandoc.convert_file(str(source), 'html5', format='docx')
+        content = pypandoc.convert_text(source, 'html5', format='docx')        # sent to pandoc on stdin
+        return content
+
+    def run_pandoc(self, source):
+        '''
+        Converts a docx path or bytes to html with pandoc as pypandoc does, but killed after TIMEOUT seconds.
+        '''
+        import subprocess
+        import pypandoc
+        args = [pypandoc.get_pandoc_path(), '--from=docx', '--to=html5']
+        path = isinstance(source, Path)
+        try:
+            p = subprocess.run(args + [str(source)] if path else args, input=None if path else source,
+                               capture_output=True, timeout=self.TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f'pandoc took longer than {self.TIMEOUT:g}s, stopped it') from None
+        stderr = p.stderr.decode('utf-8', errors='replace')
+        if p.returncode != 0:
+            raise RuntimeError(f'Pandoc died with exitcode "{p.returncode}" during conversion: {stderr}')
+        if stderr:
+            lgr1.warning(f'pandoc: {stderr.strip()}')
+        return p.stdout.decode('utf-8', errors='replace')
+
+    def convert_docx_server(self):
+        '''
+        Converts docx file to html content on the pandoc server, same output as convert_docx.
+        Waits TIMEOUT seconds if set, otherwise as long as the server allows.
+        '''
+        lgr1.debug('converting docx to html on pandoc server...')
+        data = self.source()
+        return pandoc_server().convert(data.read_bytes() if isinstance(data, Path) else data, 'docx', 'html5',
+                                       timeout=self.TIMEOUT)
+
+    def write_image(self, name, data):
+        '''
+        Writes an image (bytes, or a path to copy) to IMAGE_PATH, returning its path.
+        One already in the AssetStore isn't written again, the same name means the same contents.
+        '''
+        path = self.IMAGE_PATH / name
+        if self.ASSETS and path.is_file():
+            return path
+        if isinstance(data, Path):
+            if data != path:
+                copy_atomic(data, path)
+        else:
+            with atomic_path(path) as tmp:
+                tmp.write_bytes(data)
+        return path
+
+    def spill(self, name, data):
+        '''
+        In low memory mode writes an image (bytes, or a path to copy) next to the htm and returns its path.
+        Otherwise returns data as it is.
+        '''
+        return self.write_image(name, data) if self.LOW_MEMORY else data
+
+    def reuse_image(self, new, data):
+        '''
+        Notes the hash of an image read from the docx for the MANIFEST, and if it's the same as last time puts the
+        files made from it then back in IMAGES. Returns the name to link to if it was reused, otherwise None.
+        '''
+        stem = Path(new).stem
+        source = self.SOURCES[stem] = Manifest.digest(data)
+        files = self.MANIFEST.reuse(stem, source, self.IMAGE_PATH)
+        if not files:
+            return None
+        self.IMAGES.update(files)
+        self.REUSED.add(stem)
+        lgr1.debug(f'unchanged, reused: {", ".join(files)}')
+        return self.MANIFEST.images[stem]['image']
+
+    def image_manifest(self):
+        '''
+        Returns image stem --> hash in the docx, the name linked in the html and the hash of each file made from it.
+        '''
+        linked = {v.rsplit('/', 1)[-1] for v in self.IMGS.values()}
+        entries = {}
+        for name, data in self.IMAGES.items():
+            stem = Path(name).stem
+            if stem not in self.SOURCES:
+                continue
+            if stem in self.REUSED:
+                entries[stem] = self.MANIFEST.images[stem]
+                continue
+            entry = entries.setdefault(stem, {'source': self.SOURCES[stem], 'image': None, 'files': {}})
+            entry['files'][name] = Manifest.digest(self.image_bytes(data))
+            if name in linked:
+                entry['image'] = name
+        return entries
+
+    def keep_image(self, name, data):
+        '''
+        Adds an image to IMAGES, spilled to disk in low memory mode.
+        '''
+        self.IMAGES[name] = self.spill(name, data)
+
+    @staticmethod
+    def image_bytes(data):
+        '''
+        Returns the bytes of an IMAGES value, reading it if it's a path.
+        '''
+        return data.read_bytes() if isinstance(data, Path) else data
+
+    @classmethod
+    def image_cleanup(cls, data, suffix, timeout=None):
+        '''
+        Convert images that are tiff, tif or emf to jpgs, from and to bytes.
+        Pillow converts in-process where it can, emf (or anything without Pillow) goes to magick,
+        which is stopped after timeout seconds if given.
+        '''
+        import io
+        import subprocess
+        Image = pillow()
+        if Image and suffix.casefold() in cls.PILLOW:
+            with Image.open(io.BytesIO(data)) as im:
+                if im.mode not in ('RGB', 'L', 'CMYK'):
+                    im = im.convert('RGB')
+                out = io.BytesIO()
+                im.save(out, 'JPEG', quality=92)                    # magick's default quality
+            return out.getvalue()
+        fmt = suffix.lstrip('.').lower()
+        return subprocess.run(['magick', f'{fmt}:-', 'jpg:-'], input=data, check=True, capture_output=True,
+                              timeout=timeout).stdout
+
+    def convert_images(self, images):
+        '''
+        Converts (name, bytes or path) pairs to jpg with image_cleanup on a pool of threads.
+        Identical images are hashed and converted once, the result is reused for the rest.
+        Returns a dict of image name --> (jpg bytes, seconds taken), (None, None) where conversion failed.
+        In low memory mode each jpg is written next to the htm as it's made and its path returned instead.
+        '''
+        import hashlib
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        groups = {}
+        for name, data in images:
+            groups.setdefault(hashlib.sha256(self.image_bytes(data)).hexdigest(), []).append((name, data))
+        done = {}
+        start = time.perf_counter()
+
+        def cleanup(name, data):
+            with self.stage('image_cleanup'):                       # on its own thread, so not nested
+                begin = time.perf_counter()
+                jpg = self.image_cleanup(self.image_bytes(data), Path(name).suffix, self.TIMEOUT)
+                jpg = self.spill(str(Path(name).with_suffix('.jpg')), jpg)
+                seconds = time.perf_counter() - begin
+                lgr1.debug("converted: '%s' --> jpg (%.2fs)", name, seconds)
+                return jpg, seconds
+
+        with ThreadPoolExecutor(max_workers=self.IMAGE_WORKERS) as pool:
+            futures = {pool.submit(cleanup, *group[0]): group for group in groups.values()}
+            for fut in as_completed(futures):
+                (name, _), *dupes = futures[fut]
+                try:
+                    jpg, seconds = done[name] = fut.result()
+                except Exception as e:
+                    error = getattr(e, 'stderr', None) or e
+                    if isinstance(error, bytes):
+                        error = error.decode('utf-8', 'replace')
+                    lgr1.error(f"could not convert '{name}': {str(error).strip()}")
+                    done.update({n: (None, None) for n, _ in [(name, None), *dupes]})
+                    continue
+                lgr1.info(f"converted: '{name}' --> jpg in {seconds:.2f}s")
+                for dupe, _ in dupes:
+                    done[dupe] = (jpg, 0.0)
+                    lgr1.info(f"converted: '{dupe}' --> jpg, same as '{name}'")
+        lgr1.info(f'converted: {len(images)} images ({len(groups)} unique) in {time.perf_counter() - start:.2f}s')
+        return done
+
+    @staged
+    def rename_docx_images(self):
+        '''
+        Reads images from the docx zip under their new names, numbered in the order the
+        document uses them, and converts tiff, tif and emf to jpg. They're kept in IMAGES for write_images.
+        Returns old img path and new img filename in a dict for subtitution in html.
+        '''
+        import posixpath
+        ID = self.OUT_FILE.stem  # f.parent.parent.name # to get /<ID> rather than /media
+        lgr1.debug(f'ID = {ID}')
+        lgr1.debug('extracting images...')
+        with DocxMedia(self.source()) as media:
+            images = [i for i in media.images() if Path(i).suffix.casefold() in media.TYPES]
+            if not images:
+                lgr1.debug('no images to rename')
+                return self.IMGS
+            convert = []
+            for n, name in enumerate(images, 1):
+                data = media.read(name)
+                if self.ASSETS:
+                    new = self.ASSETS.name(data, Path(name).suffix)
+                else:
+                    new = f"{ID}f{n:02}{Path(name).suffix}"
+                src = posixpath.relpath(name, 'word')               # as pandoc writes it in <img src>
+                self.event(lgr1, 'renamed image', '"%s" --> %s', src, new)
+                reused = self.MANIFEST and self.reuse_image(new, data)
+                if reused:
+                    self.IMGS[src] = self.link(reused)
+                    continue
+                if Path(new).suffix.casefold() in self.CONVERT:
+                    # convert unwanted images, all at once below
+                    convert.append((src, new, self.spill(new, data)))
+                else:
+                    self.keep_image(new, data)
+                    self.IMGS[src] = self.link(new)
+        if convert:
+            done = self.convert_images([(new, data) for _, new, data in convert])
+            for src, new, data in convert:
+                jpg, self.IMAGE_TIMES[new] = done[new]
+                if jpg is not None:
+                    if isinstance(data, Path):
+                        data.unlink()                               # the spilled original
+                    new, data = str(Path(new).with_suffix('.jpg')), jpg
+                # otherwise keep the original rather than leave a broken link
+                self.keep_image(new, data)
+                self.IMGS[src] = self.link(new)
+        self.log_events(lgr1, 'rename_docx_images')
+        lgr1.info(f"renamed: {len(self.IMGS)} images")
+        return self.IMGS
+
+    def convert(self, optimiser=None):
+        '''
+        Runs the whole conversion in memory, optimising images with an ImageOptimiser if given.
+        Returns the amended html, the renamed images are left in IMAGES.
+        '''
+        amended = self.build(optimiser)  # .prettify()
+        with self.stage('serialize'):
+            return str(amended)
+
+    def build(self, optimiser=None):
+        '''
+        Runs the conversion up to the amended tree, which write_html() writes without serializing it whole.
+        Images are renamed and optimised first, so the html is parsed as soon as it's made and then dropped.
+        In low memory mode images are written to disk one at a time as they're read, converted and optimised,
+        and data uri images in html files are dropped before parsing (the Sanitizer would remove them anyway).
+        '''
+        if self.IN_FILE.suffix not in ('.docx', '.html'):
+            raise ValueError(f'not a docx or html file: {self.IN_FILE.name}')
+        if self.LOW_MEMORY:
+            self.make_dir()
+        if self.IN_FILE.suffix == '.docx':
+            self.rename_docx_images()
+            if optimiser:
+                with self.stage('optimise_images'):
+                    self.optimise_images(optimiser)
+        return self.amend_html(self.parse(self.html()))
+
+    def html(self):
+        '''
+        Returns the html to amend, pandoc's conversion of a docx or the text of an html file.
+        '''
+        if self.IN_FILE.suffix == '.docx':
+            return self.convert_docx()
+        content = self.read()
+        if isinstance(content, bytes):
+            # as open() in text mode would
+            content = content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        if self.LOW_MEMORY:
+            content, n = self.DATA_URI.subn(r'\1', content)
+            if n:
+                lgr1.info(f'dropped {n} data uri images')
+        return content
+
+    def optimise_images(self, optimiser):
+        '''
+        Optimises IMAGES with an ImageOptimiser, adding any .webp / .avif siblings. Reused images already are.
+        In low memory mode images are read and optimised one at a time rather than all together on its threads.
+        '''
+        images = {k: v for k, v in self.IMAGES.items() if Path(k).stem not in self.REUSED}
+        if not self.LOW_MEMORY:
+            self.IMAGES.update(optimiser(images))
+            return
+        for name, data in images.items():
+            for k, v in optimiser({name: self.image_bytes(data)}).items():
+                self.keep_image(k, v)
+
+    def parse(self, content):
+        '''
+        Parses html into a tree.
+        '''
+        from bs4 import BeautifulSoup as Soup
+        with self.stage('parse'):
+            return Soup(content, "html.parser")
+
+    @staged
+    def clean_html(self, content):
+        '''
+        Cleans unwanted html tags and limits attributes of allowed tags, returning html.
+        Tags and attributes are stored in json folder under '/json/tags.json'.
+        amend_html does this itself while parsing, this is for when only cleaning is wanted.
+        '''
+        from bs4 import BeautifulSoup as Soup
+        tree = Sanitizer(self.TAGS).clean(Soup(content, "html.parser"))
+        lgr1.debug('cleaned html')
+        return str(tree)
+
+    @staged
+    def amend_html(self, content):
+        '''
+        Parses html content from docx, cleaning it and running replacements to correct headings.
+        Allowed tags and attributes are stored in json folder under '/json/tags.json'.
+        Heading substitutes are stored in json folder under '/json/subs.json'.
+        The rules are in RULES, from '/json/rules.json'. They're registered on a Rewriter, which cleans
+        and applies them all in one walk of the tree.
+        Takes html or a tree from parse(), which is amended in place.
+        '''
+        tree = self.parse(content) if isinstance(content, str) else content
+        # cleans each tag before rules see it, timing each pass and rule when profiling
+        rw = Rewriter(Sanitizer(self.TAGS), stage=self.PROFILER and self.PROFILER.stage)
+        found = self.RULES.bind(self, tree, rw)                     # heading keys matched in the article
+        rw.run(tree)
+        self.log_events(lgr2, 'amend_html')
+        self.MISSING = [self.SUBS[self.AWARD][k] for k in self.HEADINGS.expected[self.AWARD] if k not in found]
+        if self.MISSING:
+            lgr1.warning(f'{self.OUT_FILE.stem} missing headings: {", ".join(self.MISSING)}')
+        return tree
+
+    @staged
+    def write_images(self):
+        '''
+        Writes the renamed images in IMAGES next to the htm, or to the AssetStore.
+        '''
+        self.make_dir()
+        for name, data in self.IMAGES.items():
+            if isinstance(data, Path):
+                continue                                            # already written in low memory mode
+            self.write_image(name, data)
+        if self.IMAGES:
+            lgr1.info(f'wrote images -> {", ".join(self.IMAGES)}')
+
+    @staged
+    def write_html(self, content):
+        '''
+        Outputs cleaned and amended html content to specified file name.
+        Pass in file name and html contents, a list of parts of it, or the tree from build() to serialize it
+        as it's written.
+        '''
+        self.make_dir()
+        f = self.OUT_FILE
+        # written whole or not at all, watch mode and uploaders may be reading the folder
+        with atomic_path(f) as tmp, open(tmp, 'w', encoding='utf-8') as out:
+            if isinstance(content, str):
+                out.write(content)
+            elif isinstance(content, list):
+                out.writelines(content)
+            else:
+                # a top level tag at a time, rather than the whole document as one string
+                for node in content.contents if content.hidden else [content]:
+                    out.write(str(node))
+        lgr1.info(f'wrote file -> {f}')
+
+
+class ConversionCache(object):
+    '''
+    # ConversionCache Class
+    On-disk cache of converted articles so unchanged files are skipped on re-runs.
+    - Arguments:
+        - path: cache directory, one folder per entry holding the .htm, renamed images and a meta.json.
+        - max_size: bytes to keep, least recently used entries are evicted past this.
+    '''
+
+    def __init__(self, path, max_size=500 * 2**20):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(infile, TAGS, SUBS, award, *options):
+        '''
+        SHA-256 of the input file, tags.json and subs.json contents, award and tool version.
+        The file name is included too as the article ID goes into image names, as are any
+        other options that change the output.
+        '''
+        import hashlib
+        h = hashlib.sha256()
+        with open(infile, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                h.update(chunk)
+        h.update(json.dumps([infile.name, TAGS, SUBS, award, __version__, *options], sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+    def fetch(self, key):
+        '''
+        Returns the folder of a cached entry and its meta.json contents, or None on a cache miss.
+        '''
+        entry = self.path / key
+        try:
+            with open(entry / 'meta.json', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(entry)                                             # mark as recently used
+        return entry, meta
+
+    def put(self, key, files, **info):
+        '''
+        Adds files (dict of name in the entry --> path or bytes) to the cache, with any info to keep in meta.json.
+        Written to a temp folder and renamed into place so parallel workers never see half an entry.
+        '''
+        import shutil
+        entry = self.path / key
+        if entry.is_dir():
+            return
+        tmp = self.path / f'.{key}.{os.getpid()}.{threading.get_ident()}'
+        for name, path in files.items():
+            (tmp / name).parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(path, bytes):
+                (tmp / name).write_bytes(path)
+            else:
+                shutil.copyfile(path, tmp / name)
+        tmp.mkdir(exist_ok=True)
+        size = sum(p.stat().st_size for p in tmp.rglob('*') if p.is_file())
+        with open(tmp / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump({'size': size, **info}, f)
+        try:
+            tmp.rename(entry)
+            lgr1.debug(f'cached -> {", ".join(files)} ({key[:12]})')
+        except OSError:                                             # another worker stored it first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def restore(self, key, out_file, media_path):
+        '''
+        Copies a cached .htm, its images and any extra files to the output paths, the extra files next to the .htm.
+        Returns the entry's meta.json contents, or None on a cache miss.
+        '''
+        found = self.fetch(key)
+        if not found:
+            return None
+        entry, meta = found
+        media_path.mkdir(parents=True, exist_ok=True)
+        for name in meta['images']:
+            copy_atomic(entry / 'images' / name, media_path / name)
+        for name in meta.get('extra', []):
+            copy_atomic(entry / 'extra' / name, out_file.parent / name)
+        copy_atomic(entry / 'article.htm', out_file)
+        lgr1.info(f'restored from cache -> {out_file.name} ({len(meta["images"])} images)')
+        return meta
+
+    def store(self, key, out_file, images, extra=None, **info):
+        '''
+        Adds a written .htm and its images (dict of name --> bytes or path) to the cache, with any info to keep in meta.json.
+        extra is a dict of name --> path of other files written next to the .htm, e.g. Document outputs.
+        '''
+        extra = extra or {}
+        files = {'article.htm': out_file, **{f'images/{k}': v for k, v in images.items()},
+                 **{f'extra/{k}': v for k, v in extra.items()}}
+        self.put(key, files, file=out_file.name, images=list(images), extra=list(extra), **info)
+
+    def evict(self):
+        '''
+        Removes least recently used entries until the cache is within max_size.
+        '''
+        import shutil
+        entries = []
+        for entry in self.path.iterdir():
+            try:
+                with open(entry / 'meta.json', encoding='utf-8') as f:
+                    entries.append((entry.stat().st_mtime, json.load(f)['size'], entry))
+            except (OSError, ValueError):
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            lgr1.debug(f'evicted from cache: {entry.name[:12]}')
+
+
+class ImageOptimiser(object):
+    '''
+    # ImageOptimiser Class
+    Optional pass over renamed images to make them web ready, needs Pillow.
+    jpeg and png images wider than max_width are resized, then recompressed, keeping their
+    names so the /fulltext/{AWARD_CODE}/images/ paths in IMGS and <img src> don't change.
+    A recompressed image only replaces the original if it's resized or smaller.
+    - Arguments:
+        - max_width: widest image to keep in pixels, wider ones are scaled down.
+        - quality: jpeg, webp and avif quality 1-95.
+        - webp: also write a .webp of each image next to it, e.g. 131485f01.webp.
+        - avif: also write a .avif of each image next to it.
+        - cache_dir: ConversionCache folder to keep results in by content hash, or None.
+    '''
+    FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG'}
+    SIBLINGS = {'.webp': 'WEBP', '.avif': 'AVIF'}
+    WORKERS = 4
+
+    def __init__(self, max_width=1600, quality=85, webp=False, avif=False, cache_dir=None):
+        self.max_width = max_width
+        self.quality = quality
+        self.siblings = [ext for ext, on in (('.webp', webp), ('.avif', avif)) if on]
+        self.cache = ConversionCache(cache_dir) if cache_dir else None
+
+    def settings(self):
+        '''
+        Options that change the output, for cache keys.
+        '''
+        return {'max_width': self.max_width, 'quality': self.quality, 'siblings': self.siblings}
+
+    def __call__(self, images):
+        '''
+        Optimises a dict of image name --> bytes on a pool of threads, skipping formats it doesn't handle.
+        Returns a dict of name --> bytes of the optimised images and their .webp / .avif siblings.
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        images = {k: v for k, v in images.items() if Path(k).suffix.casefold() in self.FORMATS}
+        if not images:
+            return {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(self.optimise, images.items()))
+        before = sum(map(len, images.values()))
+        after = sum(len(r[name]) for name, r in zip(images, results))
+        lgr1.info(f'optimised: {len(images)} images, {before / 1024:.0f} KB --> {after / 1024:.0f} KB '
+                  f'in {time.perf_counter() - start:.2f}s')
+        return {k: v for r in results for k, v in r.items()}
+
+    def optimise(self, image):
+        '''
+        Resizes and recompresses one (name, bytes) image, making its .webp / .avif too if asked.
+        Returns a dict of name --> bytes of the image and its siblings.
+        '''
+        import io
+        import hashlib
+        from PIL import Image
+        name, data = image
+        names = {'image': name, **{f'image{ext}': str(Path(name).with_suffix(ext)) for ext in self.siblings}}
+        key = hashlib.sha256(data + json.dumps(self.settings(), sort_keys=True).encode('utf-8')).hexdigest()
+        found = self.cache.fetch(key) if self.cache else None
+        if found:
+            entry, meta = found
+            lgr1.debug('optimised from cache: %s', name)
+            return {v: (entry / k).read_bytes() for k, v in names.items()}
+        fmt = self.FORMATS[Path(name).suffix.casefold()]
+        with Image.open(io.BytesIO(data)) as im:
+            resized = im.width > self.max_width
+            if (resized or self.siblings) and im.mode not in ('RGB', 'RGBA', 'L'):
+                # palette images would be resized without smoothing, keep any transparency
+                im = im.convert('RGBA' if im.mode in ('P', 'LA', 'PA') or 'transparency' in im.info else 'RGB')
+            if resized:
+                im = im.resize((self.max_width, round(im.height * self.max_width / im.width)), Image.LANCZOS)
+            out = io.BytesIO()
+            if fmt == 'JPEG':
+                im = im if im.mode in ('RGB', 'L', 'CMYK') else im.convert('RGB')
+                im.save(out, fmt, quality=self.quality, optimize=True, progressive=True)
+            else:
+                im.save(out, fmt, optimize=True)
+            files = {}
+            for ext in self.siblings:
+                sibling = io.BytesIO()
+                im.save(sibling, self.SIBLINGS[ext], quality=self.quality)
+                files[f'image{ext}'] = sibling.getvalue()
+        new = out.getvalue()
+        if not (resized or len(new) < len(data)):
+            new = data
+        files['image'] = new
+        lgr1.debug('optimised: %s %.0f KB --> %.0f KB%s', name, len(data) / 1024, len(new) / 1024,
+                   ' (resized)' if resized else '')
+        if self.cache:
+            self.cache.put(key, files, file=name, bytes=len(new))
+        return {names[k]: v for k, v in files.items()}
@@ -0,0 +1,328 @@
+'''
+convert() for library use, and converting files and folders for the cli.
+'''
+import logging as log
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from pathlib import Path
+from . import __version__
+from .util import atomic_path, load_json, memory_limit
+from .logger import lgr1, log_args, log_article, log_worker
+from .markup import HeadingIndex
+from .rules import Rules
+from .article import Article, ConversionCache, Profiler
+from .bundle import AssetStore, Manifest
+from .document import Document
+
+
+class Config(object):
+    '''
+    # Config Class
+    Settings for convert(), loaded and compiled once then shared by every article.
+    - Arguments:
+        - TAGS: allowed html tags and attributes, loaded from JSON/tags.json if not given.
+        - SUBS: award heading substitutes, loaded from JSON/subs.json if not given.
+        - backend: docx conversion - 'pandoc' subprocess per file or warm 'server'.
+        - fuzzy: similarity 0-1 to also match near miss award headings, 0 for exact only.
+        - optimiser: ImageOptimiser to make images web ready, or None.
+        - rules: Rules for amend_html, loaded from JSON/rules.json if not given.
+    '''
+
+    def __init__(self, TAGS=None, SUBS=None, backend='pandoc', fuzzy=0, optimiser=None, rules=None):
+        self.TAGS = TAGS or load_json('JSON/tags.json')
+        self.SUBS = SUBS or load_json('JSON/subs.json')
+        self.backend = backend
+        self.headings = HeadingIndex(self.SUBS, fuzzy=fuzzy)
+        self.optimiser = optimiser
+        self.rules = rules or Rules.load()
+
+    def award(self, a):
+        '''
+        Returns the SUBS award matching a, e.g. 'warc' --> 'WARC Awards'. Raises ValueError if none does.
+        '''
+        award = find_award(a, self.SUBS)
+        if not award:
+            raise ValueError(f'{a} not a valid award')
+        return award
+
+    def article(self, data, award, name='article', profiler=None):
+        '''
+        Returns an Article for docx bytes or html text in memory, named name for its images.
+        '''
+        return Article(
+            IN_FILE=Path(name).with_suffix('.html' if isinstance(data, str) else '.docx'),
+            TAGS=self.TAGS,
+            SUBS=self.SUBS,
+            AWARD=self.award(award),
+            BACKEND=self.backend,
+            HEADINGS=self.headings,
+            PROFILER=profiler,
+            DATA=data,
+            RULES=self.rules
+        )
+
+
+def find_award(a, SUBS):
+    '''
+    Returns the award section of SUBS json matching a, or None.
+    '''
+    # unpacks keys into list
+    keys = [*SUBS.keys()]
+    # keep only award sections of subs.json
+    keys.remove('All')
+    for k in filter(lambda k: a.casefold() in k.casefold(), keys):  # casefold to match case
+        return k
+    return None
+
+
+def convert(data, award, config=None, name='article', profiler=None):
+    '''
+    Converts one article entirely in memory, nothing is read from or written to disk.
+    - data: docx bytes, or html text as a str.
+    - award: award name or part of one, e.g. 'warc'.
+    - config: Config to share between calls, the default JSON/ settings if not given.
+    - name: article ID, images are named after it e.g. 131485f01.png.
+    Returns the html and a dict of image name --> bytes, the images the html links to under
+    /fulltext/{AWARD_CODE}/images/.
+    '''
+    config = config or Config()
+    Art = config.article(data, award, name, profiler)
+    html = Art.convert(config.optimiser)
+    return html, Art.IMAGES
+
+
+def process(infile, TAGS, SUBS, award, backend='pandoc', cache_dir=None, cache_size=500 * 2**20,
+            headings=None, optimiser=None, profiler=None, low_memory=False, max_memory=None, incremental=False,
+            shared_assets=False, timeout=None, rules=None, log_sample=None, outputs=()):
+    '''
+    Converts one docx or html file to a .htm and renamed images, optimised by an ImageOptimiser
+    if given. Each stage is recorded in profiler if given. Returns the Article.
+    Converts in memory like convert(), then writes the images and htm to the htm/ folder next to infile,
+    serializing the tree as it's written. low_memory sets the Article's LOW_MEMORY mode, and max_memory
+    is a limit in MB for the process while it converts, see memory_limit(). incremental keeps a Manifest
+    next to the .htm to reuse unchanged images and note in the Article's CHANGES what changed since last time.
+    shared_assets writes images to an AssetStore in htm/assets, named by their contents, and records them there.
+    timeout is the Article's TIMEOUT in seconds for each pandoc and magick run. rules are the Article's RULES.
+    log_sample is its LOG_SAMPLE if given. outputs are Document formats, e.g. ['json', 'txt'], to write next to
+    the .htm from the same tree, listed in the Article's OUTPUTS.
+    '''
+    Art = Article(
+        IN_FILE=infile,
+        TAGS=TAGS,
+        SUBS=SUBS,
+        AWARD=award,
+        BACKEND=backend,
+        HEADINGS=headings,
+        PROFILER=profiler,
+        LOW_MEMORY=low_memory,
+        RULES=rules
+    )
+    manifest = Art.MANIFEST = Manifest(Art.OUT_FILE, optimiser and optimiser.settings()) if incremental else None
+    if shared_assets:
+        Art.ASSETS = AssetStore(Art.MEDIA_PATH / AssetStore.FOLDER, optimiser and optimiser.settings())
+    Art.TIMEOUT = timeout
+    if log_sample is not None:
+        Art.LOG_SAMPLE = log_sample
+    cache = ConversionCache(cache_dir, cache_size) if cache_dir else None
+    with memory_limit(max_memory):
+        if cache:
+            with Art.stage('cache_restore'):
+                key = cache.key(infile, TAGS, SUBS, award, Art.HEADINGS.fuzzy, optimiser and optimiser.settings(),
+                                Art.RULES.digest, *([AssetStore.FOLDER] if shared_assets else []),
+                                *([sorted(outputs)] if outputs else []))
+                meta = cache.restore(key, Art.OUT_FILE, Art.IMAGE_PATH)
+            if meta:
+                Art.MISSING = meta.get('missing', [])
+                Art.IMAGES = {name: Art.IMAGE_PATH / name for name in meta['images']}
+                Art.OUTPUTS = {name: Art.MEDIA_PATH / name for name in meta.get('extra', [])}
+                if Art.ASSETS:
+                    Art.ASSETS.record(infile.stem, meta['images'])
+                if manifest and meta.get('manifest'):
+                    manifest.save(meta['manifest'])                 # so the next edit is compared with this one
+                return Art
+        tree = Art.build(optimiser)
+        Art.write_images()
+        if outputs:
+            with Art.stage('outputs'):
+                Art.OUTPUTS = Document(Art, tree).write(Art.MEDIA_PATH, outputs)
+        if manifest:
+            sections = manifest.sections(tree)
+            Art.CHANGES = manifest.compare(sections, Art.image_manifest(), Art.REUSED)
+            lgr1.info(f'changes -> {Art.OUT_FILE.name}: {manifest.describe(Art.CHANGES)}')
+            if manifest.unchanged(Art.OUT_FILE):
+                lgr1.info(f'unchanged, not rewritten -> {Art.OUT_FILE}')
+            else:
+                Art.write_html([html for _, html, _ in sections])
+            del sections
+            manifest.save()
+        else:
+            Art.write_html(tree)
+        if low_memory:
+            tree.decompose()                                        # now, rather than when gc finds the cycles
+        if Art.ASSETS:
+            Art.ASSETS.record(infile.stem, Art.IMAGES)
+        if cache:
+            with Art.stage('cache_store'):
+                cache.store(key, Art.OUT_FILE, Art.IMAGES, extra=Art.OUTPUTS, missing=Art.MISSING,
+                            manifest=manifest and manifest.data)
+    return Art
+
+
+def process_file(infile, TAGS, SUBS, award, profile=False, memory=False, trace=False, **opts):
+    '''
+    Runs process() on one file of a batch, catching errors so one bad file doesn't stop the rest.
+    Returns a result dict with the file name, status, timing and any error, and the .htm and its images
+    (relative to the .htm) for a Bundle. With profile the dict also has the Profiler report of each stage,
+    and with trace its events.
+    '''
+    start = time.perf_counter()
+    missing, changes, Art = [], None, None
+    profiler = Profiler(memory=memory, trace=trace) if profile else None
+    with log_article(infile.stem):
+        try:
+            Art = process(infile, TAGS, SUBS, award, profiler=profiler, **opts)
+            missing, changes = Art.MISSING, Art.CHANGES
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, f'{type(e).__name__}: {str(e).strip()}'
+            lgr1.error(f'failed -> {infile.name}: {error}')
+        seconds = time.perf_counter() - start
+        lgr1.debug('%s took %.2fs', infile.name, seconds)
+    result = {'file': infile.name, 'ok': ok, 'seconds': round(seconds, 3), 'error': error, 'missing': missing}
+    if changes:
+        result['changes'] = changes
+    if ok:
+        result.update(htm=str(Art.OUT_FILE),
+                      images=[(Art.IMAGE_PATH / name).relative_to(Art.MEDIA_PATH).as_posix() for name in Art.IMAGES],
+                      outputs=list(Art.OUTPUTS))
+    if profiler:
+        if trace:
+            profiler.events.insert(0, (infile.name, threading.get_ident(), start, seconds))
+        result.update(stages=profiler.report(), pid=os.getpid(), events=profiler.events)
+    return result
+
+
+def run_batch(files, TAGS, SUBS, award, jobs=1, done=None, **opts):
+    '''
+    Processes a batch of files, spread across a pool of worker processes when jobs > 1 or with a max_memory limit.
+    Each worker builds its own Article. Returns a list of result dicts from process_file().
+    done is called with each result as it finishes, e.g. Bundle.add.
+    '''
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    done = done or (lambda r: None)
+    if jobs <= 1 and not opts.get('max_memory'):                    # a limit only applies in a worker
+        results = []
+        for f in files:
+            results.append(process_file(f, TAGS, SUBS, award, **opts))
+            done(results[-1])
+        return results
+    results = []
+    with ProcessPoolExecutor(max_workers=max(jobs, 1), initializer=log_worker, initargs=log_args()) as pool:
+        futures = {pool.submit(process_file, f, TAGS, SUBS, award, **opts): f for f in files}
+        for fut in as_completed(futures):
+            try:
+                results.append(fut.result())
+            except Exception as e:                                  # worker died e.g. BrokenProcessPool
+                f = futures[fut]
+                log.error(f'worker failed -> {f.name}: {e}')
+                results.append({'file': f.name, 'ok': False, 'seconds': None,
+                                'error': f'{type(e).__name__}: {e}', 'missing': []})
+            done(results[-1])
+    return sorted(results, key=lambda r: r['file'])
+
+
+def log_result(r):
+    '''
+    Logs one result dict from process_file().
+    '''
+    took = 'n/a' if r['seconds'] is None else f"{r['seconds']:.2f}s"
+    if r['ok'] and r['missing']:
+        log.warning(f"  ok     {r['file']} ({took}) missing headings: {', '.join(r['missing'])}")
+    elif r['ok']:
+        log.info(f"  ok     {r['file']} ({took})")
+    else:
+        log.warning(f"  FAILED {r['file']} ({took}) -> {r['error']}")
+    if r.get('changes'):
+        log.info(f"         changes: {Manifest.describe(r['changes'])}")
+
+
+def log_summary(results, seconds, resumed=0):
+    '''
+    Logs a summary of successes, failures and timings per file for a batch, and the number of files
+    --resume skipped as already converted.
+    '''
+    failed = [r for r in results if not r['ok']]
+    for r in results:
+        log_result(r)
+    resumed = f', {resumed} resumed' if resumed else ''
+    log.info(f'{len(results) - len(failed)} succeeded, {len(failed)} failed{resumed} in {seconds:.2f}s')
+
+
+def stage_totals(results):
+    '''
+    Sums each stage across the profiled results of a batch, noting the file where it was slowest.
+    Returns a row per stage, most time first.
+    '''
+    totals = {}
+    for r in results:
+        for row in r.get('stages', []):
+            t = totals.setdefault(row['stage'], {'stage': row['stage'], 'files': 0, 'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                                 'rss_kb': None, 'peak_kb': None, 'slowest': None, 'slowest_wall': 0.0})
+            t['files'] += 1
+            t['calls'] += row['calls']
+            t['wall'] += row['wall']
+            t['cpu'] += row['cpu']
+            for k in ('rss_kb', 'peak_kb'):
+                if row[k] is not None:
+                    t[k] = max(t[k] or 0, row[k])
+            if row['wall'] >= t['slowest_wall']:
+                t['slowest'], t['slowest_wall'] = r['file'], row['wall']
+    for t in totals.values():
+        t['wall'], t['cpu'] = round(t['wall'], 6), round(t['cpu'], 6)
+    return sorted(totals.values(), key=lambda t: -t['wall'])
+
+
+def write_report(results, path):
+    '''
+    Writes the stages of each profiled result to a .json report with totals per stage, or to a .csv
+    with a row per file and stage. Logs the totals.
+    '''
+    path = Path(path)
+    totals = stage_totals(results)
+    with atomic_path(path) as tmp, open(tmp, 'w', encoding='utf-8', newline='') as f:
+        if path.suffix.casefold() == '.csv':
+            import csv
+            fields = ['file', 'ok', 'seconds', 'stage', 'calls', 'wall', 'cpu', 'rss_kb', 'peak_kb']
+            writer = csv.DictWriter(f, fields, extrasaction='ignore')
+            writer.writeheader()
+            for r in results:
+                for row in r.get('stages', []):
+                    writer.writerow({**r, **row})
+        else:
+            files = [{k: v for k, v in r.items() if k not in ('events', 'pid')} for r in results]
+            json.dump({'version': __version__, 'created': datetime.now().isoformat(timespec='seconds'),
+                       'stages': totals, 'files': files}, f, indent=2)
+    for t in totals:
+        peak = '' if t['peak_kb'] is None else f" {t['peak_kb'] / 1024:7.1f} MB peak"
+        log.info(f"  {t['stage']:<40} {t['wall']:8.2f}s wall {t['cpu']:8.2f}s cpu{peak}, "
+                 f"slowest {t['slowest']} ({t['slowest_wall']:.2f}s)")
+    log.info(f'wrote profile -> {path}')
+
+
+def write_trace(results, path):
+    '''
+    Writes the stage events of traced results as a Chrome trace, for chrome://tracing or ui.perfetto.dev.
+    Each worker process is a row with its threads under it, and each file is an event around its stages.
+    '''
+    events = [(r['file'], r['pid'], *e) for r in results for e in r.get('events', [])]
+    first = min((start for *_, start, _ in events), default=0)
+    trace = [{'name': name.rsplit('/', 1)[-1], 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': tid,
+              'ts': round((start - first) * 1e6, 1), 'dur': round(seconds * 1e6, 1),
+              'args': {'file': file, 'stage': name}}
+             for file, pid, name, tid, start, seconds in events]
+    with atomic_path(Path(path)) as tmp, open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+    log.info(f'wrote trace -> {path}')
@@ -0,0 +1,364 @@
+'''
+The manifest, shared asset store and archive a run's output is collected in.
+'''
+import logging as log
+import re
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from . import __version__
+from .util import atomic_path
+
+
+class AssetStore(object):
+    '''
+    # AssetStore Class
+    Content-addressed folder of images shared by a batch of articles, so a logo or badge used by many of them
+    is stored and uploaded once. Images are named by a hash of their contents in the docx (and the
+    ImageOptimiser settings), so the same image always gets the same name whichever article it's in.
+    manifest.json lists the articles using each image, rebuilt by index() from a record per article.
+    - Arguments:
+        - path: the store folder, htm/assets next to the articles.
+        - settings: options that change the images written, e.g. ImageOptimiser.settings().
+    '''
+    FOLDER = 'assets'
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, path, settings=None):
+        self.path = Path(path)
+        self.settings = json.dumps(settings or {}, sort_keys=True).encode('utf-8')
+        self.refs = self.path / '.articles'                         # article ID --> the images it uses
+        self.refs.mkdir(parents=True, exist_ok=True)
+
+    def name(self, data, suffix):
+        '''
+        Returns the store name of an image's bytes from the docx, e.g. '3f2a9c0d1b7e4a65.png'.
+        '''
+        import hashlib
+        return f'{hashlib.sha256(data + self.settings).hexdigest()[:16]}{suffix.lower()}'
+
+    def record(self, article, names):
+        '''
+        Notes the images an article uses, replacing what it used last time.
+        '''
+        with atomic_path(self.refs / f'{article}.json') as tmp, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(sorted(names), f)
+
+    def index(self):
+        '''
+        Writes manifest.json, image name --> size and the articles using it, from every article's record.
+        Called from the main process once conversions finish, as workers record in parallel.
+        Returns the manifest's images.
+        '''
+        used = {}
+        for ref in sorted(self.refs.glob('*.json')):
+            try:
+                with open(ref, encoding='utf-8') as f:
+                    names = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name in names:
+                used.setdefault(name, []).append(ref.stem)
+        images = {}
+        for name, articles in sorted(used.items()):
+            path = self.path / name
+            images[name] = {'bytes': path.stat().st_size if path.is_file() else None, 'articles': articles}
+        with atomic_path(self.path / self.MANIFEST) as tmp, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'images': images}, f, indent=1)
+        shared = {k: v for k, v in images.items() if len(v['articles']) > 1}
+        saved = sum((len(v['articles']) - 1) * (v['bytes'] or 0) for v in shared.values())
+        log.info(f'assets: {len(images)} images in {self.path}, {len(shared)} shared between articles, '
+                 f'{saved / 2**20:.1f} MB of copies saved')
+        return images
+
+
+class Manifest(object):
+    '''
+    # Manifest Class
+    Hashes of each section and image of an article's last conversion, kept next to its .htm, so re-converting
+    an edited docx reuses the images that haven't changed, leaves an unchanged .htm alone and reports which
+    sections changed for reviewers. Sections are split on the h3 headings amend_headers_replace makes.
+    - Arguments:
+        - out_file: the article's .htm, the manifest is a hidden .json next to it.
+        - settings: options that change the images, e.g. ImageOptimiser.settings(). Images are only reused
+          from a conversion with the same settings.
+    '''
+    VERSION = 1
+    START = '(start)'                                               # the section before the first h3
+
+    def __init__(self, out_file, settings=None):
+        self.path = out_file.with_name(f'.{out_file.stem}.manifest.json')
+        # through json so tuples compare equal to the lists read back
+        self.settings = json.loads(json.dumps({'version': __version__, **(settings or {})}))
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.old = json.load(f)
+        except (OSError, ValueError):
+            self.old = {}
+        if self.old.get('manifest') != self.VERSION:
+            self.old = {}
+        self.images = self.old.get('images', {}) if self.old.get('settings') == self.settings else {}
+        self.data = None
+
+    @staticmethod
+    def digest(data):
+        '''
+        Returns the sha256 of bytes or text.
+        '''
+        import hashlib
+        return hashlib.sha256(data.encode('utf-8') if isinstance(data, str) else data).hexdigest()
+
+    def reuse(self, stem, source, folder):
+        '''
+        Returns name --> path of the files made from an image last time, if its hash in the docx (source) is the same
+        and they're still in folder as they were written. Otherwise None.
+        '''
+        entry = self.images.get(stem)
+        if not entry or entry['source'] != source:
+            return None
+        files = {name: folder / name for name in entry['files']}
+        for name, path in files.items():
+            try:
+                if self.digest(path.read_bytes()) != entry['files'][name]:
+                    return None
+            except OSError:
+                return None
+        return files
+
+    @classmethod
+    def sections(cls, tree):
+        '''
+        Splits an amended tree into sections at each top level h3, serializing them as it goes.
+        Returns a list of (heading, html, words), the html of all of them is the whole .htm.
+        '''
+        sections = []
+        heading, parts, words = cls.START, [], 0
+        for node in tree.contents:
+            if node.name == 'h3':
+                if parts:
+                    sections.append((heading, ''.join(parts), words))
+                heading, parts, words = node.get_text(strip=True), [], 0
+            parts.append(str(node))
+            words += len(node.get_text().split())
+        if parts:
+            sections.append((heading, ''.join(parts), words))
+        return sections
+
+    @staticmethod
+    def keyed(sections):
+        '''
+        Returns heading --> (hash, words) of manifest sections, numbering repeated headings.
+        '''
+        keyed = {}
+        for heading, digest, words in sections:
+            key, n = heading, 1
+            while key in keyed:
+                n += 1
+                key = f'{heading} ({n})'
+            keyed[key] = (digest, words)
+        return keyed
+
+    def compare(self, sections, images, reused=()):
+        '''
+        Compares sections from sections() and images (stem --> entry, as Article.image_manifest()) with the
+        last conversion, and keeps them to save(). Returns a summary of what changed, None the first time.
+        '''
+        html = ''.join(h for _, h, _ in sections)
+        self.data = {
+            'manifest': self.VERSION,
+            'settings': self.settings,
+            'html': self.digest(html),
+            'sections': [[heading, self.digest(h), words] for heading, h, words in sections],
+            'images': images,
+        }
+        if not self.old:
+            return None
+        old, new = self.keyed(self.old['sections']), self.keyed(self.data['sections'])
+        before = {k: v['source'] for k, v in self.old['images'].items()}
+        after = {k: v['source'] for k, v in images.items()}
+        return {
+            'sections': {
+                'changed': [f'{k} ({old[k][1]} -> {new[k][1]} words)' for k in new if k in old and old[k] != new[k]],
+                'added': [k for k in new if k not in old],
+                'removed': [k for k in old if k not in new],
+                'unchanged': sum(1 for k in new if old.get(k) == new[k]),
+            },
+            'images': {
+                'changed': [k for k in after if k in before and before[k] != after[k]],
+                'added': [k for k in after if k not in before],
+                'removed': [k for k in before if k not in after],
+                'reused': len(reused),
+            },
+        }
+
+    def unchanged(self, out_file):
+        '''
+        True if out_file is already the .htm compared last, as it was written.
+        '''
+        digest = self.data['html']
+        if self.old.get('html') != digest:
+            return False
+        try:
+            return self.digest(out_file.read_bytes()) == digest
+        except OSError:
+            return False
+
+    def save(self, data=None):
+        '''
+        Writes the manifest kept by compare(), or data from a cache entry, for the next run.
+        '''
+        with atomic_path(self.path) as tmp, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data or self.data, f, indent=1)
+
+    @staticmethod
+    def describe(changes):
+        '''
+        Returns a one line summary of the dict from compare(), for the logs.
+        '''
+        if not changes:
+            return 'first conversion'
+        out = []
+        sections, images = changes['sections'], changes['images']
+        for kind in ('changed', 'added', 'removed'):
+            if sections[kind]:
+                out.append(f'sections {kind}: {", ".join(sections[kind])}')
+        if not out:
+            out.append('no sections changed')
+        else:
+            out.append(f'{sections["unchanged"]} unchanged')
+        for kind in ('changed', 'added', 'removed'):
+            if images[kind]:
+                out.append(f'images {kind}: {", ".join(images[kind])}')
+        if images['reused']:
+            out.append(f'{images["reused"]} images reused')
+        return '; '.join(out)
+
+
+IMAGE_STORED = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif')  # already compressed, stored as is in zips
+
+
+class Bundle(object):
+    '''
+    # Bundle Class
+    One zip or tar of a batch's converted articles for a single bulk CMS import, added to as each article
+    finishes rather than collected at the end. Laid out as the html links to them: articles/<ID>.htm (and any
+    Document outputs, e.g. articles/<ID>.json) and
+    images/<name> (images/assets/<name> with --shared-assets, added once however many articles use them).
+    manifest.json goes in last, listing each article's ID, award code, h3 sections and files with their
+    sizes and sha256, and the files that failed.
+    - Arguments:
+        - path: the .zip, .tar, .tar.gz or .tgz to write, only put in place once it's complete.
+        - code: award code of the batch, e.g. 'WARC-AWARDS'.
+    '''
+    H3 = re.compile(r'<h3[^>]*>(.*?)</h3>', re.S)
+
+    def __init__(self, path, code):
+        self.path = Path(path)
+        self.code = code
+        self.articles = []
+        self.failed = []
+        self.added = set()
+        self.archive = None
+
+    def __enter__(self):
+        import tarfile
+        import zipfile
+        name = self.path.name.lower()
+        if not name.endswith(('.zip', '.tar', '.tar.gz', '.tgz')):
+            raise ValueError(f'bundle must be a .zip, .tar, .tar.gz or .tgz: {self.path.name}')
+        self.atomic = atomic_path(self.path)
+        tmp = self.atomic.__enter__()
+        if name.endswith('.zip'):
+            self.archive = zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(tmp, 'w' if name.endswith('.tar') else 'w:gz')
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if not exc[0]:
+                self.write('manifest.json', json.dumps({
+                    'award': self.code,
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'articles': self.articles,
+                    'failed': self.failed,
+                }, indent=1).encode('utf-8'))
+            self.archive.close()
+        finally:
+            self.atomic.__exit__(*exc)
+        if not exc[0]:
+            images = sum(1 for a in self.added if a.startswith('images/'))
+            log.info(f'bundled {len(self.articles)} articles and {images} images -> {self.path}')
+
+    def write(self, arcname, data=None, path=None):
+        '''
+        Adds bytes, or the file at path, to the archive under arcname.
+        '''
+        import io
+        import tarfile
+        import zipfile
+        if isinstance(self.archive, zipfile.ZipFile):
+            stored = Path(arcname).suffix.casefold() in IMAGE_STORED
+            compress = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            if path:
+                self.archive.write(path, arcname, compress_type=compress)
+            else:
+                self.archive.writestr(arcname, data, compress_type=compress)
+        elif path:
+            self.archive.add(path, arcname)
+        else:
+            info = tarfile.TarInfo(arcname)
+            info.size, info.mtime = len(data), time.time()
+            self.archive.addfile(info, io.BytesIO(data))
+        self.added.add(arcname)
+
+    @staticmethod
+    def checksum(path):
+        '''
+        Returns the size and sha256 of a file, read a block at a time.
+        '''
+        import hashlib
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                h.update(block)
+        return path.stat().st_size, h.hexdigest()
+
+    def add(self, result):
+        '''
+        Adds a converted article from a process_file() result, with its images, or notes that it failed.
+        '''
+        import html
+        if not result['ok']:
+            self.failed.append({'file': result['file'], 'error': result['error']})
+            return
+        htm = Path(result['htm'])
+        size, digest = self.checksum(htm)
+        text = htm.read_text(encoding='utf-8')
+        sections = [' '.join(html.unescape(re.sub(r'<[^>]+>', '', h)).split()) for h in self.H3.findall(text)]
+        del text
+        entry = {
+            'id': htm.stem,
+            'file': result['file'],
+            'award': self.code,
+            'html': {'path': f'articles/{htm.name}', 'bytes': size, 'sha256': digest},
+            'sections': sections,
+            'missing': result['missing'],
+            'images': [],
+            'outputs': [],
+        }
+        self.write(entry['html']['path'], path=htm)
+        for name in result.get('outputs', []):                      # Document json, txt, words next to the htm
+            path = htm.parent / name
+            size, digest = self.checksum(path)
+            entry['outputs'].append({'path': f'articles/{name}', 'bytes': size, 'sha256': digest})
+            self.write(f'articles/{name}', path=path)
+        for name in result['images']:
+            path = htm.parent / name
+            arcname = f'images/{name}'
+            size, digest = self.checksum(path)
+            entry['images'].append({'path': arcname, 'bytes': size, 'sha256': digest})
+            if arcname not in self.added:                           # shared assets go in once
+                self.write(arcname, path=path)
+        self.articles.append(entry)
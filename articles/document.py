@@ -0,0 +1,150 @@
+'''
+The structured model of an amended article written by --outputs.
+'''
+import json
+from pathlib import Path
+from .util import atomic_path
+from .logger import lgr1
+from .bundle import Manifest
+
+
+class Document(object):
+    '''
+    # Document Class
+    Structured model of an amended article for search indexers and summarizers, built from the same tree
+    as the .htm in one pass over its top level, so nothing downstream has to parse the html again.
+    Sections are split on the h3 award headings as in Manifest, each with its paragraphs, subheadings and list
+    items as text, the images it links to and its word count. The endnotes under the heading the footnotes
+    rule adds become the sources.
+    - Arguments:
+        - Art: the Article, for its ID, award, ENDNOTES and missing headings.
+        - tree: the amended tree from build().
+    '''
+    VERSION = 1
+    FORMATS = {'json': '.json', 'txt': '.txt', 'words': '.words.csv'}  # --outputs --> suffix
+    HEADINGS = frozenset(['h1', 'h2', 'h4', 'h5', 'h6'])             # subheadings, h3 starts a section
+
+    def __init__(self, Art, tree):
+        self.stem = Art.OUT_FILE.stem
+        sections, sources = [], []
+        section = self.section(Manifest.START)
+        for node in tree.contents:
+            if node.name == 'h3':
+                sections.append(section)
+                section = None if node is Art.ENDNOTES else self.section(self.text(node))
+            if section is None:                                     # in the endnotes
+                sources.extend(self.text(li) for li in self.items(node))
+                continue
+            strings, imgs = self.scan(node)
+            words = ''.join(strings).split()
+            section['words'] += len(words)                          # as Manifest counts them, heading included
+            if node.name == 'h3':
+                continue
+            for img in imgs:
+                if img.get('src'):
+                    section['images'].append({'src': img['src'], 'alt': img.get('alt', '')})
+            if node.name in ('ul', 'ol'):
+                section['paragraphs'].extend({'type': 'item', 'text': self.text(li)} for li in self.items(node))
+            elif words:
+                kind = 'subheading' if node.name in self.HEADINGS else 'paragraph'
+                section['paragraphs'].append({'type': kind, 'text': ' '.join(words)})
+        sections.append(section)
+        # the text before the first heading is only a section if there is some
+        sections = [s for s in sections if s and (s['heading'] != Manifest.START or s['paragraphs'] or s['images'])]
+        self.data = {
+            'version': self.VERSION,
+            'id': self.stem,
+            'award': Art.AWARD,
+            'code': Art.AWARD_CODE,
+            'words': sum(s['words'] for s in sections),
+            'missing': Art.MISSING,
+            'sections': sections,
+            'sources': sources,
+        }
+
+    @staticmethod
+    def section(heading):
+        return {'heading': heading, 'words': 0, 'paragraphs': [], 'images': []}
+
+    @staticmethod
+    def scan(node):
+        '''
+        Returns the strings and img tags in a top level node, in one pass rather than get_text() and find_all().
+        '''
+        if node.name is None:
+            return [node], []
+        if node.name == 'img':
+            return [], [node]
+        strings, imgs = [], []
+        for d in node.descendants:
+            if d.name is None:
+                strings.append(d)
+            elif d.name == 'img':
+                imgs.append(d)
+        return strings, imgs
+
+    @staticmethod
+    def text(node):
+        '''
+        A tag's or string's text with its whitespace collapsed.
+        '''
+        return ' '.join((node if node.name is None else node.get_text()).split())
+
+    @staticmethod
+    def items(node):
+        '''
+        The items of a list, or nothing if node isn't one. Nested lists stay in their item's text.
+        '''
+        return node.find_all('li', recursive=False) if node.name in ('ul', 'ol') else []
+
+    def json(self):
+        return json.dumps(self.data, ensure_ascii=False, indent=1)
+
+    def text_lines(self):
+        '''
+        Yields the article as plain text a line at a time, a blank line between blocks, without the images.
+        '''
+        for s in self.data['sections']:
+            if s['heading'] != Manifest.START:
+                yield s['heading']
+                yield ''
+            paragraphs = s['paragraphs']
+            for i, p in enumerate(paragraphs):
+                if p['type'] == 'item':
+                    yield f"- {p['text']}"
+                    if i + 1 < len(paragraphs) and paragraphs[i + 1]['type'] == 'item':
+                        continue                                    # a list's items go together
+                else:
+                    yield p['text']
+                yield ''
+        if self.data['sources']:
+            yield 'Sources'
+            yield ''
+            for n, source in enumerate(self.data['sources'], 1):
+                yield f'{n}. {source}'
+
+    def txt(self):
+        return '\n'.join(self.text_lines()).rstrip('\n') + '\n'
+
+    def words(self):
+        import csv
+        import io
+        out = io.StringIO()
+        w = csv.writer(out, lineterminator='\n')
+        w.writerow(['section', 'words'])
+        w.writerows((s['heading'], s['words']) for s in self.data['sections'])
+        w.writerow(['(total)', self.data['words']])
+        return out.getvalue()
+
+    def write(self, folder, formats):
+        '''
+        Writes each of formats, e.g. ['json', 'txt'], as <ID><suffix> in folder. Returns name --> path.
+        '''
+        files = {}
+        for fmt in formats:
+            path = Path(folder) / f'{self.stem}{self.FORMATS[fmt]}'
+            with atomic_path(path) as tmp, open(tmp, 'w', encoding='utf-8', newline='') as f:
+                f.write(getattr(self, fmt)())
+            files[path.name] = path
+        lgr1.info(f'wrote {", ".join(formats)} -> {", ".join(files)}')
+        return files
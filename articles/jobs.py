@@ -0,0 +1,136 @@
+'''
+The record of a directory run that --resume and --retries use.
+'''
+import logging as log
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from .bundle import Bundle
+from .batch import run_batch
+
+
+class JobQueue(object):
+    '''
+    # JobQueue Class
+    SQLite record of a directory run, a row per input file with its status, content hash, attempts,
+    last error and output paths, so a run that crashed or was stopped can carry on with --resume.
+    Only the main process writes to it, workers report back through run_batch() as they finish.
+    Only kept for runs with --resume or --retries, in the cache folder rather than the input folder,
+    which may be read only.
+    - Arguments:
+        - path: the database, see file().
+    '''
+    PERMANENT = ('BadZipFile', 'ValueError', 'KeyError', 'MemoryError')  # errors a retry won't fix
+
+    def __init__(self, path):
+        import sqlite3
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path))
+        self.db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            file TEXT PRIMARY KEY, hash TEXT, status TEXT, attempts INTEGER DEFAULT 0, error TEXT,
+            htm TEXT, images TEXT, missing TEXT, seconds REAL, updated TEXT)''')
+        self.db.commit()
+        self.resumed = []                                           # results of files plan() skipped
+
+    @staticmethod
+    def file(cache_dir, folder):
+        '''
+        Returns the database for an input folder, jobs/<hash of its path>.sqlite in cache_dir.
+        '''
+        import hashlib
+        name = hashlib.sha256(str(Path(folder).resolve()).encode('utf-8')).hexdigest()[:16]
+        return Path(cache_dir) / 'jobs' / f'{name}.sqlite'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.db.close()
+
+    def update(self, sql, *args):
+        with self.db:                                               # a transaction each, so a crash loses nothing
+            self.db.execute(sql, (*args, datetime.now().isoformat(timespec='seconds')))
+
+    def plan(self, files, resume=False):
+        '''
+        Queues files, returning the ones to convert. With resume, files converted by an earlier run are
+        skipped if their contents haven't changed and their .htm is still there.
+        '''
+        todo = []
+        for f in files:
+            digest = Bundle.checksum(f)[1]
+            row = self.db.execute('SELECT hash, status, htm, images, missing, seconds FROM jobs WHERE file = ?',
+                                  (f.name,)).fetchone()
+            if resume and row and row[:2] == (digest, 'done') and row[2] and Path(row[2]).is_file():
+                self.resumed.append({'file': f.name, 'ok': True, 'seconds': row[5], 'error': None, 'htm': row[2],
+                                     'images': json.loads(row[3]), 'missing': json.loads(row[4])})
+                continue
+            attempts = 'attempts' if resume and row and row[0] == digest else '0'
+            self.update(f'''INSERT INTO jobs (file, hash, status, updated) VALUES (?1, ?2, 'queued', ?3)
+                ON CONFLICT(file) DO UPDATE SET hash = ?2, status = 'queued', attempts = {attempts}, error = NULL,
+                updated = ?3''', f.name, digest)
+            todo.append(f)
+        if resume:
+            log.info(f'resuming: {len(files) - len(todo)} files already converted, {len(todo)} to do')
+        return todo
+
+    def start(self, files):
+        '''
+        Marks files as running, counting an attempt.
+        '''
+        for f in files:
+            self.update("UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ?2 WHERE file = ?1",
+                        f.name)
+
+    def finish(self, result):
+        '''
+        Records a result dict from process_file().
+        '''
+        self.update('''UPDATE jobs SET status = ?2, error = ?3, htm = ?4, images = ?5, missing = ?6, seconds = ?7,
+            updated = ?8 WHERE file = ?1''', result['file'], 'done' if result['ok'] else 'failed', result['error'],
+                    result.get('htm'), json.dumps(result.get('images', [])), json.dumps(result['missing']),
+                    result['seconds'])
+
+    @classmethod
+    def retryable(cls, result):
+        '''
+        True if a failed result might pass another time, e.g. a timeout, a crashed worker or a pandoc error.
+        '''
+        return not result['ok'] and not (result['error'] or '').startswith(cls.PERMANENT)
+
+    def counts(self):
+        '''
+        Returns status --> number of files.
+        '''
+        return dict(self.db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+
+def run_jobs(files, TAGS, SUBS, award, queue, jobs=1, retries=2, backoff=5.0, done=None, **opts):
+    '''
+    Runs run_batch() over files queued in a JobQueue, recording each attempt and result there.
+    Files that failed for a reason a retry might fix are tried again up to retries times, waiting
+    backoff seconds before the first retry and twice as long before each one after.
+    done is only called with a file's last result. Returns the last results.
+    '''
+    done = done or (lambda r: None)
+    final, attempt = [], 0
+    while files:
+        attempt += 1
+        queue.start(files)
+        again = set()
+
+        def finished(r):
+            queue.finish(r)
+            if attempt <= retries and queue.retryable(r):
+                again.add(r['file'])
+            else:
+                final.append(r)
+                done(r)
+        run_batch(files, TAGS, SUBS, award, jobs=jobs, done=finished, **opts)
+        files = [f for f in files if f.name in again]
+        if files:
+            wait = backoff * 2 ** (attempt - 1)
+            log.warning(f'retrying {len(files)} failed files in {wait:g}s, attempt {attempt + 1} of {retries + 1}')
+            time.sleep(wait)
+    return sorted(final, key=lambda r: r['file'])
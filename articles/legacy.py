@@ -0,0 +1,208 @@
+'''
+Re-cleaning already converted html trees and archives, for --legacy-html.
+'''
+import logging as log
+import os
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from . import __version__
+from .util import atomic_path
+from .logger import lgr1, log_args, log_article, log_worker
+from .bundle import Bundle, Manifest
+
+
+class LegacyState(object):
+    '''
+    # LegacyState Class
+    Record of the legacy html files run_legacy() has already re-cleaned into an output folder, so a rerun only
+    redoes the ones added or changed since, or all of them once tags.json, subs.json, the rules or the award
+    change. Each file is known by its path, size and mtime, as it's kept for a tar member too.
+    - Arguments:
+        - out: the output folder, the record is .convert_articles-legacy.json in it.
+        - settings: everything else the output depends on, kept as a hash.
+    '''
+    FILE = '.convert_articles-legacy.json'
+    SAVE = 500                                                      # files between saves, so a crash loses little
+
+    def __init__(self, out, settings):
+        self.path = Path(out) / self.FILE
+        self.settings = Manifest.digest(json.dumps(settings, sort_keys=True))
+        try:
+            old = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            old = {}
+        self.files = old.get('files', {}) if old.get('settings') == self.settings else {}
+        self.changed = 0
+
+    def fresh(self, name, stamp):
+        '''
+        True if name's output was made from this same file and is still there.
+        '''
+        return self.files.get(name) == stamp and (self.path.parent / name).is_file()
+
+    def done(self, name, stamp=None):
+        '''
+        Records name as re-cleaned from the file with stamp, or forgets it if it failed.
+        '''
+        if stamp:
+            self.files[name] = stamp
+        else:
+            self.files.pop(name, None)
+        self.changed += 1
+        if self.changed % self.SAVE == 0:
+            self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_path(self.path) as tmp:
+            Path(tmp).write_text(json.dumps({'settings': self.settings, 'files': self.files}), encoding='utf-8')
+
+
+_legacy_config = None
+
+LEGACY = ('.html', '.htm')
+
+
+def legacy_init(config, *logging):
+    '''
+    Starts a run_legacy() worker, keeping its Config for every file.
+    '''
+    global _legacy_config
+    log_worker(*logging)
+    _legacy_config = config
+
+
+def legacy_convert(name, source, award):
+    '''
+    Re-cleans one legacy html file with amend_html, in a worker of run_legacy(). source is its bytes, or
+    its Path to be read here. Files that aren't utf-8 are read as cp1252, as older CMS exports often are.
+    Returns a result dict like process_file()'s, with the amended html.
+    '''
+    start = time.perf_counter()
+    stem = Path(name).stem
+    result = {'file': name, 'ok': False, 'seconds': None, 'error': None, 'missing': []}
+    with log_article(stem):
+        try:
+            data = source.read_bytes() if isinstance(source, Path) else source
+            try:
+                text = data.decode('utf-8')
+            except UnicodeDecodeError:
+                text = data.decode('cp1252', errors='replace')
+                lgr1.warning(f'{name} is not utf-8, read as cp1252')
+            Art = _legacy_config.article(text.replace('\r\n', '\n').replace('\r', '\n'), award, stem)
+            result.update(ok=True, html=Art.convert(), missing=Art.MISSING)
+        except Exception as e:
+            result['error'] = f'{type(e).__name__}: {str(e).strip()}'
+            lgr1.error(f'{name} failed -> {result["error"]}')
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def legacy_sources(path, fresh=None):
+    '''
+    Yields (name, stamp, source) for each .html or .htm in a folder tree or tar archive, name being its
+    relative path with / separators and stamp its [size, mtime]. source is a Path for a folder, or the
+    bytes of a tar member, as the tar is read as a stream rather than unpacked. If fresh(name, stamp) is
+    true the file is up to date and source is None, not read at all.
+    '''
+    import posixpath
+    import tarfile
+    fresh = fresh or (lambda name, stamp: False)
+    if path.is_dir():
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for f in sorted(files):
+                p = Path(root) / f
+                if p.suffix.lower() in LEGACY:
+                    name, st = p.relative_to(path).as_posix(), p.stat()
+                    stamp = [st.st_size, st.st_mtime_ns]
+                    yield name, stamp, None if fresh(name, stamp) else p
+        return
+    with tarfile.open(path, 'r|*') as tar:
+        for m in tar:
+            if not m.isfile() or Path(m.name).suffix.lower() not in LEGACY:
+                continue
+            name = posixpath.normpath(m.name)
+            if name.startswith(('/', '../')) or name == '..':
+                log.warning(f'skipped unsafe path in {path.name}: {m.name}')
+                continue
+            stamp = [m.size, m.mtime]
+            yield name, stamp, None if fresh(name, stamp) else tar.extractfile(m).read()
+
+
+def run_legacy(path, out, config, award, jobs=1):
+    '''
+    Re-cleans a bulk of legacy html articles, every .html and .htm in a folder tree or tar archive at path,
+    with amend_html on a pool of worker processes when jobs > 1. Results are written to the same relative
+    paths in out, a folder or a .zip, .tar, .tar.gz or .tgz archive (with a Bundle manifest.json).
+    Files are fed to the workers a few at a time as they're read, so a tar is never unpacked or held whole.
+    With a folder, files whose output is up to date are skipped, see LegacyState; an archive is made whole.
+    Returns a list of result dicts like process_file()'s and the number of files skipped.
+    '''
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    out = Path(out)
+    award = config.award(award)
+    archive = out.name.lower().endswith(('.zip', '.tar', '.tar.gz', '.tgz'))
+    state = None if archive else LegacyState(out, [__version__, config.TAGS, config.SUBS, award,
+                                                   config.rules.digest, config.headings.fuzzy])
+    results, stamps, skipped = [], {}, 0
+
+    def finished(r, bundle):
+        html = r.pop('html', None)
+        if html is not None:
+            data = html.encode('utf-8')
+            if bundle:
+                bundle.write(r['file'], data)
+                bundle.articles.append({'file': r['file'], 'missing': r['missing'], 'html': {
+                    'path': r['file'], 'bytes': len(data), 'sha256': Manifest.digest(data)}})
+            else:
+                dest = out / r['file']
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                with atomic_path(dest) as tmp:
+                    Path(tmp).write_bytes(data)
+        elif bundle:
+            bundle.failed.append({'file': r['file'], 'error': r['error']})
+        stamp = stamps.pop(r['file'], None)
+        if state:
+            state.done(r['file'], stamp if r['ok'] else None)
+        results.append(r)
+
+    with Bundle(out, config.SUBS[award]['code']) if archive else nullcontext() as bundle:
+        sources = legacy_sources(path, state.fresh if state else None)
+        if jobs <= 1:
+            legacy_init(config)
+            for name, stamp, source in sources:
+                if source is None:
+                    skipped += 1
+                    continue
+                stamps[name] = stamp
+                finished(legacy_convert(name, source, award), bundle)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=legacy_init,
+                                     initargs=(config, *log_args())) as pool:
+                pending = {}
+
+                def collect(futures):
+                    for fut in futures:
+                        name = pending.pop(fut)
+                        try:
+                            r = fut.result()
+                        except Exception as e:                      # worker died e.g. BrokenProcessPool
+                            log.error(f'worker failed -> {name}: {e}')
+                            r = {'file': name, 'ok': False, 'seconds': None,
+                                 'error': f'{type(e).__name__}: {e}', 'missing': []}
+                        finished(r, bundle)
+                for name, stamp, source in sources:
+                    if source is None:
+                        skipped += 1
+                        continue
+                    stamps[name] = stamp
+                    pending[pool.submit(legacy_convert, name, source, award)] = name
+                    if len(pending) >= jobs * 4:                    # enough queued to keep every worker busy
+                        collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                collect(wait(pending).done)
+    if state:
+        state.save()
+    return sorted(results, key=lambda r: r['file']), skipped
@@ -0,0 +1,204 @@
+'''
+Logging for the main process and its workers, set up by log_setup().
+'''
+import logging as log
+import json
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+
+def log_setup(
+    first_log,      # name of logger for section of project e.g. 'Article class'
+    second_log,     # second logger section e.g. 'amend_html'
+    level='DEBUG',  # lowest level written to the log file
+    fmt='text',     # 'text' or 'json' lines in the log file
+    per_article=False  # also write each article's records to its own file
+):
+    '''
+    Makes log directory and sets logger file.
+    Uses 'log' for main app, lgr1 for Article Class.
+    Only called from main(), so importing this module doesn't create log files.
+    Records from this and worker processes go through a queue to a QueueListener thread that does
+    all the formatting and writing, so logging never waits on the disk. See log_worker().
+    '''
+    import atexit
+    import multiprocessing
+    from logging.handlers import QueueListener
+    global _log_queue, _log_level
+    fd = 'logs'                                                     # folder name
+    # log directory
+    ld = Path(__file__).parent.parent / fd
+    # ensure exists
+    ld.mkdir(exist_ok=True)
+    fn = 'convert_articles.log'                                     # app filename
+    # path for log file
+    lp = str(ld / f'%d_%m_%Y - (%H-%M-%S) - {fn}')
+    # log name formatted
+    nm = datetime.now().strftime(lp)
+    level = log.getLevelName(level) if isinstance(level, str) else level
+    if fmt == 'json':
+        ff = JsonFormatter()
+    else:
+        ff = log.Formatter('%(asctime)s %(name)-12s %(levelname)-8s %(message)s', datefmt='%m-%d %H:%M')
+    # set up logging to file
+    fh = log.FileHandler(nm, 'w', 'utf-8')
+    fh.setLevel(level)
+    fh.setFormatter(ff)
+
+    # set a simpler format for console
+    fm = log.Formatter('%(name)-12s: %(levelname)-8s > %(message)s')
+    # define a Handler as console
+    cs = log.StreamHandler()
+    # write INFO messages or higher to the sys.stderr
+    cs.setLevel(log.INFO)
+    # tell the handler to use this format
+    cs.setFormatter(fm)
+    handlers = [fh, cs]
+    if per_article:
+        ah = ArticleLogs(Path(nm).with_suffix(''))
+        ah.setLevel(level)
+        ah.setFormatter(ff)
+        handlers.append(ah)
+
+    # a multiprocessing queue so worker processes can log to it too
+    _log_queue, _log_level = multiprocessing.Queue(), min(level, log.INFO)
+    listener = QueueListener(_log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)                                  # writes what's left in the queue
+    log_worker(_log_queue, _log_level)
+
+    # Define loggers for different areas of application
+    lgr1 = log.getLogger(first_log)
+    # trag where stuff is happening in logs
+    lgr2 = log.getLogger(second_log)
+    lgr1.debug('defined lgr1: %s', lgr1)
+    lgr2.debug('defined lgr2: %s', lgr2)
+    # log to root
+    log.debug('setup logging')
+    return lgr1, lgr2
+
+
+def log_worker(queue=None, level=log.DEBUG):
+    '''
+    Sends this process's records to the QueueListener started by log_setup(), tagged with the article being
+    converted. Run by log_setup() and as, or from, the initializer of every worker pool, with log_args().
+    Does nothing if logging wasn't set up, e.g. when used as a library.
+    '''
+    from logging.handlers import QueueHandler
+    if queue is None:
+        return
+    root = log.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    qh = QueueHandler(queue)
+    qh.addFilter(ArticleFilter())
+    root.addHandler(qh)
+    root.setLevel(level)
+
+
+@contextmanager
+def log_article(name):
+    '''
+    Tags the records logged inside it with the article name, for --log-per-article.
+    '''
+    global _log_article
+    previous, _log_article = _log_article, name
+    try:
+        yield
+    finally:
+        _log_article = previous
+
+
+def log_args():
+    '''
+    Returns the arguments for log_worker() in a worker process.
+    '''
+    return _log_queue, _log_level
+
+
+class ArticleFilter(log.Filter):
+    '''
+    # ArticleFilter Class
+    Adds the article this process is converting (or None) to each record as record.article.
+    '''
+
+    def filter(self, record):
+        record.article = _log_article
+        return True
+
+
+class JsonFormatter(log.Formatter):
+    '''
+    # JsonFormatter Class
+    Formats a record as one line of JSON for --log-format json: time, level, logger, pid, article and message,
+    plus the stage and counts of an Article.log_events() summary.
+    '''
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'article': getattr(record, 'article', None),
+            'message': record.getMessage(),
+        }
+        for k in ('stage', 'counts'):
+            if hasattr(record, k):
+                entry[k] = getattr(record, k)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ArticleLogs(log.Handler):
+    '''
+    # ArticleLogs Class
+    Handler writing each record logged while an article was converted to its own file as well, <article>.log
+    in a folder named after the run's log. It runs on the QueueListener thread, so it's the only writer even
+    when the records come from many worker processes. The most recently used OPEN files are kept open.
+    - Arguments:
+        - path: folder for the files, made on the first record.
+    '''
+    OPEN = 32
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = Path(path)
+        self.files = {}                                             # article --> file, least recently used first
+
+    def emit(self, record):
+        article = getattr(record, 'article', None)
+        if not article:
+            return
+        try:
+            f = self.files.pop(article, None)
+            if f is None:
+                self.path.mkdir(parents=True, exist_ok=True)
+                f = open(self.path / f'{article}.log', 'a', encoding='utf-8')
+            self.files[article] = f
+            if len(self.files) > self.OPEN:
+                self.files.pop(next(iter(self.files))).close()
+            f.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        super().close()
+
+
+# handlers are added by log_setup() when run from the command line
+lgr1 = log.getLogger('ArticleClass')
+
+
+lgr2 = log.getLogger('amend_html')
+
+_log_queue, _log_level = None, log.DEBUG                           # set by log_setup() for log_worker()
+
+_log_article = None                                                 # article being converted, see ArticleFilter
@@ -0,0 +1,326 @@
+'''
+Award heading lookup, the html sanitizer and the single pass rewriter amend_html() runs on.
+'''
+import re
+
+
+APOSTROPHES = str.maketrans({c: "'" for c in '’‘ʼ`´′'})
+
+
+def normalise_heading(text):
+    '''
+    Tidies heading text for matching: casefolds, unifies apostrophes, collapses whitespace
+    and drops trailing punctuation.
+    '''
+    text = ' '.join(text.casefold().translate(APOSTROPHES).split())
+    return text.rstrip(' .,:;?!')
+
+
+class HeadingIndex(object):
+    '''
+    # HeadingIndex Class
+    Heading lookup compiled once from SUBS and shared by every Article in a batch.
+    - Arguments:
+        - SUBS: substitutions for h3 headings from subs.json. Each section can have an optional
+          "aliases" dict of heading key --> list of alternative wordings. Aliases starting
+          're:' are regular expressions matched against the whole normalised heading.
+        - fuzzy: optional difflib similarity cutoff (0-1) for near misses e.g. typos, off by default.
+    '''
+    SKIP = ('code', 'aliases')                                      # keys in subs.json that aren't headings
+
+    def __init__(self, SUBS, fuzzy=0):
+        self.fuzzy = fuzzy
+        self.exact = {}                                             # award --> {normalised: (key, heading, alias)}
+        self.patterns = {}                                          # award --> [(regex, key, heading)]
+        self.expected = {}                                          # award --> award specific heading keys
+        common = self.compile(SUBS['All'])
+        for award, subs in SUBS.items():
+            if award == 'All':
+                continue
+            exact, patterns = self.compile(subs)
+            # generic headers win as in the old {**SUBS[award], **SUBS['All']} merge
+            self.exact[award] = {**exact, **common[0]}
+            self.patterns[award] = patterns + common[1]
+            self.expected[award] = [k for k in subs if k not in self.SKIP]
+
+    def compile(self, subs):
+        '''
+        Returns the exact lookup and regex aliases for one section of subs.json.
+        '''
+        exact = {}
+        patterns = []
+        for k, aliases in subs.get('aliases', {}).items():
+            for a in aliases:
+                if a.startswith('re:'):
+                    patterns.append((re.compile(a[3:], re.IGNORECASE), k, subs[k]))
+                else:
+                    exact[normalise_heading(a)] = (k, subs[k], True)
+        for k, v in subs.items():
+            if k not in self.SKIP:
+                exact[normalise_heading(v)] = (k, v, False)
+        return exact, patterns
+
+    def match(self, text, award):
+        '''
+        Returns (key, heading, alias) for heading text, or None if it isn't an award heading.
+        alias is True when matched by an alias or fuzzily rather than by the heading itself.
+        '''
+        import difflib
+        text = normalise_heading(text)
+        exact = self.exact[award]
+        if text in exact:
+            return exact[text]
+        for pattern, k, v in self.patterns[award]:
+            if pattern.fullmatch(text):
+                return k, v, True
+        if self.fuzzy:
+            close = difflib.get_close_matches(text, exact, n=1, cutoff=self.fuzzy)
+            if close:
+                k, v, _ = exact[close[0]]
+                return k, v, True
+        return None
+
+
+class Sanitizer(object):
+    '''
+    # Sanitizer Class
+    Allow-list of tags and attributes from tags.json, applied to a BeautifulSoup tree in place.
+    Same rules as bleach.clean(strip=True): disallowed tags are unwrapped leaving their contents,
+    other attributes are dropped, comments are removed and url attributes may only be relative
+    or use http, https or mailto.
+    Whitespace comes out as it did from bleach followed by a reparse: a stripped block-level tag
+    leaves a newline unless it's the first tag, and the strings it leaves behind are joined.
+    - Arguments:
+        - TAGS: allowed 'tags' list and 'attrs' dict of tag --> allowed attributes.
+    '''
+    URI_ATTRS = frozenset(['href', 'src', 'action', 'cite', 'background', 'longdesc', 'poster', 'xlink:href'])
+    PROTOCOLS = frozenset(['http', 'https', 'mailto'])
+    BLOCK = frozenset([
+        'address', 'article', 'aside', 'blockquote', 'details', 'dialog', 'dd', 'div', 'dl', 'dt',
+        'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+        'header', 'hgroup', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul'])
+    SPACES = frozenset(' \n\t\f\r')                               # html.parser's collapsible whitespace
+
+    def __init__(self, TAGS):
+        from bs4 import Comment, Declaration, ProcessingInstruction
+        self.strip = (Comment, Declaration, ProcessingInstruction)  # includes Doctype and CData
+        self.tags = frozenset(TAGS['tags'])
+        common = frozenset(TAGS['attrs'].get('*', []))
+        self.attrs = {t: frozenset(a) | common for t, a in TAGS['attrs'].items()}
+        self.common = common
+        self.seen = False                                           # a tag has gone by, see __call__
+        self.touched = []                                           # parents that were given loose strings
+
+    def __call__(self, tag):
+        '''
+        Cleans one tag on the way down, before its descendants.
+        Returns False if the tag isn't allowed, it's left in place for its children to be walked
+        and should be unwrapped with drop() afterwards.
+        '''
+        self.strip_comments(tag)
+        seen, self.seen = self.seen, True
+        if tag.name not in self.tags:
+            if seen and tag.name in self.BLOCK:
+                tag.insert(0, '\n')
+            return False
+        allowed = self.attrs.get(tag.name, self.common)
+        for k in [*tag.attrs]:
+            if k not in allowed or (k in self.URI_ATTRS and not self.allowed_uri(tag[k])):
+                del tag[k]
+        return True
+
+    def drop(self, tag):
+        '''
+        Unwraps a disallowed tag once its children are done, joining its strings first.
+        '''
+        self.join(tag)
+        parent = tag.parent
+        tag.unwrap()
+        self.touched.append(parent)
+
+    def tidy(self):
+        '''
+        Joins and collapses the strings left in the parents of unwrapped tags or comments.
+        '''
+        from bs4 import BeautifulSoup as Soup
+        for parent in self.touched:
+            if parent.parent is not None or parent.name == Soup.ROOT_TAG_NAME:
+                self.join(parent, collapse=True)
+        self.touched = []
+
+    def join(self, tag, collapse=False):
+        '''
+        Joins runs of adjacent strings in a tag. With collapse, whitespace-only strings become
+        a single newline or space, the way html.parser reads them.
+        '''
+        from bs4 import NavigableString
+        contents = tag.contents
+        i = len(contents) - 1
+        while i >= 0:
+            if not isinstance(contents[i], NavigableString):
+                i -= 1
+                continue
+            j = i
+            while j and isinstance(contents[j - 1], NavigableString):
+                j -= 1
+            run = contents[j:i + 1]
+            text = ''.join(run)
+            if collapse and self.SPACES.issuperset(text):
+                text = '\n' if '\n' in text else ' '
+            if len(run) > 1 or text != run[0]:
+                for s in run[1:]:
+                    s.extract()
+                run[0].replace_with(NavigableString(text))
+            i = j - 1
+
+    def strip_comments(self, tag):
+        '''
+        Removes comments and other declarations directly inside a tag.
+        '''
+        comments = [c for c in tag.contents if isinstance(c, self.strip)]
+        for c in comments:
+            c.extract()
+        if comments:
+            self.touched.append(tag)
+
+    def allowed_uri(self, value):
+        '''
+        Checks a url attribute's protocol the way bleach's sanitize_uri_value does.
+        '''
+        import urllib.parse
+        uri = re.sub(r'[`\000-\040\177-\240\s]+', '', value).replace('\ufffd', '').lower()
+        try:
+            scheme = urllib.parse.urlparse(uri).scheme
+        except ValueError:
+            return False
+        if scheme:
+            return scheme in self.PROTOCOLS
+        return True                                                 # relative urls and #anchors
+
+    def clean(self, tree):
+        '''
+        Cleans a whole tree in place and returns it.
+        '''
+        return Rewriter(self).run(tree)
+
+
+class Rewriter(object):
+    '''
+    # Rewriter Class
+    Rule-based html rewrite engine that applies every rule in a single walk of a BeautifulSoup tree.
+    - Rules are registered in order with `@rw.rule(*tag_names)` and called as rule(tag).
+    - Tags are visited children first, from a snapshot taken before any rule runs, so rules can move,
+      wrap or unwrap tags freely. Tags made by rules aren't visited.
+    - Each tag goes through the rules in registration order, checking its current name each time,
+      so a tag renamed by one rule (e.g. h2 --> p) is picked up by the later rules for its new name.
+    - Rules registered with `defer=True` need the rest of the tree rewritten first (e.g. li looking
+      into nested lists). Their tags are collected during the walk and the rule runs after it, in document order.
+    - Rules that need the whole document are registered with `@rw.finish` and run last.
+    - An optional Sanitizer cleans each tag on the way down, before its children, so rules only
+      ever see allowed tags. Disallowed tags are unwrapped on the way back up.
+    - An optional stage callable, e.g. Profiler.stage, times the walk and every rule by name.
+    '''
+
+    def __init__(self, sanitizer=None, stage=None):
+        self.rules = []
+        self.finishers = []
+        self.sanitizer = sanitizer
+        self.stage = stage
+        self.cursor = {}                                            # id(parent) --> last index found
+
+    def rule(self, *names, defer=False):
+        '''
+        Registers a rule for the given tag names.
+        '''
+        def register(func):
+            self.rules.append((frozenset(names), func, defer))
+            return func
+        return register
+
+    def finish(self, func):
+        '''
+        Registers a rule to run on the whole tree after the walk.
+        '''
+        self.finishers.append(func)
+        return func
+
+    def index(self, tag):
+        '''
+        Position of a tag in its parent's contents, by identity like Tag.index.
+        Tags are visited in document order, so the search starts from where the last tag in the same
+        parent was found rather than from the top. Keeps long documents linear instead of quadratic.
+        '''
+        parent = tag.parent
+        contents = parent.contents
+        for i in range(self.cursor.get(id(parent), 0), len(contents)):
+            if contents[i] is tag:
+                break
+        else:
+            i = parent.index(tag)                                   # tree changed behind the cursor
+        self.cursor[id(parent)] = i
+        return i
+
+    def call(self, func, *args):
+        '''
+        Runs a rule, inside a stage named after it if timing.
+        '''
+        if not self.stage:
+            return func(*args)
+        with self.stage(func.__name__):
+            return func(*args)
+
+    def walk(self, tree):
+        '''
+        Returns every tag below the root in a single pass, children before their parents,
+        paired with its position in document order. The sanitizer is run along the way.
+        '''
+        from bs4 import Tag
+        tags = []
+        stack = [(tree, None)]
+        pos = 0
+        clean = self.sanitizer
+        if clean:
+            clean.strip_comments(tree)
+        while stack:
+            tag, i = stack.pop()
+            if i is not None:
+                if i is False:
+                    clean.drop(tag)
+                else:
+                    tags.append((i, tag))
+                continue
+            children = [c for c in tag.contents if isinstance(c, Tag)]
+            if tag is tree or not clean or clean(tag):
+                stack.append((tag, pos))
+                pos += 1
+            else:
+                stack.append((tag, False))
+            stack.extend((c, None) for c in reversed(children))
+        if clean:
+            clean.tidy()
+        return tags[:-1]
+
+    def run(self, tree):
+        '''
+        Applies the rules to every tag in the tree, then the deferred rules and finishers. Returns the tree.
+        '''
+        names = frozenset().union(*(n for n, _, _ in self.rules))
+        deferred = {func: [] for _, func, defer in self.rules if defer}
+        for i, tag in self.call(self.walk, tree):
+            if tag.name not in names:
+                continue
+            for match, func, defer in self.rules:
+                if tag.parent is None:                              # unwrapped or removed by an earlier rule
+                    break
+                if tag.name in match:
+                    if defer:
+                        deferred[func].append((i, tag))
+                    else:
+                        self.call(func, tag)
+        for func, tags in deferred.items():
+            for _, tag in sorted(tags, key=lambda t: t[0]):
+                if tag.parent is not None:
+                    self.call(func, tag)
+        for func in self.finishers:
+            self.call(func, tree)
+        return tree
@@ -0,0 +1,108 @@
+'''
+The warm pandoc server the articles a process converts share.
+'''
+import os
+import json
+import time
+from .logger import lgr1
+
+
+class PandocServer(object):
+    '''
+    # PandocServer Class
+    Long-lived local `pandoc server` process so a batch pays pandoc startup once, not once per file.
+    - Arguments:
+        - url: address of a server that is already running, otherwise one is started on a free local port.
+        - timeout: seconds allowed for a single conversion.
+    '''
+    UNLIMITED = 24 * 3600                                           # pandoc server's --timeout has no "no limit"
+
+    def __init__(self, url=None, timeout=120):
+        self.proc = None
+        self.timeout = timeout
+        self.url = url or self.start()
+
+    def start(self):
+        '''
+        Starts pandoc in server mode on a free local port and waits until it accepts connections.
+        '''
+        import atexit
+        import math
+        import socket
+        import subprocess
+        import pypandoc
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        cmd = [pypandoc.get_pandoc_path(), 'server', f'--port={port}', f'--timeout={math.ceil(self.timeout)}']
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        atexit.register(self.stop)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if self.proc.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f'pandoc server failed to start: {" ".join(cmd)}')
+                time.sleep(0.05)
+        url = f'http://127.0.0.1:{port}/'
+        lgr1.info(f'started pandoc server -> {url}')
+        return url
+
+    def stop(self):
+        '''
+        Stops the server if this process started it.
+        '''
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            self.proc.wait()
+            lgr1.debug('stopped pandoc server')
+
+    def convert(self, text, fmt, to, timeout=None):
+        '''
+        Converts text from fmt to the output format on the server, waiting timeout seconds or the server's.
+        Binary inputs such as docx are passed in as bytes and sent base64 encoded.
+        '''
+        import base64
+        import socket
+        import urllib.request
+        import urllib.error
+        if isinstance(text, bytes):
+            text = base64.b64encode(text).decode('ascii')
+        data = json.dumps({'text': text, 'from': fmt, 'to': to}).encode('utf-8')
+        req = urllib.request.Request(self.url, data=data, headers={
+            'Content-Type': 'application/json', 'Accept': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=timeout or self.timeout) as r:
+                res = json.load(r)
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f'pandoc server error: {e.read().decode("utf-8", "replace").strip()}')
+        except socket.timeout:
+            raise TimeoutError(f'pandoc server took longer than {timeout or self.timeout:g}s') from None
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, socket.timeout):
+                raise TimeoutError(f'pandoc server took longer than {timeout or self.timeout:g}s') from None
+            raise RuntimeError(f'pandoc server not reachable at {self.url}: {e.reason}')
+        for m in res.get('messages', []):
+            lgr1.debug(f"pandoc: {m.get('message', m)}")
+        if res.get('base64'):
+            return base64.b64decode(res['output']).decode('utf-8')
+        return res['output']
+
+
+_pandoc_server = None
+
+
+def pandoc_server(timeout=None):
+    '''
+    Returns the pandoc server for this process, started with timeout seconds per conversion if given.
+    Workers connect to the server main() started through PANDOC_SERVER_URL rather than starting their own,
+    waiting as long as it allows, PANDOC_SERVER_TIMEOUT.
+    '''
+    global _pandoc_server
+    if _pandoc_server is None:
+        _pandoc_server = PandocServer(url=os.environ.get('PANDOC_SERVER_URL'),
+                                      timeout=timeout or float(os.environ.get('PANDOC_SERVER_TIMEOUT', 120)))
+    return _pandoc_server
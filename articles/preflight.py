@@ -0,0 +1,117 @@
+'''
+Checking inputs before converting them, for --preflight and --preflight-only.
+'''
+import logging as log
+import time
+import functools
+from pathlib import Path
+from .logger import log_args, log_worker
+from .markup import HeadingIndex
+from .article import Article, DocxMedia
+
+
+class Preflight(object):
+    '''
+    # Preflight Class
+    Quick checks of a docx read straight from its zip and XML without running pandoc, so a batch can skip
+    broken files and flag problems before converting anything: that it's a valid docx, its images by format,
+    tables and charts, and which award headings are missing.
+    - Arguments:
+        - SUBS: substitutions for h3 headings from subs.json.
+        - award: award section of SUBS to look for the headings of.
+        - headings: HeadingIndex to match headings with, built from SUBS if not given.
+    '''
+    W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+    CHART = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/chart'
+    MAX_HEADING = 200                                               # characters, longer paragraphs aren't headings
+
+    def __init__(self, SUBS, award, headings=None):
+        self.SUBS = SUBS
+        self.award = award
+        self.headings = headings or HeadingIndex(SUBS)
+
+    def check(self, path):
+        '''
+        Returns a dict of what was found in the docx at path. ok is False with the error if it can't be converted,
+        warnings lists anything worth a look.
+        '''
+        import zipfile
+        import xml.etree.ElementTree as ET
+        result = {'file': path.name, 'ok': False, 'error': None, 'images': {}, 'tables': 0, 'charts': 0,
+                  'missing': [], 'warnings': []}
+        try:
+            with DocxMedia(path) as media:
+                bad = media.zip.testzip()                           # crc of every part
+                if bad:
+                    raise zipfile.BadZipFile(f'corrupt part {bad}')
+                if 'word/document.xml' not in media.names:
+                    raise ValueError('no word/document.xml, not a docx')
+                document = ET.fromstring(media.read('word/document.xml'))
+                for name in media.images():
+                    suffix = Path(name).suffix.lower()
+                    result['images'][suffix] = result['images'].get(suffix, 0) + 1
+                if 'word/_rels/document.xml.rels' in media.names:
+                    result['charts'] = media.read('word/_rels/document.xml.rels').decode('utf-8').count(self.CHART)
+        except Exception as e:                                      # anything that stops it being read
+            result['error'] = f'{type(e).__name__}: {e}'
+            return result
+        result['ok'] = True
+        found = set()
+        for p in document.iter(f'{self.W}p'):
+            text = ''.join(t.text or '' for t in p.iter(f'{self.W}t'))
+            if text and len(text) <= self.MAX_HEADING:
+                hit = self.headings.match(text, self.award)
+                if hit:
+                    found.add(hit[0])
+        result['tables'] = sum(1 for _ in document.iter(f'{self.W}tbl'))
+        result['missing'] = [self.SUBS[self.award][k] for k in self.headings.expected[self.award] if k not in found]
+        unsupported = {k: v for k, v in result['images'].items() if k in Article.CONVERT}
+        if unsupported:
+            result['warnings'].append(f'{", ".join(f"{v} {k[1:]}" for k, v in unsupported.items())} images '
+                                      f'converted to jpg, check them')
+        if result['tables']:
+            result['warnings'].append(f'{result["tables"]} tables, check their layout')
+        if result['charts']:
+            result['warnings'].append(f'{result["charts"]} charts, pandoc leaves them out')
+        if result['missing']:
+            result['warnings'].append(f'missing headings: {", ".join(result["missing"])}')
+        return result
+
+
+def preflight_file(infile, SUBS, award, headings=None):
+    '''
+    Runs the Preflight checks on one file, in a worker of run_preflight().
+    '''
+    start = time.perf_counter()
+    result = Preflight(SUBS, award, headings).check(infile)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_preflight(files, SUBS, award, jobs=1, headings=None):
+    '''
+    Checks a batch of docx files with Preflight before converting them, on a pool of worker processes
+    when jobs > 1. Returns a list of result dicts from Preflight.check(), in the order of files.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    if jobs <= 1 or len(files) <= 1:
+        return [preflight_file(f, SUBS, award, headings) for f in files]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=log_worker, initargs=log_args()) as pool:
+        return list(pool.map(functools.partial(preflight_file, SUBS=SUBS, award=award, headings=headings), files))
+
+
+def log_preflight(checks, seconds):
+    '''
+    Logs the Preflight result of each file and a summary.
+    '''
+    for c in checks:
+        images = ', '.join(f'{v} {k[1:]}' for k, v in sorted(c['images'].items())) or 'no images'
+        if not c['ok']:
+            log.warning(f"  INVALID {c['file']} -> {c['error']}")
+        elif c['warnings']:
+            log.warning(f"  check   {c['file']} ({images}) -> {'; '.join(c['warnings'])}")
+        else:
+            log.info(f"  ok      {c['file']} ({images})")
+    bad = sum(1 for c in checks if not c['ok'])
+    flagged = sum(1 for c in checks if c['ok'] and c['warnings'])
+    log.info(f'preflight: {len(checks)} files, {bad} invalid, {flagged} to check in {seconds:.2f}s')
@@ -0,0 +1,366 @@
+'''
+The amend_html() rules, loaded from JSON/rules.json.
+'''
+import logging as log
+import re
+import json
+from pathlib import Path
+from . import __version__
+from .util import atomic_path, resource_path
+from .logger import lgr2
+
+
+class Rules(object):
+    '''
+    # Rules Class
+    amend_html's rewrite rules, read from a declarative rules file (JSON/rules.json) rather than written as code,
+    so a house style tweak or a new award scheme is an edit to the file. Validated and compiled once, shared by
+    every Article in a batch, and registered on each article's Rewriter by bind().
+    - Each rule has:
+        - name: for logs and profiling stages.
+        - select: tag name or list of them, or "finish": true to run on the whole tree after the walk.
+        - defer: optional, run after the walk as with Rewriter.rule().
+        - if / unless: optional tests that must all pass / mustn't all pass, see TESTS.
+        - actions: list of {action: argument}, run in order, see ACTIONS. The rest are skipped if one fails.
+    - Load with Rules.load(), which keeps the compiled rules in a cache folder, reused while the file's
+      mtime and size, or failing that its sha256, are unchanged.
+    - Arguments:
+        - spec: the parsed rules file, {"version": 1, "rules": [...]}.
+        - source: where it came from, for error messages.
+    '''
+    FILE = 'JSON/rules.json'
+    VERSION = 1
+    KEYS = frozenset(['name', 'select', 'finish', 'defer', 'if', 'unless', 'actions'])
+    TESTS = {                                                       # test --> argument type
+        'has': str,                                                 # has a descendant with this name
+        'has_attr': str,
+        'parent': (str, list),                                      # parent tag is one of these
+        'text_endswith': (str, list),
+        'text_matches': str,                                        # regex searched for in the text
+    }
+    ACTIONS = {                                                     # action --> argument type
+        'rename': str,
+        'wrap': str,                                                # in a new tag
+        'wrap_text': str,                                           # the tag's only string in a new tag
+        'unwrap': (bool, str),                                      # true for the tag, or its first descendant named
+        'remove': bool,
+        'space': bool,                                              # newlines before and after
+        'insert_heading': dict,                                     # {"text", "tag"} before the tag
+        'image': bool,                                              # renamed src, in its own paragraph
+        'award_heading': str,                                       # award headings renamed to this tag
+        'collect': str,                                             # into a named list for a finish rule
+        'footnotes': dict,                                          # {"heading", "tag", "notes"}, finish rules only
+    }
+    FINISH = frozenset(['footnotes'])
+
+    def __init__(self, spec, source='rules'):
+        import hashlib
+        self.source = str(source)
+        if not isinstance(spec, dict) or spec.get('version') != self.VERSION or not isinstance(spec.get('rules'), list):
+            raise ValueError(f'{self.source}: expected {{"version": {self.VERSION}, "rules": [...]}}')
+        self.digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+        self.rules = [self.compile(i, rule) for i, rule in enumerate(spec['rules'])]
+        self.created()
+
+    def created(self):
+        # tags the rules make, which tags.json has to allow as they're made after the sanitizer has run
+        self.creates = frozenset(arg['tag'] if isinstance(arg, dict) else arg
+                                 for *_, actions, _, _ in self.rules for action, arg in actions
+                                 if action in ('rename', 'wrap', 'wrap_text', 'award_heading', 'insert_heading',
+                                               'footnotes'))
+
+    def dump(self):
+        '''
+        Returns the compiled rules as JSON data for the cache, see restore().
+        '''
+        def args(tests):
+            return [[t, a.pattern if t == 'text_matches' else a] for t, a in tests]
+        return {'source': self.source, 'digest': self.digest, 'rules': [
+            [name, sorted(names), args(tests), args(unless), [list(a) for a in actions], defer, finish]
+            for name, names, tests, unless, actions, defer, finish in self.rules]}
+
+    @classmethod
+    def restore(cls, data):
+        '''
+        Returns Rules from dump()'s data without validating them again. Data, not code, so a cache file
+        someone else could write can't run anything when it's loaded.
+        '''
+        def args(tests):
+            return tuple((t, re.compile(a) if t == 'text_matches' else tuple(a) if isinstance(a, list) else a)
+                         for t, a in tests)
+        self = cls.__new__(cls)
+        self.source, self.digest = data['source'], data['digest']
+        self.rules = [(name, frozenset(names), args(tests), args(unless), tuple(tuple(a) for a in actions),
+                       defer, finish) for name, names, tests, unless, actions, defer, finish in data['rules']]
+        self.created()
+        return self
+
+    @classmethod
+    def load(cls, path=None, cache_dir=None):
+        '''
+        Returns the compiled Rules in a rules file, JSON/rules.json next to the script by default, a given path
+        relative to the current directory. With a cache_dir they're kept as JSON in its rules/ folder, and
+        reused while the file's mtime and size, or its sha256, are unchanged.
+        '''
+        import hashlib
+        path = Path(path) if path else Path(resource_path(cls.FILE))
+        stat = path.stat()
+        cached = entry = None
+        if cache_dir:
+            name = hashlib.sha256(str(path.resolve()).encode('utf-8')).hexdigest()[:16]
+            cached = Path(cache_dir) / 'rules' / f'{name}.json'
+            try:
+                entry = json.loads(cached.read_text(encoding='utf-8'))
+                if entry['version'] != [__version__, cls.VERSION]:
+                    entry = None
+                elif entry['stat'] == [stat.st_mtime_ns, stat.st_size]:
+                    return cls.restore(entry['rules'])
+            except Exception:                                       # missing, stale or corrupt, just compile
+                entry = None
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if entry and entry['sha256'] == digest:
+            rules = cls.restore(entry['rules'])                     # touched but unchanged
+        else:
+            try:
+                spec = json.loads(data)
+            except ValueError as e:
+                raise ValueError(f'{path.name}: {e}') from None
+            rules = cls(spec, source=path.name)
+            log.debug(f'compiled {len(rules.rules)} rules from {path}')
+        if cached:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_path(cached) as tmp:
+                Path(tmp).write_text(json.dumps({'version': [__version__, cls.VERSION],
+                                                 'stat': [stat.st_mtime_ns, stat.st_size], 'sha256': digest,
+                                                 'rules': rules.dump()}), encoding='utf-8')
+        return rules
+
+    def compile(self, i, rule):
+        '''
+        Validates one rule, returning (name, tag names, tests, unless tests, actions, defer, finish).
+        Raises ValueError saying which rule is wrong and why.
+        '''
+        name = rule.get('name', f'rule_{i + 1}') if isinstance(rule, dict) else None
+        where = f'{self.source} rule {i + 1} ({name})'
+        if not isinstance(rule, dict):
+            raise ValueError(f'{where}: a rule is an object')
+        if set(rule) - self.KEYS:
+            raise ValueError(f'{where}: unknown keys {", ".join(sorted(set(rule) - self.KEYS))}')
+        finish = rule.get('finish') is True
+        select = rule.get('select')
+        names = frozenset([select] if isinstance(select, str) else select or [])
+        if finish == bool(names) or not all(isinstance(n, str) for n in names):
+            raise ValueError(f'{where}: needs "select" tag names, or "finish": true')
+        tests, unless = self.tests(where, rule.get('if', {})), self.tests(where, rule.get('unless', {}))
+        defer = rule.get('defer') is True
+        if finish and (tests or unless or defer):
+            raise ValueError(f'{where}: finish rules run on the whole tree, they can\'t have if, unless or defer')
+        actions = []
+        for a in rule.get('actions') or []:
+            if not isinstance(a, dict) or len(a) != 1:
+                raise ValueError(f'{where}: each action is one {{"action": argument}}')
+            (action, arg), = a.items()
+            if action not in self.ACTIONS:
+                raise ValueError(f'{where}: unknown action {action}, expected one of {", ".join(self.ACTIONS)}')
+            if not isinstance(arg, self.ACTIONS[action]):
+                raise ValueError(f'{where}: bad argument for {action}: {arg!r}')
+            if (action in self.FINISH) != finish:
+                raise ValueError(f'{where}: {action} is {"only" if action in self.FINISH else "not"} for finish rules')
+            if arg is False:
+                continue
+            if action == 'insert_heading':
+                if not isinstance(arg.get('text'), str):
+                    raise ValueError(f'{where}: insert_heading needs a "text"')
+                arg = {'tag': 'h3', **arg}
+            elif action == 'footnotes':
+                arg = {'heading': 'Sources', 'tag': 'h3', 'notes': 'notes', **arg}
+            actions.append((action, arg))
+        if not actions:
+            raise ValueError(f'{where}: no actions')
+        return name, names, tests, unless, tuple(actions), defer, finish
+
+    def tests(self, where, tests):
+        '''
+        Validates a rule's if / unless tests, returning (test, argument) pairs.
+        '''
+        if not isinstance(tests, dict):
+            raise ValueError(f'{where}: if and unless are {{"test": argument}} objects')
+        out = []
+        for test, arg in tests.items():
+            if test not in self.TESTS:
+                raise ValueError(f'{where}: unknown test {test}, expected one of {", ".join(self.TESTS)}')
+            if not isinstance(arg, self.TESTS[test]):
+                raise ValueError(f'{where}: bad argument for {test}: {arg!r}')
+            if test == 'text_matches':
+                try:
+                    arg = re.compile(arg)
+                except re.error as e:
+                    raise ValueError(f'{where}: bad regex for {test}: {e}') from None
+            elif test in ('parent', 'text_endswith'):
+                arg = (arg,) if isinstance(arg, str) else tuple(arg)
+            out.append((test, arg))
+        return tuple(out)
+
+    def bind(self, Art, tree, rw):
+        '''
+        Registers the rules on an article's Rewriter, in order. Returns the award heading keys found,
+        filled in as the Rewriter runs.
+        '''
+        from types import SimpleNamespace
+        if rw.sanitizer and not self.creates <= rw.sanitizer.tags:
+            raise ValueError(f'{self.source}: rules make tags tags.json doesn\'t allow: '
+                             f'{", ".join(sorted(self.creates - rw.sanitizer.tags))}')
+        run = SimpleNamespace(article=Art, tree=tree, rw=rw, found=set(), lists={})
+        for name, names, tests, unless, actions, defer, finish in self.rules:
+            func = self.function(run, name, tests, unless, actions, finish)
+            if finish:
+                rw.finish(func)
+            else:
+                rw.rule(*names, defer=defer)(func)
+        return run.found
+
+    def function(self, run, name, tests, unless, actions, finish=False):
+        '''
+        Returns a rule's tests and actions as one function of a tag, named after the rule.
+        '''
+        tests = [(getattr(self, f'test_{t}'), arg) for t, arg in tests]
+        unless = [(getattr(self, f'test_{t}'), arg) for t, arg in unless]
+        actions = [(getattr(self, f'do_{a}'), arg) for a, arg in actions]
+
+        def rule(tag):
+            if not all(test(tag, arg) for test, arg in tests):
+                return
+            if unless and all(test(tag, arg) for test, arg in unless):
+                return
+            try:
+                for action, arg in actions:
+                    action(run, tag, arg)
+            except (AttributeError, ValueError) as e:
+                lgr2.warning(f'Problem with {name} --> {e}')
+                return
+            if not finish:                                          # not the whole tree
+                run.article.event(lgr2, name, '%s --> %s', name, tag)
+        rule.__name__ = name
+        return rule
+
+    @staticmethod
+    def test_has(tag, name):
+        return tag.find(name) is not None
+
+    @staticmethod
+    def test_has_attr(tag, attr):
+        return tag.has_attr(attr)
+
+    @staticmethod
+    def test_parent(tag, names):
+        return tag.parent is not None and tag.parent.name in names
+
+    @staticmethod
+    def test_text_endswith(tag, endings):
+        return tag.text.endswith(endings)
+
+    @staticmethod
+    def test_text_matches(tag, pattern):
+        return pattern.search(tag.text) is not None
+
+    def do_rename(self, run, tag, name):
+        tag.name = name
+
+    def do_wrap(self, run, tag, name):
+        tag.wrap(run.tree.new_tag(name))
+
+    def do_wrap_text(self, run, tag, name):
+        tag.string.wrap(run.tree.new_tag(name))                     # AttributeError unless it's one string
+
+    def do_unwrap(self, run, tag, name):
+        (tag if name is True else tag.find(name)).unwrap()
+
+    def do_remove(self, run, tag, arg):
+        tag.decompose()
+
+    def do_space(self, run, tag, arg):
+        '''Spaces a tag with newlines before and after.'''
+        try:
+            i = run.rw.index(tag)
+            tag.parent.insert(i, '\n')
+            tag.parent.insert(i + 2, '\n')
+        except NotImplementedError:
+            lgr2.warning(f"couldn't space tag: {tag}")
+
+    def do_insert_heading(self, run, tag, arg):
+        h = run.tree.new_tag(arg['tag'])
+        h.string = arg['text']
+        tag.insert_before(h)
+        h.insert_after('\n')
+
+    def do_collect(self, run, tag, name):
+        run.lists.setdefault(name, []).append(tag)
+
+    def do_image(self, run, ig, arg):
+        '''Replaces the source attribute to renamed image and ensures image is in its own paragraph.'''
+        try:
+            src = ig['src']
+            IMGS = run.article.IMGS
+            v = IMGS.get(src) or next((v for k, v in IMGS.items() if k in src), None)
+            if v:
+                # set original <img src=""> attribute to new variable
+                ig['src'] = v
+                run.article.event(lgr2, 'image src', '<img src="%s"> --> <img src="%s">', src, v)
+        except KeyError as e:
+            lgr2.error('img caught key error')
+            lgr2.debug(e)
+        try:
+            prt = ig.parent
+            if ig.parent.name == 'p':
+                self.do_space(run, prt, True)
+                # insert all images outside of p tag to wrap them properly in p tags.
+                wrapper = run.tree.new_tag('p')
+                wrapper.append(ig)
+                prt.parent.insert(run.rw.index(prt) + 1, wrapper)
+                # strip whitespace and remove p tag if empty
+                if len(prt.get_text(strip=True)) == 0:
+                    prt.unwrap()
+                    run.article.event(lgr2, 'image paragraph cut', 'cut %s', prt)
+            else:
+                self.do_space(run, ig, True)
+                self.do_wrap(run, ig, 'p')
+        except ValueError as e:
+            lgr2.error('img caught value error')
+            lgr2.debug(e)
+
+    def do_award_heading(self, run, tag, name):
+        '''Renames award headings, in the award's wording if matched by an alias.'''
+        Art = run.article
+        hit = Art.HEADINGS.match(tag.text, Art.AWARD)
+        if hit:
+            k, v, alias = hit
+            run.found.add(k)
+            if alias:
+                tag.string = v
+            tag.name = name
+
+    def do_footnotes(self, run, tree, arg):
+        '''Removes anchor tags from footnotes and endnotes section and adds a heading to endnotes.'''
+        lgr2.debug('amending footnotes...')
+        ftn = tree.find(role="doc-backlink")
+        if ftn:
+            h = tree.new_tag(arg['tag'])
+            h.string = arg['heading']
+            # add <h3>Sources</h3> if endnotes exist
+            ftn.parent.parent.insert_before(h)
+            h.insert_after('\n')
+            run.article.ENDNOTES = h
+            lgr2.debug('%s <-- inserted before %s', h, ftn.parent.parent.name)
+
+            for a in run.lists.get(arg['notes'], []):
+                if a['role'] == 'doc-noteref':
+                    sup = a.find('sup')
+                    if sup:
+                        a.unwrap()                                  # unwrap to leave sup tag and contents intact
+                        run.article.event(lgr2, 'footnote ref', '%s --> %s', a, sup)
+                elif a['role'] == 'doc-backlink':
+                    run.article.event(lgr2, 'footnote backlink', 'deleting tag --> %s', a)
+                    a.decompose()                                   # removes the backlink entirely '<a>↩︎</a>'
+        else:
+            lgr2.debug('no footnotes..')
@@ -0,0 +1,331 @@
+'''
+The http conversion service, for --serve.
+'''
+import logging as log
+import os
+import re
+import json
+import time
+from pathlib import Path
+from .logger import lgr1, log_args, log_article
+from .bundle import IMAGE_STORED
+from .watch import Watcher
+
+
+class ServiceError(Exception):
+    '''
+    An http error status and message for Service to send back.
+    '''
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Service(object):
+    '''
+    # Service Class
+    Long-running http mode: editors upload a docx and get back a zip of the .htm and renamed images.
+    - `POST /convert?award=warc&name=131485` with the docx (or html) as the body, or as a `file`
+      field of a multipart form upload with an `award` field. `GET /health` reports the load.
+    - The event loop only reads and writes requests, conversions run on one pool of worker
+      processes for the whole run. Each worker keeps the Config (TAGS / SUBS, compiled headings,
+      backend) from when it started, and the pandoc server is shared as in batch runs.
+    - At most jobs + queue uploads are accepted at once, more get 503 with Retry-After straight
+      away, before their body is read. A slot is only freed when its conversion really finishes,
+      even if the request has timed out, so a stuck worker can't let work pile up behind it.
+    - A conversion taking longer than timeout gets 504, and its pandoc or magick run is stopped
+      once it has run that long, freeing the slot.
+    - Arguments:
+        - config: Config for every conversion.
+        - host, port: address to listen on.
+        - jobs: worker processes.
+        - queue: uploads to accept beyond the ones being converted.
+        - timeout: seconds allowed to read a request and to convert it.
+        - max_upload: largest upload in bytes, larger get 413.
+    '''
+
+    def __init__(self, config, host='127.0.0.1', port=8080, jobs=1, queue=None, timeout=120, max_upload=50 * 2**20):
+        self.config = config
+        self.host = host
+        self.port = port
+        self.jobs = max(jobs, 1)
+        self.queue = self.jobs * 2 if queue is None else queue
+        self.timeout = timeout
+        self.max_upload = max_upload
+        self.pool = None
+        self.slots = None
+        self.busy = 0                                               # uploads holding a slot
+        self.served = 0
+
+    def start_pool(self):
+        '''
+        Starts the worker processes, replacing a pool broken by a worker dying.
+        '''
+        from concurrent.futures import ProcessPoolExecutor
+        if self.pool:
+            self.pool.shutdown(wait=False)
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=service_init,
+                                        initargs=(self.config, self.timeout, *log_args()))
+
+    def run(self):
+        '''
+        Serves until interrupted with Ctrl+C or stopped with SIGTERM, then lets conversions in progress finish.
+        '''
+        import asyncio
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:                                   # Windows, where signal handlers can't be added
+            pass
+
+    async def serve(self):
+        '''
+        Starts the workers and the server, then waits for a stop signal.
+        '''
+        import signal
+        import asyncio
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        self.slots = asyncio.Semaphore(self.jobs + self.queue)
+        self.start_pool()
+        # start every worker now so the first uploads don't wait for them
+        await asyncio.gather(*(loop.run_in_executor(self.pool, os.getpid) for _ in range(self.jobs)))
+        handlers = set()
+
+        async def handle(reader, writer):
+            task = asyncio.current_task()
+            handlers.add(task)
+            try:
+                await self.handle(reader, writer)
+            finally:
+                handlers.discard(task)
+
+        server = await asyncio.start_server(handle, self.host, self.port)
+        log.info(f'serving on http://{self.host}:{self.port}/convert with {self.jobs} workers, Ctrl+C to stop')
+        try:
+            await stop.wait()
+        finally:
+            log.info(f'stopping, waiting for {self.busy} conversions in progress...')
+            server.close()
+            if handlers:
+                await asyncio.wait(handlers)
+            self.pool.shutdown(wait=True)
+
+    async def handle(self, reader, writer):
+        '''
+        Answers one request and closes the connection.
+        '''
+        import http
+        start = time.perf_counter()
+        request = '-'
+        headers = {'Content-Type': 'application/json'}
+        try:
+            method, url, head = await self.read_head(reader)
+            request = f'{method} {url.path}{"?" if url.query else ""}{url.query}'
+            status, extra, body = await self.respond(reader, method, url, head)
+            headers.update(extra)
+        except ServiceError as e:
+            status, body = e.status, json.dumps({'error': str(e)}).encode('utf-8')
+            if status == 503:
+                headers['Retry-After'] = '5'
+        except Exception as e:
+            log.error(f'service error: {type(e).__name__}: {e}')
+            status, body = 500, json.dumps({'error': f'{type(e).__name__}: {e}'}).encode('utf-8')
+        headers.update({'Content-Length': str(len(body)), 'Connection': 'close'})
+        head = f'HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n'
+        head += ''.join(f'{k}: {v}\r\n' for k, v in headers.items())
+        try:
+            writer.write(head.encode('latin-1') + b'\r\n' + body)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, OSError):                          # client went away
+            pass
+        log.info(f'{request} -> {status} ({time.perf_counter() - start:.2f}s)')
+
+    async def read_head(self, reader):
+        '''
+        Reads the request line and headers. Returns the method, parsed url and a dict of lower cased headers.
+        '''
+        import asyncio
+        import urllib.parse
+        try:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                if len(headers) >= 100:
+                    raise ServiceError(431, 'too many headers')
+                k, _, v = line.decode('latin-1').partition(':')
+                headers[k.strip().lower()] = v.strip()
+        except asyncio.TimeoutError:
+            raise ServiceError(408, 'timed out reading the request')
+        except (ValueError, asyncio.LimitOverrunError):
+            raise ServiceError(400, 'malformed request')
+        return method, urllib.parse.urlsplit(target), headers
+
+    async def respond(self, reader, method, url, headers):
+        '''
+        Routes a request, reading its body if it's an upload. Returns the status, extra headers and the body.
+        '''
+        import asyncio
+        import urllib.parse
+        from concurrent.futures.process import BrokenProcessPool
+        if url.path == '/health':
+            load = {'ok': True, 'jobs': self.jobs, 'busy': self.busy, 'slots': self.jobs + self.queue,
+                    'served': self.served}
+            return 200, {}, json.dumps(load).encode('utf-8')
+        if url.path != '/convert':
+            raise ServiceError(404, 'POST uploads to /convert')
+        if method != 'POST':
+            raise ServiceError(405, 'POST uploads to /convert')
+        if 'content-length' not in headers or 'chunked' in headers.get('transfer-encoding', ''):
+            raise ServiceError(411, 'a Content-Length is needed')
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ServiceError(400, 'bad Content-Length')
+        if length > self.max_upload:
+            raise ServiceError(413, f'uploads are limited to {self.max_upload // 2**20} MB')
+        if self.slots.locked():
+            raise ServiceError(503, 'busy, try again shortly')
+        await self.slots.acquire()
+        self.busy += 1
+        handed = False
+        try:
+            try:
+                body = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+            except asyncio.TimeoutError:
+                raise ServiceError(408, 'timed out reading the upload')
+            except asyncio.IncompleteReadError:
+                raise ServiceError(400, 'upload cut short')
+            query = dict(urllib.parse.parse_qsl(url.query))
+            data, fields = self.upload(body, headers.get('content-type', ''), query)
+            award, name = fields.get('award'), self.article_name(fields.get('name', 'article'))
+            if not award:
+                raise ServiceError(400, 'an award is needed, e.g. /convert?award=warc')
+            try:
+                self.config.award(award)
+            except ValueError as e:
+                raise ServiceError(400, str(e))
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(self.pool, service_convert, data, award, name)
+            fut.add_done_callback(self.release)
+            handed = True
+            try:
+                # shielded so a timeout leaves the conversion running and holding its slot
+                zipped, missing = await asyncio.wait_for(asyncio.shield(fut), self.timeout)
+            except asyncio.TimeoutError:
+                raise ServiceError(504, f'conversion took longer than {self.timeout}s')
+            except BrokenProcessPool as e:
+                log.error(f'worker died converting {name}, restarting workers')
+                self.start_pool()
+                raise ServiceError(500, f'worker died: {e}')
+            except Exception as e:
+                lgr1.error(f'failed -> {name}: {type(e).__name__}: {str(e).strip()}')
+                raise ServiceError(422, f'could not convert: {type(e).__name__}: {str(e).strip()}')
+        finally:
+            if not handed:
+                self.release()
+        self.served += 1
+        extra = {'Content-Type': 'application/zip', 'Content-Disposition': f'attachment; filename="{name}.zip"'}
+        if missing:
+            extra['X-Missing-Headings'] = urllib.parse.quote(', '.join(missing), safe=' ,')
+        lgr1.info(f'converted upload -> {name} ({len(zipped) / 1024:.0f} KB zip)')
+        return 200, extra, zipped
+
+    def release(self, fut=None):
+        '''
+        Frees an upload's slot, once its conversion has finished if it got that far.
+        '''
+        if fut is not None and not fut.cancelled():
+            fut.exception()                                         # retrieved so timed out failures aren't reported
+        self.busy -= 1
+        self.slots.release()
+
+    def upload(self, body, content_type, query):
+        '''
+        Returns the uploaded docx bytes or html text and a dict of fields (award, name), from the
+        query string and, for multipart form uploads, the form.
+        '''
+        import email.parser
+        import email.policy
+        fields = dict(query)
+        filename = None
+        if content_type.startswith('multipart/form-data'):
+            msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode('latin-1') + body)
+            data = None
+            for part in msg.iter_parts():
+                field = part.get_param('name', header='content-disposition')
+                if field == 'file':
+                    data, filename = part.get_payload(decode=True), part.get_filename()
+                elif field:
+                    fields.setdefault(field, part.get_content().strip())
+            if data is None:
+                raise ServiceError(400, 'no file field in the form')
+        else:
+            data = body
+        if filename:
+            fields.setdefault('name', Path(filename).stem)
+        if data[:4] == b'PK\x03\x04':
+            return data, fields
+        if (filename or '').casefold().endswith('.html') or 'html' in content_type:
+            try:
+                return data.decode('utf-8'), fields
+            except UnicodeDecodeError:
+                raise ServiceError(400, 'html uploads must be utf-8')
+        raise ServiceError(415, 'expected a .docx or .html upload')
+
+    @staticmethod
+    def article_name(name):
+        '''
+        Article ID for image and file names, with anything but letters, digits, - and _ removed.
+        '''
+        return re.sub(r'[^\w-]', '', Path(name).stem) or 'article'
+
+
+_service_config = None
+
+_service_timeout = None
+
+
+def service_init(config, timeout, *logging):
+    '''
+    Starts a Service worker, keeping its Config and timeout for every request. Ignores Ctrl+C as watch workers do.
+    '''
+    global _service_config, _service_timeout
+    Watcher.worker_init(*logging)
+    _service_config, _service_timeout = config, timeout
+    import bs4, pypandoc  # noqa: F401,E401 - loaded now rather than during the first request
+
+
+def service_convert(data, award, name):
+    '''
+    Converts one upload in a Service worker, stopping pandoc or magick once they run longer than the
+    service's timeout, so a request that gets 504 doesn't hold its worker for good.
+    Returns a zip of the .htm and images as bytes, and the award headings missing from the article.
+    '''
+    import io
+    import zipfile
+    with log_article(name):
+        Art = _service_config.article(data, award, name)
+        Art.TIMEOUT = _service_timeout
+        html = Art.convert(_service_config.optimiser)
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as z:
+        for image, content in Art.IMAGES.items():
+            stored = Path(image).suffix.casefold() in IMAGE_STORED
+            z.writestr(image, content, compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+        z.writestr(f'{name}.htm', html)
+    return out.getvalue(), Art.MISSING
@@ -0,0 +1,113 @@
+'''
+Paths, atomic writes and the memory limit, shared by the rest of the package.
+'''
+import logging as log
+import os
+import sys
+import re
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from .logger import lgr1
+
+
+def resource_path(relative_path):
+    '''Get absolute path to resource, works for dev and for PyInstaller.'''
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))                               # the folder JSON/ is in, above the package
+    return os.path.join(base_path, relative_path)
+    # base_path = Path(__file__).parent.parent
+    # return (base_path / relative_path).resolve()
+
+
+@contextmanager
+def atomic_path(path):
+    '''
+    Yields a hidden temp path next to path, moved over path once the block finishes without errors,
+    so anything watching the folder never sees half a file. The temp keeps the suffix for magick / Pillow.
+    '''
+    path = Path(path)
+    tmp = path.with_name(f'.{path.stem}.{os.getpid()}-{threading.get_ident()}{path.suffix}')
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def copy_atomic(src, dest):
+    '''
+    Copies a file so that dest only ever appears whole.
+    '''
+    import shutil
+    with atomic_path(dest) as tmp:
+        shutil.copyfile(src, tmp)
+
+
+# how pandoc and magick report running out of memory, e.g. under --max-memory
+OUT_OF_MEMORY = re.compile(r'out of memory|insufficient memory|unable to commit|cannot allocate memory', re.I)
+
+
+@contextmanager
+def memory_limit(mb):
+    '''
+    Limits the memory this process, and the pandoc and magick it starts, can take to mb MB while the block runs,
+    so a huge article fails with a MemoryError naming the limit instead of exhausting the machine.
+    Only in worker processes: the main one also runs the log listener and thread pools, which a low limit
+    would break, so run_batch() converts in a worker whenever there's a limit, even with one job.
+    Does nothing without mb, in the main process, or where resource limits aren't available (Windows).
+    '''
+    import multiprocessing
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if not mb or not resource or multiprocessing.current_process().name == 'MainProcess':
+        if mb and not resource:
+            lgr1.warning('--max-memory is not supported on this platform')
+        elif mb:
+            lgr1.warning('--max-memory only limits worker processes, not the main one')
+        yield
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_DATA)          # heap and private mappings, the address
+    limit = mb * 2**20                                              # space limit breaks pandoc's runtime
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_DATA, (limit, hard))
+    try:
+        yield
+    except MemoryError:
+        raise MemoryError(f'ran out of memory, over the --max-memory limit of {mb} MB') from None
+    except Exception as e:
+        if not OUT_OF_MEMORY.search(str(e)):
+            raise
+        raise MemoryError(f'pandoc ran out of memory, over the --max-memory limit of {mb} MB') from e
+    finally:
+        resource.setrlimit(resource.RLIMIT_DATA, (soft, hard))
+
+
+def pillow():
+    '''
+    Returns Pillow's Image module, or None if it isn't installed. Pillow is optional, magick converts
+    everything without it, and it's imported on first use as it's slow to load.
+    '''
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def load_json(file):
+    '''
+    Loads data from the specified json file.
+    '''
+    log.debug(f'loaded JSON: {file}')
+    try:
+        with open(resource_path(file)) as f:
+            data = json.load(f)
+            return data
+    except Exception as e:
+        log.error('error loading json:', e)
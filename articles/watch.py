@@ -0,0 +1,295 @@
+'''
+Converting files as they are dropped into a folder, for --watch.
+'''
+import logging as log
+import os
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from .util import atomic_path
+from .logger import log_args, log_worker
+from .article import ConversionCache
+from .bundle import AssetStore
+from .batch import log_result, process_file
+
+
+class Inotify(object):
+    '''
+    # Inotify Class
+    Minimal Linux inotify watch on one folder, called through libc so watch mode needs no extra packages.
+    Use Inotify.open(), which returns None where inotify isn't available (Windows, macOS) so callers can poll.
+    - Arguments:
+        - path: folder to watch, not recursive.
+    '''
+    EVENTS = 0x8 | 0x80 | 0x100 | 0x200             # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    HEADER = 'iIII'                                 # wd, mask, cookie, name length
+
+    def __init__(self, path):
+        import ctypes
+        import struct
+        self.header = struct.Struct(self.HEADER)
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(path)), self.EVENTS) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed: {path}')
+
+    @classmethod
+    def open(cls, path):
+        '''
+        Returns an Inotify for path, or None if the platform doesn't have it.
+        '''
+        try:
+            return cls(path)
+        except (OSError, AttributeError, TypeError) as e:
+            log.debug(f'no inotify, polling instead: {e}')
+            return None
+
+    def read(self, timeout):
+        '''
+        Waits up to timeout seconds for events. Returns the file names that changed.
+        '''
+        import select
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names, i = [], 0
+        while i < len(data):
+            _, _, _, size = self.header.unpack_from(data, i)
+            i += self.header.size
+            names.append(os.fsdecode(data[i:i + size].rstrip(b'\0')))
+            i += size
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher(object):
+    '''
+    # Watcher Class
+    Long-running watch mode: converts .docx and .html files as they're dropped into a folder.
+    - New or changed files are noticed with inotify, or by polling where there isn't inotify.
+      A full rescan still runs every RESCAN seconds to catch network shares that don't send events.
+    - A file is only converted once its size and modified time have settled for `settle` seconds,
+      so half-copied files are left alone. A docx that isn't a whole zip yet is given longer.
+    - Files are queued to one pool of worker processes for the whole run. Each worker is given TAGS / SUBS,
+      the compiled headings and rules once when it starts, and then only the path of each file.
+    - The size and modified time of each converted file are kept in a state file in the folder,
+      so a restart only converts what's new or changed. Failed files are retried once they change.
+    - Arguments:
+        - path: folder to watch, output goes to its htm folder as for a normal run.
+        - TAGS, SUBS, award: as for process().
+        - jobs: worker processes.
+        - interval: seconds between polls when there isn't inotify.
+        - settle: seconds a file must be unchanged before it's converted.
+        - opts: passed on to process().
+    '''
+    SUFFIXES = ('.docx', '.html')
+    STATE = '.convert_articles-watch.json'
+    RESCAN = 60
+
+    def __init__(self, path, TAGS, SUBS, award, jobs=1, interval=2.0, settle=2.0, **opts):
+        self.path = Path(path)
+        self.args = (TAGS, SUBS, award)
+        self.opts = opts
+        self.jobs = max(jobs, 1)
+        self.interval = interval
+        self.settle = settle
+        self.state_file = self.path / self.STATE
+        self.state = self.load_state()                              # file name --> stat and result
+        self.pending = {}                                           # path --> (stat, monotonic time first seen)
+        self.running = {}                                           # future --> (path, stat)
+
+    def load_state(self):
+        '''
+        Reads the state file left by a previous run.
+        '''
+        try:
+            with open(self.state_file, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            log.warning(f'ignoring unreadable state file: {self.state_file}')
+            return {}
+
+    def save_state(self):
+        '''
+        Writes the state file, whole or not at all.
+        '''
+        with atomic_path(self.state_file) as tmp, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+
+    def wanted(self, p):
+        '''
+        Inputs only, not Word lock files (~$name.docx), hidden files or our own temp files.
+        '''
+        return p.suffix.casefold() in self.SUFFIXES and not p.name.startswith(('~$', '.'))
+
+    @staticmethod
+    def stat(p):
+        '''
+        Size and modified time of a file, None if it's gone.
+        '''
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            return None
+        return [st.st_size, st.st_mtime_ns]
+
+    def scan(self):
+        '''
+        Looks over the whole folder, dropping state for files that have been removed.
+        '''
+        names = set()
+        for p in self.path.iterdir():
+            if self.wanted(p) and p.is_file():
+                names.add(p.name)
+                self.touch(p)
+        gone = [name for name in self.state if name not in names]
+        for name in gone:
+            del self.state[name]
+        if gone:
+            self.save_state()
+
+    def touch(self, p):
+        '''
+        Notes a file that may be new or changed.
+        '''
+        stat = self.stat(p)
+        if stat is None:
+            self.pending.pop(p, None)
+        elif self.state.get(p.name, {}).get('stat') != stat:
+            if self.pending.get(p, (None,))[0] != stat:
+                self.pending[p] = (stat, time.monotonic())
+
+    def ready(self):
+        '''
+        Returns the pending files that have settled and aren't already converting, with their stat.
+        '''
+        import zipfile
+        now = time.monotonic()
+        busy = {p for p, _ in self.running.values()}
+        files = []
+        for p, (stat, since) in list(self.pending.items()):
+            if p in busy or now - since < self.settle:
+                continue
+            current = self.stat(p)
+            if current is None or current == self.state.get(p.name, {}).get('stat'):
+                del self.pending[p]                                 # gone, or converted while it waited
+            elif current != stat:                                   # still being written
+                self.pending[p] = (current, now)
+            elif p.suffix.casefold() == '.docx' and not zipfile.is_zipfile(p) and now - since < self.settle * 10:
+                continue                                            # copy stalled before the end of the zip
+            else:
+                del self.pending[p]
+                files.append((p, stat))
+        return files
+
+    def submit(self, pool):
+        '''
+        Queues settled files on the worker pool.
+        '''
+        for p, stat in self.ready():
+            log.info(f'queued -> {p.name}')
+            self.running[pool.submit(watch_convert, p)] = (p, stat)
+
+    def collect(self, block=False):
+        '''
+        Records finished conversions in the state file.
+        '''
+        from concurrent.futures import wait
+        done = wait(self.running).done if block else [f for f in self.running if f.done()]
+        for fut in done:
+            p, stat = self.running.pop(fut)
+            try:
+                r = fut.result()
+            except Exception as e:                                  # worker died, try again next time
+                log.error(f'worker failed -> {p.name}: {e}')
+                continue
+            log_result(r)
+            self.state[p.name] = {'stat': stat, 'ok': r['ok'], 'converted': datetime.now().isoformat(timespec='seconds')}
+        if done:
+            self.save_state()
+            if self.opts.get('shared_assets'):
+                AssetStore(self.path / 'htm' / AssetStore.FOLDER).index()
+
+    @staticmethod
+    def worker_init(*logging):
+        '''
+        Workers ignore Ctrl+C and SIGTERM sent to the whole process group, so conversions
+        in progress finish while the watcher stops taking new ones. logging is log_args().
+        '''
+        import signal
+        log_worker(*logging)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    def run(self):
+        '''
+        Watches until interrupted with Ctrl+C or stopped with SIGTERM, then lets conversions in progress finish.
+        '''
+        import signal
+        from concurrent.futures import ProcessPoolExecutor
+        def stop(signum, frame):
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        notify = Inotify.open(self.path)
+        how = 'inotify' if notify else f'polling every {self.interval}s'
+        log.info(f'watching {self.path} for {" / ".join(self.SUFFIXES)} files ({how}), Ctrl+C to stop')
+        last_scan = last_evict = 0
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=watch_init,
+                                 initargs=(self.args, self.opts, *log_args())) as pool:
+            try:
+                while True:
+                    if time.monotonic() - last_scan >= (self.RESCAN if notify else self.interval):
+                        self.scan()
+                        last_scan = time.monotonic()
+                    if self.opts.get('cache_dir') and time.monotonic() - last_evict >= self.RESCAN:
+                        ConversionCache(self.opts['cache_dir'], self.opts['cache_size']).evict()
+                        last_evict = time.monotonic()
+                    self.collect()
+                    self.submit(pool)
+                    timeout = min(self.settle, 0.5) if self.pending or self.running else self.interval
+                    if notify:
+                        for name in notify.read(timeout):
+                            p = self.path / name
+                            if self.wanted(p):
+                                self.touch(p)
+                    else:
+                        time.sleep(timeout)
+            except KeyboardInterrupt:
+                log.info(f'stopping, waiting for {len(self.running)} conversions in progress...')
+            finally:
+                self.collect(block=True)
+                if notify:
+                    notify.close()
+
+
+_watch_job = None
+
+
+def watch_init(args, opts, *logging):
+    '''
+    Starts a Watcher worker, keeping TAGS, SUBS, award and the process() options for every file.
+    '''
+    global _watch_job
+    Watcher.worker_init(*logging)
+    _watch_job = args, opts
+
+
+def watch_convert(p):
+    '''
+    Converts one dropped file in a Watcher worker.
+    '''
+    args, opts = _watch_job
+    return process_file(p, *args, **opts)
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+'''
+Benchmark for Article.amend_html on long synthetic articles.
+
+    `python bench/bench_amend_html.py --paras 2000 --repeat 5`
+
+Builds raw html shaped like pandoc output (award headings, bold subheadings, images,
+lists, tables, comments and footnotes), then times amend_html, which cleans it as it goes,
+and prints the best and median run. With bleach installed it also times the original bleach
+clean_html and five walk amend_html kept in original_amend.py on the same html, and the speedup.
+'''
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import convert_articles as ca  # noqa: E402
+
+
+def make_html(paras, SUBS, award):
+    '''
+    Returns raw html for an article with roughly the given number of paragraphs.
+    '''
+    heads = [v for k, v in SUBS[award].items() if k != 'code'] + list(SUBS['All'].values())
+    out = []
+    for i in range(paras):
+        if i % 40 == 0:
+            out.append(f'<h2 id="h-{i}"><span class="anchor">{heads[(i // 40) % len(heads)]}</span></h2>')
+        if i % 15 == 0:
+            out.append(f'<p><strong>Subheading {i}</strong></p>')
+        if i % 25 == 0:
+            out.append(f'<p><img src="htm/media/{i}/media/image{i % 9 + 1}.png"/></p>')
+        if i % 30 == 0:
+            out.append('<ul>\n<li><p>First point.</p></li>\n<li><p>Second point.</p></li>\n</ul>')
+        if i % 50 == 0:
+            out.append('<table style="width:85%;">\n<thead>\n<tr>\n<th>Market</th>\n<th>Share</th>\n</tr>\n</thead>\n'
+                       '<tbody>\n<tr>\n<td><p>UK</p></td>\n<td>12%</td>\n</tr>\n</tbody>\n</table>\n<!-- table end -->')
+        note = f'<a href="#fn{i}" role="doc-noteref"><sup>{i}</sup></a>' if i % 20 == 0 else ''
+        out.append(f'<p>Paragraph {i} with <em>some</em> body text and a <strong>bold phrase.</strong>{note}</p>')
+    out.append('<ol>')
+    for i in range(0, paras, 20):
+        out.append(f'<li><p>Source {i}.<a href="#fnref{i}" role="doc-backlink">↩︎</a></p></li>')
+    out.append('</ol>')
+    return '\n'.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--paras', type=int, default=2000, help='paragraphs per article (default 2000)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs (default 5)')
+    parser.add_argument('--award', default='WARC Awards', help='award section of subs.json')
+    parser.add_argument('--profile', action='store_true', help='also print the time of each pass and rule')
+    args = parser.parse_args()
+
+    TAGS = ca.load_json('JSON/tags.json')
+    SUBS = ca.load_json('JSON/subs.json')
+    html = make_html(args.paras, SUBS, args.award)
+    Art = ca.Article.__new__(ca.Article)                            # no IN_FILE needed, skip __init__
+    Art.TAGS, Art.SUBS, Art.AWARD = TAGS, SUBS, args.award
+    Art.HEADINGS, Art.OUT_FILE, Art.PROFILER = ca.HeadingIndex(SUBS), Path('bench.htm'), None
+    Art.RULES, Art.EVENTS = ca.Rules.load(), {}
+    Art.IMGS = {f'image{i}.png': f'/fulltext/{SUBS[args.award]["code"]}/images/0f0{i}.png' for i in range(1, 10)}
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        Art.amend_html(html)
+        times.append(time.perf_counter() - start)
+    print(f'amend_html: {args.paras} paras, {len(html) / 1024:.0f} KB -> '
+          f'best {min(times):.3f}s, median {statistics.median(times):.3f}s over {args.repeat} runs')
+    try:
+        from original_amend import OriginalArticle
+    except ImportError:
+        print('original: not timed, needs bleach')
+    else:
+        Orig = OriginalArticle(TAGS, SUBS, args.award, Art.IMGS)
+        before = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            Orig.amend_html(Orig.clean_html(html))
+            before.append(time.perf_counter() - start)
+        print(f'original:   best {min(before):.3f}s, median {statistics.median(before):.3f}s -> '
+              f'{min(before) / min(times):.1f}x faster now')
+    if args.profile:
+        Art.PROFILER = ca.Profiler()
+        Art.amend_html(html)
+        for row in Art.PROFILER.report():
+            print(f"  {row['stage']:<36} {row['calls']:6} calls {row['wall']:7.3f}s wall {row['cpu']:7.3f}s cpu")
+
+
+if __name__ == '__main__':
+    main()
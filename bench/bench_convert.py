@@ -0,0 +1,307 @@
+#! /usr/bin/env python
+'''
+Benchmark for process() on a synthetic corpus of award entry docx files.
+
+    `python bench/bench_convert.py --files 10 --paras 300 --images 6 --formats png,tif,emf --save-baseline`
+    `python bench/bench_convert.py --files 10 --paras 300 --images 6 --formats png,tif,emf --threshold 0.15`
+
+Writes the docx files itself, no network or Word needed: bold award headings from subs.json and other
+subheadings, body paragraphs, footnotes, bullet lists and generated png / tif / emf images.
+Converts the corpus --repeat times with the cache off, then prints the best run's throughput and each
+stage's time from the Profiler. --save-baseline keeps the results in --baseline, later runs with the
+same corpus settings are compared to it and exit 1 if throughput drops by more than --threshold, or if
+any .htm or image differs from the baseline's, as the corpus is the same every time for the same settings.
+'''
+import os
+import sys
+import json
+import time
+import logging
+import zlib
+import random
+import struct
+import shutil
+import zipfile
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import convert_articles as ca  # noqa: E402
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG = 'http://schemas.openxmlformats.org/package/2006/relationships'
+TYPES = {'png': 'image/png', 'tif': 'image/tiff', 'emf': 'image/x-emf'}
+WORDS = ('brand campaign media audience growth sales share insight creative launch market consumer '
+         'research digital social reach awareness strategy budget channel value target engagement').split()
+EMU = 9525                                                          # per pixel at 96 dpi
+
+
+def make_png(width, height, rnd):
+    '''
+    Returns an RGB png of noisy bands, so it compresses like a photo rather than a flat fill.
+    '''
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\0' + bytes(rnd.getrandbits(8) if x % 7 else y % 256 for x in range(width * 3))
+                    for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows, 6)) + chunk(b'IEND', b''))
+
+
+def make_tif(width, height, rnd):
+    '''
+    Returns an uncompressed RGB tiff, like the scans editors paste in.
+    '''
+    pixels = bytes(rnd.getrandbits(8) for _ in range(width * height * 3))
+    bits = 8 + len(pixels)                                          # 8, 8, 8 bits per sample, then the IFD
+    tags = [(256, 4, 1, width), (257, 4, 1, height), (258, 3, 3, bits), (259, 3, 1, 1), (262, 3, 1, 2),
+            (273, 4, 1, 8), (277, 3, 1, 3), (278, 4, 1, height), (279, 4, 1, len(pixels))]
+    entries = b''.join(struct.pack('<HHII', *tag) for tag in tags)
+    return (b'II*\0' + struct.pack('<I', bits + 6) + pixels + struct.pack('<3H', 8, 8, 8)
+            + struct.pack('<H', len(tags)) + entries + b'\0\0\0\0')
+
+
+def make_emf(width, height, rnd):
+    '''
+    Returns an emf holding a filled rectangle, like a chart pasted from Excel.
+    '''
+    bounds = struct.pack('<4i', 0, 0, width, height)
+    frame = struct.pack('<4i', 0, 0, width * 26, height * 26)      # .01 mm
+    rect = struct.pack('<II', 43, 24) + struct.pack('<4i', rnd.randrange(width // 2), 0, width - 1, height - 1)
+    eof = struct.pack('<5I', 14, 20, 0, 16, 20)
+    size = 88 + len(rect) + len(eof)
+    header = (struct.pack('<II', 1, 88) + bounds + frame + b' EMF' + struct.pack('<IIIHH', 0x10000, size, 3, 0, 0)
+              + struct.pack('<III', 0, 0, 0) + struct.pack('<4i', 1920, 1080, 508, 286))
+    return header + rect + eof
+
+
+def paragraph(text, bold=False, note=None, numbered=False):
+    '''
+    Returns the xml of a docx paragraph, with a footnote reference on the end if note is given.
+    '''
+    props = '<w:pPr><w:numPr><w:ilvl w:val="0"/><w:numId w:val="1"/></w:numPr></w:pPr>' if numbered else ''
+    run = f'<w:r>{"<w:rPr><w:b/></w:rPr>" if bold else ""}<w:t xml:space="preserve">{text}</w:t></w:r>'
+    if note is not None:
+        run += f'<w:r><w:rPr><w:vertAlign w:val="superscript"/></w:rPr><w:footnoteReference w:id="{note}"/></w:r>'
+    return f'<w:p>{props}{run}</w:p>'
+
+
+def picture(n, rid, width, height):
+    '''
+    Returns the xml of a paragraph holding an inline image.
+    '''
+    cx, cy = width * EMU, height * EMU
+    return (f'<w:p><w:r><w:drawing><wp:inline><wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{n}" name="Picture {n}"/>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>'
+            f'<pic:nvPicPr><pic:cNvPr id="{n}" name="image{n}"/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            '<a:prstGeom prst="rect"/></pic:spPr></pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>')
+
+
+def make_docx(path, paras=200, headings=4, images=4, formats=('png',), footnotes=10, lists=4,
+              award='WARC Awards', SUBS=None, size=400, seed=0):
+    '''
+    Writes a docx with roughly paras body paragraphs, the first headings award headings of the award
+    in SUBS spread through it, footnotes and bullet lists of 3 items, and images cycling through formats.
+    '''
+    rnd = random.Random(seed)
+    heads = [v for k, v in SUBS[award].items() if k != 'code'] + list(SUBS['All'].values())
+    heads = (heads * (headings // len(heads) + 1))[:headings]
+    makers = {'png': make_png, 'tif': make_tif, 'emf': make_emf}
+    body, media, notes = [], {}, []
+    every = lambda count: max(paras // count, 1) if count else paras + 1  # noqa: E731
+
+    for i in range(paras):
+        if i % every(headings) == 0 and i // every(headings) < len(heads):
+            body.append(paragraph(heads[i // every(headings)], bold=True))
+        elif i % 12 == 0:
+            body.append(paragraph(f'Subheading {i}', bold=True))
+        if i % every(images) == 0 and len(media) < images:
+            fmt = formats[len(media) % len(formats)]
+            n = len(media) + 1
+            w, h = size, size * 2 // 3
+            media[f'rId{100 + n}'] = (f'image{n}.{fmt}', makers[fmt](w, h, rnd))
+            body.append(picture(n, f'rId{100 + n}', w, h))
+        if i % every(lists) == 0 and i // every(lists) < lists:
+            body.extend(paragraph(f'Point {j} about the {rnd.choice(WORDS)}.', numbered=True) for j in range(3))
+        note = None
+        if i % every(footnotes) == 0 and len(notes) < footnotes:
+            note = len(notes) + 1
+            notes.append(f'<w:footnote w:id="{note}"><w:p><w:r><w:t>Source {note}, WARC {2000 + note}.</w:t></w:r>'
+                         '</w:p></w:footnote>')
+        text = ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 60)))
+        body.append(paragraph(f'{text.capitalize()}.', note=note))
+
+    namespaces = (f'xmlns:w="{W}" xmlns:r="{R}" '
+                  'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+                  'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+                  'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"')
+    rels = [('rId1', 'styles', 'styles.xml'), ('rId2', 'numbering', 'numbering.xml'),
+            ('rId3', 'footnotes', 'footnotes.xml')]
+    rels += [(rid, 'image', f'media/{name}') for rid, (name, _) in media.items()]
+    files = {
+        '[Content_Types].xml': (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            + ''.join(f'<Default Extension="{ext}" ContentType="{kind}"/>' for ext, kind in TYPES.items())
+            + ''.join(f'<Override PartName="/word/{part}.xml" ContentType="application/vnd.openxmlformats-'
+                      f'officedocument.wordprocessingml.{kind}+xml"/>'
+                      for part, kind in (('document', 'document.main'), ('styles', 'styles'),
+                                         ('numbering', 'numbering'), ('footnotes', 'footnotes')))
+            + '</Types>'),
+        '_rels/.rels': (f'<Relationships xmlns="{PKG}"><Relationship Id="rId1" Type="{R}/officeDocument" '
+                        'Target="word/document.xml"/></Relationships>'),
+        'word/_rels/document.xml.rels': (
+            f'<Relationships xmlns="{PKG}">'
+            + ''.join(f'<Relationship Id="{rid}" Type="{R}/{kind}" Target="{target}"/>' for rid, kind, target in rels)
+            + '</Relationships>'),
+        'word/document.xml': f'<w:document {namespaces}><w:body>{"".join(body)}</w:body></w:document>',
+        'word/styles.xml': (f'<w:styles xmlns:w="{W}"><w:style w:type="paragraph" w:default="1" w:styleId="Normal">'
+                            '<w:name w:val="Normal"/></w:style></w:styles>'),
+        'word/numbering.xml': (f'<w:numbering xmlns:w="{W}"><w:abstractNum w:abstractNumId="0"><w:lvl w:ilvl="0">'
+                               '<w:start w:val="1"/><w:numFmt w:val="bullet"/><w:lvlText w:val="•"/></w:lvl>'
+                               '</w:abstractNum><w:num w:numId="1"><w:abstractNumId w:val="0"/></w:num></w:numbering>'),
+        'word/footnotes.xml': f'<w:footnotes xmlns:w="{W}">{"".join(notes)}</w:footnotes>',
+    }
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, xml in files.items():
+            z.writestr(name, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + xml)
+        for name, data in media.values():
+            z.writestr(f'word/media/{name}', data)
+
+
+def run(files, TAGS, SUBS, award, backend):
+    '''
+    Converts every file once with a Profiler each, returning the total seconds and the stage totals.
+    '''
+    results = []
+    start = time.perf_counter()
+    for f in files:
+        profiler = ca.Profiler()
+        ca.process(f, TAGS, SUBS, award, backend=backend, profiler=profiler)
+        results.append({'file': f.name, 'stages': profiler.report()})
+    return time.perf_counter() - start, ca.stage_totals(results)
+
+
+def outputs(folder):
+    '''
+    Returns the sha256 of each .htm and image written to folder/htm, by path.
+    '''
+    out = folder / 'htm'
+    return {p.relative_to(out).as_posix(): ca.Manifest.digest(p.read_bytes())
+            for p in sorted(out.rglob('*')) if p.is_file() and not p.name.startswith('.')}
+
+
+def compare(before, after):
+    '''
+    Returns a line for each output that's changed, gone or new since the baseline.
+    '''
+    changes = [f'changed {k}' for k in before if k in after and before[k] != after[k]]
+    changes += [f'missing {k}' for k in before if k not in after]
+    return changes + [f'new     {k}' for k in after if k not in before]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--files', type=int, default=10, help='docx files in the corpus (default 10)')
+    parser.add_argument('--paras', type=int, default=300, help='body paragraphs per file (default 300)')
+    parser.add_argument('--headings', type=int, default=4, help='award headings from subs.json per file (default 4)')
+    parser.add_argument('--images', type=int, default=6, help='images per file (default 6)')
+    parser.add_argument('--formats', default='png,tif,emf', help='image formats to cycle through (default png,tif,emf)')
+    parser.add_argument('--image-size', type=int, default=400, help='image width in pixels (default 400)')
+    parser.add_argument('--footnotes', type=int, default=20, help='footnotes per file (default 20)')
+    parser.add_argument('--lists', type=int, default=5, help='bullet lists per file (default 5)')
+    parser.add_argument('--award', default='WARC Awards', help='award section of subs.json')
+    parser.add_argument('--backend', choices=['pandoc', 'server'], default='pandoc', help='docx conversion backend')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs over the corpus (default 3)')
+    parser.add_argument('--keep', metavar='DIR', help='write the corpus and output here rather than a temp folder')
+    parser.add_argument('--baseline', default=str(Path(__file__).parent / 'baseline.json'),
+                        help='results to compare with (default bench/baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='fail if throughput drops by more than this fraction of the baseline (default 0.15)')
+    args = parser.parse_args()
+
+    formats = args.formats.split(',')
+    if set(formats) - set(TYPES):
+        parser.error(f'--formats can be {", ".join(TYPES)}')
+    if 'emf' in formats and not shutil.which('magick'):
+        print('note: magick not found, emf images will fail to convert and be kept as they are')
+    logging.disable(logging.ERROR)                                  # the failures above and missing headings
+    corpus = {k: getattr(args, k) for k in ('files', 'paras', 'headings', 'images', 'formats', 'image_size',
+                                            'footnotes', 'lists', 'award', 'backend')}
+    TAGS = ca.load_json('JSON/tags.json')
+    SUBS = ca.load_json('JSON/subs.json')
+    if args.backend == 'server':
+        os.environ['PANDOC_SERVER_URL'] = ca.pandoc_server().url
+
+    folder = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix='bench_convert-'))
+    folder.mkdir(parents=True, exist_ok=True)
+    try:
+        files = []
+        for n in range(args.files):
+            f = folder / f'{900000 + n}.docx'
+            make_docx(f, args.paras, args.headings, args.images, formats, args.footnotes, args.lists,
+                      args.award, SUBS, args.image_size, seed=n)
+            files.append(f)
+        size = sum(f.stat().st_size for f in files)
+        print(f'corpus: {args.files} files, {size / 2**20:.1f} MB in {folder}')
+        runs = [run(files, TAGS, SUBS, args.award, args.backend) for _ in range(args.repeat)]
+        written = outputs(folder)
+    finally:
+        if not args.keep:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    seconds, stages = min(runs, key=lambda r: r[0])
+    result = {'corpus': corpus, 'version': ca.__version__, 'seconds': round(seconds, 4),
+              'files_per_second': round(args.files / seconds, 3), 'stages': {t['stage']: t['wall'] for t in stages},
+              'outputs': written}
+    print(f'process: best {seconds:.2f}s, median {statistics.median(r[0] for r in runs):.2f}s over {args.repeat} runs '
+          f'-> {result["files_per_second"]:.2f} files/s')
+
+    baseline = None
+    path = Path(args.baseline)
+    if path.is_file() and not args.save_baseline:
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['corpus'] != corpus:
+            print(f'baseline {path} is for a different corpus, not comparing: {baseline["corpus"]}')
+            baseline = None
+    before = baseline['stages'] if baseline else {}
+    for stage, wall in result['stages'].items():
+        change = f' {(wall / before[stage] - 1) * 100:+6.1f}%' if before.get(stage) else ''
+        print(f'  {stage:<36} {wall / args.files * 1000:9.1f} ms per file{change}')
+
+    if args.save_baseline:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f'saved baseline -> {path}')
+    elif baseline:
+        failed = False
+        change = result['files_per_second'] / baseline['files_per_second'] - 1
+        print(f'throughput {change * 100:+.1f}% against baseline ({baseline["files_per_second"]:.2f} files/s, '
+              f'version {baseline["version"]})')
+        if change < -args.threshold:
+            print(f'FAIL: throughput dropped by more than {args.threshold * 100:.0f}%')
+            failed = True
+        changes = compare(baseline['outputs'], written) if 'outputs' in baseline else None
+        if changes is None:
+            print('baseline has no outputs to compare, save it again to check them')
+        elif changes:
+            print(f'FAIL: {len(changes)} of {len(written)} outputs differ from the baseline')
+            for line in changes[:20]:
+                print(f'  {line}')
+            failed = True
+        else:
+            print(f'output: all {len(written)} .htm and images identical to the baseline')
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+'''
+Startup benchmark for the convert_articles cli.
+
+    `python bench/bench_startup.py --repeat 10 --budget 100`
+
+Times fresh interpreters running `convert.py --version` and a bare `import convert_articles`,
+printing the best and median run of each next to an empty interpreter for reference. Also checks that
+importing the module loads none of the slow dependencies and creates no logs folder.
+Exits 1 if `--version` is over the budget or a check fails, so it can hold the startup time in CI.
+'''
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import compileall
+import py_compile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODULE = ROOT / 'convert_articles.py'
+PACKAGE = ROOT / 'articles'
+SCRIPT = ROOT / 'convert.py'                                        # imports MODULE, so its bytecode is cached
+HEAVY = ['bs4', 'pypandoc', 'natsort', 'PIL', 'urllib.request', 'zipfile', 'concurrent.futures.process']
+CHECK = ('import sys, convert_articles; '
+         f'print(" ".join(m for m in {HEAVY!r} if m in sys.modules))')
+
+
+def timed(cmd, repeat):
+    '''
+    Returns the wall times in ms of running cmd repeat times, after one untimed warm up run.
+    '''
+    subprocess.run(cmd, cwd=ROOT, capture_output=True, check=True)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, capture_output=True, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs of each command (default 10)')
+    parser.add_argument('--budget', type=float, default=100, help='most ms allowed for --version (default 100)')
+    args = parser.parse_args()
+
+    # imports use the cached bytecode like an installed copy would, even with PYTHONDONTWRITEBYTECODE set
+    py_compile.compile(str(MODULE), cfile=None, doraise=True)
+    compileall.compile_dir(str(PACKAGE), quiet=1)
+    logs = (ROOT / 'logs').exists()
+    runs = {
+        'python -c pass': [sys.executable, '-c', 'pass'],
+        'import convert_articles': [sys.executable, '-c', 'import convert_articles'],
+        'convert.py --version': [sys.executable, str(SCRIPT), '--version'],
+    }
+    results = {}
+    for name, cmd in runs.items():
+        times = results[name] = timed(cmd, args.repeat)
+        print(f'{name:<32} best {min(times):6.1f} ms, median {statistics.median(times):6.1f} ms')
+
+    failed = []
+    best = min(results['convert.py --version'])
+    if best > args.budget:
+        failed.append(f'--version took {best:.1f} ms, budget is {args.budget:.0f} ms')
+    loaded = subprocess.run([sys.executable, '-c', CHECK], cwd=ROOT, capture_output=True, text=True,
+                            check=True, env={**os.environ, 'PYTHONPATH': str(ROOT)}).stdout.split()
+    if loaded:
+        failed.append(f'importing loads {", ".join(loaded)}, import them where they are used')
+    if not logs and (ROOT / 'logs').exists():
+        failed.append('importing or --version made a logs folder, log_setup should only run in main()')
+    for f in failed:
+        print(f'FAIL: {f}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+'''
+The original Article.clean_html and amend_html, from before the single pass rewrite, for
+bench_amend_html.py to time the current code against. Copied unchanged, needs bleach, which
+the cli no longer does.
+'''
+import logging as log
+
+import bleach
+from bs4 import BeautifulSoup as Soup
+
+lgr1 = log.getLogger('ArticleClass')
+lgr2 = log.getLogger('amend_html')
+
+
+class OriginalArticle(object):
+    '''
+    # OriginalArticle Class
+    - Arguments:
+        - TAGS: allowed html tags and attributes for bleach.
+        - SUBS: substitutes for h3 headings.
+        - AWARD: award section of SUBS.
+        - IMGS: image name --> new src.
+    '''
+
+    def __init__(self, TAGS, SUBS, AWARD, IMGS):
+        self.TAGS = TAGS
+        self.SUBS = SUBS
+        self.AWARD = AWARD
+        self.IMGS = IMGS
+
+    def clean_html(self, content):
+        '''
+        Uses the bleach module to clean unwanted html tags and limit attributes of allowed tags.
+        Tags and attributes are stored in json folder under '/json/tags.json'.
+        '''
+        content = bleach.clean(
+            content,
+            attributes=self.TAGS['attrs'],
+            tags=self.TAGS['tags'],
+            strip=True
+        )
+        lgr1.debug('cleaned html')
+        return content
+
+    def amend_html(self, content):
+        '''
+        Parses cleaned html content from docx, running replacements to correct headings.
+        Heading substitutes are stored in json folder under '/json/subs.json'.
+        Also contains the award code variable for inserting in <img src""/>.
+        '''
+
+        def wrap_img(tag):
+            '''Wraps img in p tags.'''
+            tag.wrap(tree.new_tag('p'))
+            lgr2.debug(f'wrapped ^^^')
+
+        def space_tag(tag):
+            '''Spaces a tag with newlines before and after.'''
+            try:
+                tag.insert_before('\n')
+                tag.insert_after('\n')
+            except NotImplementedError as e:
+                lgr2.warning(f"couldn't space tag: {tag}")
+
+        def amend_images(tree):
+            '''If images exist, replace the source attribute to renamed image and ensure in its own paragraph.'''
+            images = tree.find_all('img')
+            lgr2.debug(f"article images: {images}")
+            if images:
+                for ig in images:
+                    try:
+                        src = ig['src']
+                        for k, v in self.IMGS.items():
+                            if k in src:
+                                # set original <img src=""> attribute to new variable
+                                ig['src'] = src.replace(src, v)
+                                lgr2.debug(f'<img src="{k}"> --> <img src="{v}">')
+                    except KeyError as e:
+                        lgr2.error('img caught key error')
+                        lgr2.debug(e)
+                    try:
+                        prt = ig.parent
+                        if ig.parent.name == 'p':
+                            space_tag(prt)
+                            # insert all images outside of p tag to wrap them properly in p tags.
+                            prt.insert_after(ig)
+                            wrap_img(ig)
+                            # strip whitespace and remove p tag if empty
+                            if len(prt.get_text(strip=True)) == 0:
+                                prt.unwrap()
+                                lgr2.debug(f'cut {prt}')
+                            # space_tag(ig)
+                        else:
+                            space_tag(ig)
+                            wrap_img(ig)
+                    except ValueError as e:
+                        lgr2.error('img caught value error')
+                        lgr2.debug(e)
+            else:
+                lgr2.debug('no images...')
+
+        def amend_headers_unify(tree):
+            '''Makes all headers bold paragraphs.'''
+            headers = tree.find_all(['h1', 'h2', 'h3', 'h4', 'h5'])
+            if not headers:
+                lgr2.debug('no header tags to replace...')
+            else:
+                for hdr in headers:
+                    if hdr:
+                        try:
+                            hdr.string.wrap(tree.new_tag('strong'))
+                            hdr.name = 'p'
+                            lgr2.debug(f'header --> {hdr}')
+                        except AttributeError as e:
+                            lgr2.warning(f'Problem with header --> {e}')
+            # match all p tags with bold and check punctuation endings to filter bold sentences from subheadings in h5
+            lgr2.debug('changing all subheadings to h5...')
+            paras = tree.find_all('p')
+            for p in paras:
+                if p.find('strong'):
+                    if p.text.endswith((".", ",", ":", ";", "?")):      # regex this
+                        pass
+                    else:
+                        p.strong.unwrap()
+                        p.name = 'h5'
+                        lgr2.debug(f'<p><strong> --> {p}')
+
+        def amend_headers_replace(tree):
+            '''Runs replacements on headers.'''
+            replace = {                                             # merge award specific headers
+                # with generic headers
+                **self.SUBS[self.AWARD],
+                **self.SUBS['All']
+            }
+            lgr2.debug('changing award subheadings to h3...')
+            h5s = tree.find_all('h5')
+            for h5 in h5s:
+                space_tag(h5)
+                for k, v in replace.items():
+                    if h5.text.casefold().strip().replace("’", "'") == v.casefold():  # replace apostrophe to match Client's view
+                        h5.name = 'h3'
+                        lgr2.debug(f'<h5> --> {h5}')
+
+        def amend_lists(tree):
+            '''Removes paragraph tags within list elements.'''
+            lgr2.debug('checking list elements...')
+            for li in tree.find_all('li'):
+                if li.find('p'):
+                    li.p.unwrap()
+                    lgr2.debug(f'<li><p> --> {li}')
+
+        def amend_footnotes(tree):
+            '''Removes anchor tags from footnotes and endnotes section and adds h3 header to endnotes.'''
+            lgr2.debug('amending footnotes...')
+            ftn = tree.find(role="doc-backlink")
+            if ftn:
+                h3 = tree.new_tag('h3')
+                h3.string = 'Sources'
+                # add <h3>Sources</h3> if endnotes exist
+                ftn.parent.parent.insert_before(h3)
+                h3.insert_after('\n')
+                lgr2.debug(f'{h3} <-- inserted before {ftn.parent.parent.name}')
+
+                for a in tree.find_all('a'):
+                    if a.has_attr('role'):
+                        if a['role'] == 'doc-noteref':
+                            sup = a.find('sup')
+                            if sup:
+                                a.unwrap()                          # unwrap to leave sup tag and contents intact
+                                lgr2.debug(f'{a} --> {sup}')
+                        elif a['role'] == 'doc-backlink':
+                            lgr2.debug(f'deleting tag --> {a}')
+                            a.decompose()                           # removes the backlink entirely '<a>↩︎</a>'
+            else:
+                lgr2.debug('no footnotes..')
+
+        tree = Soup(content, "html.parser")
+        amend_images(tree)
+        amend_headers_unify(tree)
+        amend_headers_replace(tree)
+        amend_lists(tree)
+        amend_footnotes(tree)
+        return tree
+
@@ -0,0 +1,13 @@
+#! /usr/bin/env python
+'''
+Command line entry point, the same as running convert_articles.py but quicker to start.
+
+    `./convert.py "test/131485.docx" "warc"`
+
+Python compiles a script it's given every time it runs, and convert_articles.py is long, whereas an
+imported module's bytecode is cached in __pycache__. This just imports it and runs main().
+'''
+from convert_articles import main
+
+if __name__ == '__main__':
+    main()
@@ -1,350 +1,31 @@
 #! /usr/bin/env python
 import logging as log
 import os
-import sys
-import json
-import bleach
-import pypandoc
-import subprocess
-from bs4 import BeautifulSoup as Soup
-from natsort import natsorted as nat
-from datetime import datetime
+import time
+import argparse
+from contextlib import nullcontext
 from pathlib import Path
-from glob import glob
-
-
-def resource_path(relative_path):
-    '''Get absolute path to resource, works for dev and for PyInstaller.'''
-    base_path = getattr(sys, '_MEIPASS', os.path.dirname(
-        os.path.abspath(__file__)))
-    return os.path.join(base_path, relative_path)
-    # base_path = Path(__file__).parent
-    # return (base_path / relative_path).resolve()
-
-
-def log_setup(
-    first_log,      # name of logger for section of project e.g. 'Article class'
-    second_log      # second logger section e.g. 'amend_html'
-):
-    '''
-    Makes log directory and sets logger file.
-    Uses 'log' for main app, lgr1 for Article Class.
-    '''
-    fd = 'logs'                                                     # folder name
-    # log directory
-    ld = Path(__file__).parent / fd
-    # ensure exists
-    ld.mkdir(exist_ok=True)
-    fn = Path(__name__).with_suffix(
-        '.log')                         # app filename
-    # path for log file
-    lp = fd + '/%d_%m_%Y - (%H-%M-%S) - ' + f'{fn}'
-    # log name formatted
-    nm = datetime.now().strftime(lp)
-    log.basicConfig(
-        # set up logging to file
-        level=log.DEBUG,
-        format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
-        datefmt='%m-%d %H:%M',
-        handlers=[log.FileHandler(nm, 'w', 'utf-8')]
-        # filename=nm,
-        # filemode='w',
-    )
-
-    # set a simpler format for console
-    fm = log.Formatter('%(name)-12s: %(levelname)-8s > %(message)s')
-    # define a Handler as console
-    cs = log.StreamHandler()
-    # write INFO messages or higher to the sys.stderr
-    cs.setLevel(log.INFO)
-    # tell the handler to use this format
-    cs.setFormatter(fm)
-    # add the handler to the root logger
-    log.getLogger('').addHandler(cs)
-
-    # Define loggers for different areas of application
-    lgr1 = log.getLogger(first_log)
-    # trag where stuff is happening in logs
-    lgr2 = log.getLogger(second_log)
-    lgr1.debug(f'defined lgr1: {lgr1}')
-    lgr2.debug(f'defined lgr2: {lgr2}')
-    # log to root
-    log.debug('setup logging')
-    return lgr1, lgr2
-
-
-lgr1, lgr2 = log_setup(first_log='ArticleClass',
-                       second_log='amend_html')
-
-
-class Article(object):
-    '''
-    # Article Class
-    - Arguments:
-        - IN_FILE: specify docx or html file.
-        - TAGS: specify tags and attributes for bleach module in json file.
-        - SUBS: specify substitutions for h3 headings in html.
-    '''
-
-    def __init__(
-        self,
-        IN_FILE,  # user input filename
-        TAGS,     # allowed html tags and attributes for bleach module
-        SUBS,     # substitute awards headers, also loaded in from JSON
-        AWARD     # user input award - warc / media / mena / asia
-    ):
-        # super(Article, self).__init__()
-        content = None  # html content variable to update\\\\\\\\\\\\\\\\\\\\\\
-        self.IMGS = {}  # image names for renaming passed in when extracted from docx
-        self.TAGS = TAGS
-        self.SUBS = SUBS
-        self.AWARD = AWARD
-        self.IN_FILE = IN_FILE
-        # award-specific code to go in img src tags
-        self.AWARD_CODE = SUBS[AWARD]['code']
-        # path for extracting docximages to
-        self.MEDIA_PATH = IN_FILE.parent / 'htm'
-        self.OUT_FILE = Path(f"{self.MEDIA_PATH}/{IN_FILE.stem}.htm")
-        try:
-            # ensure directory for img / htm extraction exists
-            self.MEDIA_PATH.mkdir(exist_ok=False)
-            lgr1.info(f'made dir: {self.MEDIA_PATH}')
-        except FileExistsError as e:
-            lgr1.debug(f'dir exists: {self.MEDIA_PATH}')
-
-    def convert_docx(
-        self,
-        extract_media=True  # default extract images from docx, toggle false if don't want images
-    ):
-        '''
-        Uses the pypandoc module to convert docx file to html content for parsing and extracts images.
-        '''
-        if extract_media:
-            lgr1.debug('converting docx to html and extracting images...')
-            extra_args = [f'--extract-media={self.MEDIA_PATH}']
-        else:
-            lgr1.debug('converting docx to html...')
-            extra_args = []
-        # find a way to extract to same folder rather than 'ID/media'
-        content = pypandoc.convert_file(
-            str(self.IN_FILE), 'html5', extra_args=extra_args)
-        return content
-
-    @staticmethod
-    def image_cleanup(image):
-        '''
-        Convert images that are tiff, tif or emf to jpgs.
-        '''
-        new_img = image.with_suffix('.jpg')
-        cmd = ['magick', str(image), str(new_img)]
-        subprocess.call(cmd, shell=True)
-        lgr1.debug(f"converted: '{image.name}' --> '{new_img.name}'")
-
-    def rename_docx_images(self):
-        '''
-        Rename extracted images.
-        Returns old img path and new img filename in a dict for subtitution in html.
-        '''
-        path = self.MEDIA_PATH
-        ID = self.OUT_FILE.stem  # f.parent.parent.name # to get /<ID> rather than /media
-        lgr1.debug(f'ID = {ID}')
-        lgr1.debug('renaming images...')
-        files = {p.resolve() for p in Path(path).glob(r"**/image*") if p.suffix.casefold()
-                 in [".jpeg", ".jpg", ".png", ".gif", ".emf", ".tiff", ".tif"]}
-        if not files:
-            lgr1.debug('no images to rename')
-        else:
-            for f in nat(files):
-                name = f.stem
-                ext = f.suffix
-                nums = [i for i in list(name) if i.isdigit()]
-                num = ''.join(nums)
-                n = "f" + num.zfill(2)
-                fn = f"{ID}{n}{ext}"
-                fp = path / fn
-                lgr1.debug(fp)
-                if f.parent.name == 'media':
-                    try:
-                        # convert unwanted images
-                        if f.suffix.endswith(('.emf', '.tiff', '.tif')):
-                            self.image_cleanup(f)
-                            # change extension to jpg
-                            fn = fn.replace(ext, '.jpg')
-                            fp = path / fn
-                        f.rename(fp)
-                        lgr1.debug(f'"{f.name}" --> {fn}')
-                        self.IMGS.update({f.name: f"/fulltext/{self.AWARD_CODE}/images/{fn}"})
-                    # catch renaming files that are already there
-                    except FileExistsError as e:
-                        lgr1.warning(f'img exists already: {f}')
-                else:
-                    self.IMGS.update({f.name: f"/fulltext/{self.AWARD_CODE}/images/{fn}"})
-            lgr1.debug(f'{self.IMGS}')
-            lgr1.info(f"renamed: {len(self.IMGS)} images")
-
-    def clean_html(self, content):
-        '''
-        Uses the bleach module to clean unwanted html tags and limit attributes of allowed tags.
-        Tags and attributes are stored in json folder under '/json/tags.json'.
-        '''
-        content = bleach.clean(
-            content,
-            attributes=self.TAGS['attrs'],
-            tags=self.TAGS['tags'],
-            strip=True
-        )
-        lgr1.debug('cleaned html')
-        return content
-
-    def amend_html(self, content):
-        '''
-        Parses cleaned html content from docx, running replacements to correct headings.
-        Heading substitutes are stored in json folder under '/json/subs.json'.
-        Also contains the award code variable for inserting in <img src""/>.
-        '''
-
-        def wrap_img(tag):
-            '''Wraps img in p tags.'''
-            tag.wrap(tree.new_tag('p'))
-            lgr2.debug(f'wrapped ^^^')
-
-        def space_tag(tag):
-            '''Spaces a tag with newlines before and after.'''
-            try:
-                tag.insert_before('\n')
-                tag.insert_after('\n')
-            except NotImplementedError as e:
-                lgr2.warning(f"couldn't space tag: {tag}")
-
-        def amend_images(tree):
-            '''If images exist, replace the source attribute to renamed image and ensure in its own paragraph.'''
-            images = tree.find_all('img')
-            lgr2.debug(f"article images: {images}")
-            if images:
-                for ig in images:
-                    try:
-                        src = ig['src']
-                        for k, v in self.IMGS.items():
-                            if k in src:
-                                # set original <img src=""> attribute to new variable
-                                ig['src'] = src.replace(src, v)
-                                lgr2.debug(f'<img src="{k}"> --> <img src="{v}">')
-                    except KeyError as e:
-                        lgr2.error('img caught key error')
-                        lgr2.debug(e)
-                    try:
-                        prt = ig.parent
-                        if ig.parent.name == 'p':
-                            space_tag(prt)
-                            # insert all images outside of p tag to wrap them properly in p tags.
-                            prt.insert_after(ig)
-                            wrap_img(ig)
-                            # strip whitespace and remove p tag if empty
-                            if len(prt.get_text(strip=True)) == 0:
-                                prt.unwrap()
-                                lgr2.debug(f'cut {prt}')
-                            # space_tag(ig)
-                        else:
-                            space_tag(ig)
-                            wrap_img(ig)
-                    except ValueError as e:
-                        lgr2.error('img caught value error')
-                        lgr2.debug(e)
-            else:
-                lgr2.debug('no images...')
-
-        def amend_headers_unify(tree):
-            '''Makes all headers bold paragraphs.'''
-            headers = tree.find_all(['h1', 'h2', 'h3', 'h4', 'h5'])
-            if not headers:
-                lgr2.debug('no header tags to replace...')
-            else:
-                for hdr in headers:
-                    if hdr:
-                        try:
-                            hdr.string.wrap(tree.new_tag('strong'))
-                            hdr.name = 'p'
-                            lgr2.debug(f'header --> {hdr}')
-                        except AttributeError as e:
-                            lgr2.warning(f'Problem with header --> {e}')
-            # match all p tags with bold and check punctuation endings to filter bold sentences from subheadings in h5
-            lgr2.debug('changing all subheadings to h5...')
-            paras = tree.find_all('p')
-            for p in paras:
-                if p.find('strong'):
-                    if p.text.endswith((".", ",", ":", ";", "?")):      # regex this
-                        pass
-                    else:
-                        p.strong.unwrap()
-                        p.name = 'h5'
-                        lgr2.debug(f'<p><strong> --> {p}')
-
-        def amend_headers_replace(tree):
-            '''Runs replacements on headers.'''
-            replace = {                                             # merge award specific headers
-                # with generic headers
-                **self.SUBS[self.AWARD],
-                **self.SUBS['All']
-            }
-            lgr2.debug('changing award subheadings to h3...')
-            h5s = tree.find_all('h5')
-            for h5 in h5s:
-                space_tag(h5)
-                for k, v in replace.items():
-                    if h5.text.casefold().strip().replace("’", "'") == v.casefold():  # replace apostrophe to match Client's view
-                        h5.name = 'h3'
-                        lgr2.debug(f'<h5> --> {h5}')
-
-        def amend_lists(tree):
-            '''Removes paragraph tags within list elements.'''
-            lgr2.debug('checking list elements...')
-            for li in tree.find_all('li'):
-                if li.find('p'):
-                    li.p.unwrap()
-                    lgr2.debug(f'<li><p> --> {li}')
-
-        def amend_footnotes(tree):
-            '''Removes anchor tags from footnotes and endnotes section and adds h3 header to endnotes.'''
-            lgr2.debug('amending footnotes...')
-            ftn = tree.find(role="doc-backlink")
-            if ftn:
-                h3 = tree.new_tag('h3')
-                h3.string = 'Sources'
-                # add <h3>Sources</h3> if endnotes exist
-                ftn.parent.parent.insert_before(h3)
-                h3.insert_after('\n')
-                lgr2.debug(f'{h3} <-- inserted before {ftn.parent.parent.name}')
-
-                for a in tree.find_all('a'):
-                    if a.has_attr('role'):
-                        if a['role'] == 'doc-noteref':
-                            sup = a.find('sup')
-                            if sup:
-                                a.unwrap()                          # unwrap to leave sup tag and contents intact
-                                lgr2.debug(f'{a} --> {sup}')
-                        elif a['role'] == 'doc-backlink':
-                            lgr2.debug(f'deleting tag --> {a}')
-                            a.decompose()                           # removes the backlink entirely '<a>↩︎</a>'
-            else:
-                lgr2.debug('no footnotes..')
-
-        tree = Soup(content, "html.parser")
-        amend_images(tree)
-        amend_headers_unify(tree)
-        amend_headers_replace(tree)
-        amend_lists(tree)
-        amend_footnotes(tree)
-        return tree
-
-    def write_html(self, content):
-        '''
-        Outputs cleaned and amended html content to specified file name.
-        Pass in file name and html contents.
-        '''
-        f = self.OUT_FILE
-        with open(f, 'w', encoding='utf-8') as f:
-            f.write(str(content))
-            lgr1.info(f'wrote file -> {f.name}')
+from articles import __version__
+from articles.util import load_json, pillow
+from articles.logger import lgr1, log_setup
+from articles.pandoc import pandoc_server, PandocServer
+from articles.markup import HeadingIndex, Sanitizer
+from articles.rules import Rules
+from articles.article import Article, ConversionCache, ImageOptimiser, Profiler
+from articles.bundle import AssetStore, Bundle, Manifest
+from articles.document import Document
+from articles.batch import Config, convert, find_award, log_summary, process, run_batch, stage_totals, write_report, \
+    write_trace
+from articles.preflight import log_preflight, run_preflight
+from articles.jobs import JobQueue, run_jobs
+from articles.legacy import run_legacy
+from articles.watch import Watcher
+from articles.service import Service
+# everything else is imported where it's used, so the cli starts fast and importing this has no side effects
+
+# the library api, the rest of articles/ can be imported from its modules
+__all__ = ['__version__', 'Article', 'Config', 'convert', 'Document', 'HeadingIndex', 'ImageOptimiser', 'load_json',
+           'Manifest', 'pandoc_server', 'process', 'Profiler', 'Rules', 'Sanitizer', 'stage_totals']
 
 
 def load_infile(infile):
@@ -369,12 +50,8 @@ def load_award(a, SUBS):
     Runs validation on award input by sys.argv[2] to return correct award code from SUBS json.
     '''
     log.debug(f'award argument: {a}')
-    # unpacks keys into list
-    keys = [*SUBS.keys()]
-    # keep only award sections of subs.json
-    keys.remove('All')
-    for k in filter(lambda k: a.casefold() in k.casefold(), keys):  # casefold to match case
-        award = k
+    award = find_award(a, SUBS)
+    if award:
         log.info(f'award -> {award}')
         return award
     else:
@@ -382,37 +59,103 @@ def load_award(a, SUBS):
         raise SystemExit
 
 
-def load_json(file):
+def parse_args(args=None):
     '''
-    Loads data from the specified json file.
+    Parses command line arguments. infile and award are prompted for if not given.
     '''
-    log.debug(f'loaded JSON: {file}')
-    try:
-        with open(resource_path(file)) as f:
-            data = json.load(f)
-            return data
-    except Exception as e:
-        log.error('error loading json:', e)
-
-
-def process(infile, TAGS, SUBS, award):
-    Art = Article(
-        IN_FILE=infile,
-        TAGS=TAGS,
-        SUBS=SUBS,
-        AWARD=award
-    )
-    if infile.suffix == '.docx':
-        content = Art.convert_docx(extract_media=True)
-        Art.rename_docx_images()
-    elif infile.suffix == '.html':
-        with open(infile, encoding='utf-8') as f:
-            content = f.read()
-    cleaned = Art.clean_html(content)
-    amended = Art.amend_html(cleaned)  # .prettify()
-    Art.write_html(amended)
-    cleanup_folder = Art.MEDIA_PATH / 'media'
-    return cleanup_folder
+    parser = argparse.ArgumentParser(
+        description='Convert edited docx articles to html and correctly named images.')
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+    parser.add_argument('infile', nargs='?', help='docx / html file, or directory of docx files')
+    parser.add_argument('award', nargs='?', help='award scheme - "warc" "mena" "asia" "media"')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes for directory inputs (default 1)')
+    parser.add_argument('--backend', choices=['pandoc', 'server'], default='pandoc',
+                        help="docx conversion - 'pandoc' runs pandoc per file, 'server' keeps "
+                             "one pandoc server warm for the whole run (default pandoc)")
+    parser.add_argument('--fuzzy-headings', type=float, default=0, metavar='CUTOFF',
+                        help='also match near miss award headings, similarity 0-1 e.g. 0.9 (default off)')
+    parser.add_argument('--outputs', type=lambda v: [f for f in v.split(',') if f], default=[], metavar='FORMATS',
+                        help=f'also write these next to each .htm from the same parse, comma separated: '
+                             f'{", ".join(Document.FORMATS)}')
+    parser.add_argument('--rules', default=Rules.FILE, metavar='FILE',
+                        help=f'rules file for amending the html, see README (default {Rules.FILE})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='reconvert every file rather than restoring unchanged ones from the cache')
+    parser.add_argument('--cache-dir', default=str(Path(__file__).parent / 'cache'),
+                        help='conversion cache directory (default ./cache next to this script)')
+    parser.add_argument('--cache-size', type=int, default=500,
+                        help='maximum cache size in MB before least recently used entries are evicted')
+    parser.add_argument('--optimise-images', action='store_true',
+                        help='resize and recompress jpeg / png images for the web, needs Pillow')
+    parser.add_argument('--max-width', type=int, default=1600,
+                        help='with --optimise-images, scale down images wider than this in pixels (default 1600)')
+    parser.add_argument('--quality', type=int, default=85,
+                        help='with --optimise-images, jpeg, webp and avif quality 1-95 (default 85)')
+    parser.add_argument('--webp', action='store_true',
+                        help='with --optimise-images, also write a .webp of each image next to it')
+    parser.add_argument('--avif', action='store_true',
+                        help='with --optimise-images, also write a .avif of each image next to it')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and convert .docx / .html files as they are dropped into the infile directory')
+    parser.add_argument('--interval', type=float, default=2,
+                        help='with --watch, seconds between checks of the folder where inotify is not available (default 2)')
+    parser.add_argument('--settle', type=float, default=2,
+                        help='with --watch, seconds a file must be unchanged before it is converted (default 2)')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='run an http service on PORT converting uploaded docx files to a zip of htm and images')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='with --serve, address to listen on (default 127.0.0.1, 0.0.0.0 for all)')
+    parser.add_argument('--queue', type=int,
+                        help='with --serve, uploads to accept beyond the ones converting before answering 503 (default 2 x jobs)')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='with --serve, seconds allowed for each conversion (default 120)')
+    parser.add_argument('--max-upload', type=int, default=50,
+                        help='with --serve, largest upload in MB (default 50)')
+    parser.add_argument('--low-memory', action='store_true',
+                        help='keep as little of each article in memory as possible, for very large files')
+    parser.add_argument('--max-memory', type=int, metavar='MB',
+                        help='fail a file cleanly once its worker, pandoc or magick needs more than MB memory')
+    parser.add_argument('--incremental', action='store_true',
+                        help='reuse images unchanged since a file was last converted and report which sections changed')
+    parser.add_argument('--shared-assets', action='store_true',
+                        help='store images once in htm/assets, named by their contents, for articles to share')
+    parser.add_argument('--bundle', metavar='ARCHIVE',
+                        help='also write every converted article and its images to one .zip / .tar / .tar.gz with a manifest.json')
+    parser.add_argument('--preflight', action='store_true',
+                        help='check every docx quickly before converting, skipping broken ones and flagging tables, '
+                             'emf images, charts and missing headings')
+    parser.add_argument('--preflight-only', action='store_true',
+                        help='only run the --preflight checks, exit 1 if any file is broken')
+    parser.add_argument('--resume', action='store_true',
+                        help='record a directory run, and carry on with one after a crash or Ctrl+C, '
+                             'skipping files already converted')
+    parser.add_argument('--retries', type=int, default=0, metavar='N',
+                        help='times to retry a file that failed e.g. timed out, recording the run as --resume does '
+                             '(default 0)')
+    parser.add_argument('--backoff', type=float, default=5, metavar='SECONDS',
+                        help='wait before the first retry, doubled for each after (default 5)')
+    parser.add_argument('--file-timeout', type=float, default=0, metavar='SECONDS',
+                        help='stop pandoc or magick after this long on one file (default 0, no limit)')
+    parser.add_argument('--legacy-html', metavar='OUT',
+                        help='re-clean every .html / .htm in a directory tree or tar archive to the same paths in OUT, '
+                             'a directory or .zip / .tar / .tar.gz, skipping files already up to date in a directory')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='record time, cpu and memory of each stage per file to a .json or .csv report')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='with --profile, also trace python allocations for each stage\'s peak, several times slower')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='also write every stage to a Chrome trace .json, for chrome://tracing or ui.perfetto.dev')
+    parser.add_argument('--log-level', default='DEBUG', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help='lowest level written to the log file, lower ones cost nothing (default DEBUG)')
+    parser.add_argument('--log-format', default='text', choices=['text', 'json'],
+                        help='log file as text, or one JSON object per line with the article of each record')
+    parser.add_argument('--log-per-article', action='store_true',
+                        help='also write each article\'s records to its own file in a folder named after the log')
+    parser.add_argument('--log-sample', type=int, default=Article.LOG_SAMPLE, metavar='N',
+                        help=f'debug records logged per tag or image event per article, the rest are counted, '
+                             f'0 for all (default {Article.LOG_SAMPLE})')
+    return parser.parse_args(args)
 
 
 def main():
@@ -422,6 +165,31 @@ def main():
 - If running from command line: 
     `./convert_articles.py <file_you_want_to_convert> <award_scheme>`
     e.g. `./convert_articles.py "test/131485.docx" "warc"`
+- `./convert.py` takes the same arguments and starts quicker, as convert_articles.py's bytecode is then cached.
+- Directories can be converted in parallel with `--jobs N`:
+    e.g. `./convert_articles.py "test/" "warc" --jobs 4`
+- `--backend server` keeps one pandoc server running for the whole run instead of starting pandoc per file.
+- Unchanged files are restored from the conversion cache, `--no-cache` reconverts everything.
+- `--watch` keeps running and converts files as they're dropped into a directory, Ctrl+C to stop:
+    e.g. `./convert_articles.py "drop/" "warc" --watch --jobs 2`
+- `--optimise-images` resizes images to `--max-width` and recompresses them, `--webp` / `--avif` add copies in those formats.
+- `--serve PORT` runs an http service converting uploads to a zip of htm and images:
+    e.g. `./convert_articles.py --serve 8080 --jobs 4` then `curl -F file=@131485.docx -F award=warc localhost:8080/convert -o 131485.zip`
+- `--profile report.json` (or .csv) records time, cpu and memory of each stage per file, `--trace` writes a Chrome trace.
+- `--preflight` checks every docx quickly first, skipping broken ones, `--preflight-only` just checks them.
+- `--bundle batch.zip` (or .tar / .tar.gz) also writes every article and its images to one archive with a manifest.json.
+- `--shared-assets` stores each distinct image once in htm/assets, with a manifest.json of the articles using it.
+- `--incremental` reuses images unchanged since a file was last converted, and lists the sections that changed.
+- `--log-level INFO` leaves debug records out of the log file, `--log-format json` writes them as JSON lines,
+    `--log-per-article` also writes each article's to its own file, and `--log-sample N` logs N of each per tag event.
+- `--outputs json,txt,words` also writes a JSON model of the sections, plain text and word counts next to each .htm.
+- `--rules FILE` amends the html with another rules file than JSON/rules.json, e.g. a house style.
+- `--resume` records a directory run in `cache/jobs/` and skips files an earlier one converted, `--retries N` retries
+    failed files N times, and `--file-timeout` stops pandoc / magick after that many seconds. All off by default.
+- `--legacy-html OUT` re-cleans every .html / .htm in a directory tree or tar archive in parallel, to the same paths in OUT:
+    e.g. `./convert_articles.py "legacy.tar.gz" "warc" --legacy-html "cleaned/" --jobs 8`, a rerun skips files up to date.
+- `--low-memory` keeps as little of each article in memory as possible for very large files,
+    `--max-memory MB` fails a file cleanly once it needs more than MB.
 
 # MAIN FUNCTIONS
 
@@ -439,7 +207,7 @@ def main():
 
 - Arguments:
     IN_FILE: specify docx or html file.
-    TAGS: specify tags and attributes for bleach module in json file.
+    TAGS: specify allowed html tags and attributes in json file.
     SUBS: specify substitutions for h3 headings in html.
 
 # CLASS FUNCTIONS
@@ -447,43 +215,168 @@ def main():
 - convert_docx(): 
     Uses the pypandoc module to convert docx file to html content for parsing.    
 - rename_docx_images():
-    Rename extracted images.
+    Reads images from the docx zip under their new names, numbered in the order the document uses them.
     Returns old img path and new img filename in a json for subtitution in html.
+    tiff, tif and emf are converted to jpg in parallel, identical images once. Pillow does tiffs, magick does emf.
 - clean_html():
-    Uses the bleach module to clean unwanted html tags and limit attributes of allowed tags.
+    Cleans unwanted html tags and limits attributes of allowed tags.
     Tags and attributes are stored in json folder under '/json/tags.json'.
 - amend_html():
-    Parses cleaned html content from docx, running replacements to correct headings.
-    Heading substitutes are stored in json folder under '/json/subs.json'.
+    Parses html content from docx, cleaning it as clean_html() does while running replacements to correct headings.
+    Heading substitutes are stored in json folder under '/json/subs.json', the rules that run in '/json/rules.json'.
     Also contains the award code variable for inserting in `<img src""/>`.
+- write_images():
+    Writes the renamed images next to the htm.
 - write_html():
     Outputs cleaned and amended html content to specified file name.
     Pass in file name and html contents.
+
+# LIBRARY
+
+- convert(docx_bytes, award, Config()) --> (html, {image name: bytes}), all in memory.
     '''
-    temp_dir = None
     try:
+        args = parse_args()
+        log_setup(first_log='ArticleClass', second_log='amend_html', level=args.log_level, fmt=args.log_format,
+                  per_article=args.log_per_article)
         TAGS = load_json('JSON/tags.json')
         SUBS = load_json('JSON/subs.json')
-        try:
-            infile = load_infile(sys.argv[1])
-            award = load_award(a=sys.argv[2], SUBS=SUBS)
-        except IndexError as e:
+        if args.serve:
+            infile = award = None                                   # the award comes with each upload
+        elif args.infile and args.award:
+            infile = load_infile(args.infile)
+            award = load_award(a=args.award, SUBS=SUBS)
+        else:
             log.debug('no sys args')
             infile = input('file path:\n - ')
             award = input('select award - "warc" "mena" "asia" "media":\n - ')
             infile = load_infile(infile=infile)
             award = load_award(a=award, SUBS=SUBS)
-
-        if infile.is_dir():
-            for f in infile.glob(r'*.docx'):
-                temp_dir = process(f, TAGS, SUBS, award)
-        else:
-            temp_dir = process(infile, TAGS, SUBS, award)
-        if temp_dir.is_dir():
-            temp_dir.rmdir()
-            log.debug(f'removed temp folder: {temp_dir}')
+        opts = {
+            'backend': args.backend,
+            'cache_dir': None if args.no_cache else args.cache_dir,
+            'cache_size': args.cache_size * 2**20,
+            # compiled once and shared by every Article
+            'headings': HeadingIndex(SUBS, fuzzy=args.fuzzy_headings),
+            'incremental': args.incremental,
+            'shared_assets': args.shared_assets,
+            'timeout': args.file_timeout or None,
+            'log_sample': args.log_sample,
+            'outputs': args.outputs,
+        }
+        # validated and compiled once, or loaded from the cache if the file hasn't changed
+        opts['rules'] = Rules.load(args.rules, cache_dir=opts['cache_dir'])
+        if args.serve and (args.low_memory or args.max_memory):
+            log.warning('--low-memory and --max-memory are ignored with --serve')
+        elif args.max_memory and args.max_memory < 128:
+            # less leaves a worker unable to start threads, including the one sending its log records
+            log.error('--max-memory needs at least 128 MB, a worker and pandoc take about 100 MB to start')
+            raise SystemExit(1)
+        elif args.low_memory or args.max_memory:
+            opts.update(low_memory=args.low_memory, max_memory=args.max_memory)
+        profiling = bool(args.profile or args.trace) and not (args.watch or args.serve)
+        if profiling:
+            opts.update(profile=True, memory=args.profile_memory, trace=bool(args.trace))
+        elif args.profile or args.trace:
+            log.warning('--profile and --trace are ignored with --watch and --serve')
+        if args.bundle and (args.watch or args.serve):
+            log.warning('--bundle is ignored with --watch and --serve')
+        if set(args.outputs) - set(Document.FORMATS):
+            log.error(f'--outputs can be {", ".join(Document.FORMATS)}')
+            raise SystemExit(1)
+        if args.outputs and args.serve:
+            log.warning('--outputs is ignored with --serve')
+        if args.legacy_html and (args.watch or args.serve):
+            log.warning('--legacy-html is ignored with --watch and --serve')
+        if args.resume and (args.watch or args.serve or not infile.is_dir()):
+            log.warning('--resume needs a directory, and is ignored with --watch and --serve')
+        if args.optimise_images:
+            if not pillow():
+                log.error('--optimise-images needs Pillow: pip install pillow')
+                raise SystemExit(1)
+            from PIL import features
+            if args.avif and not features.check('avif'):
+                log.error('--avif needs a Pillow built with AVIF support (11.3+)')
+                raise SystemExit(1)
+            opts['optimiser'] = ImageOptimiser(max_width=args.max_width, quality=args.quality,
+                                               webp=args.webp, avif=args.avif, cache_dir=opts['cache_dir'])
+        if args.backend == 'server':
+            # start once here so worker processes share it, stopping conversions after --file-timeout as pandoc
+            # runs are, or --timeout with --serve
+            server = pandoc_server(timeout=args.timeout if args.serve else args.file_timeout or PandocServer.UNLIMITED)
+            os.environ['PANDOC_SERVER_URL'] = server.url
+            os.environ['PANDOC_SERVER_TIMEOUT'] = str(server.timeout)
+
+        if args.serve:
+            config = Config(TAGS, SUBS, backend=args.backend, fuzzy=args.fuzzy_headings,
+                            optimiser=opts.get('optimiser'), rules=opts['rules'])
+            Service(config, host=args.host, port=args.serve, jobs=args.jobs, queue=args.queue,
+                    timeout=args.timeout, max_upload=args.max_upload * 2**20).run()
+        elif args.watch:
+            if not infile.is_dir():
+                log.warning(f'--watch needs a directory: {infile}')
+                raise SystemExit(1)
+            Watcher(infile, TAGS, SUBS, award, jobs=args.jobs, interval=args.interval, settle=args.settle,
+                    **opts).run()
+        elif args.legacy_html:
+            import tarfile
+            out = Path(args.legacy_html)
+            if not (infile.is_dir() or tarfile.is_tarfile(infile)):
+                log.warning(f'--legacy-html needs a directory or tar archive: {infile}')
+                raise SystemExit(1)
+            # not Path.is_relative_to(), which is 3.9+
+            if infile.is_dir() and os.path.commonpath([out.resolve(), infile.resolve()]) == str(infile.resolve()):
+                log.warning(f'--legacy-html output must be outside {infile}')
+                raise SystemExit(1)
+            start = time.perf_counter()
+            config = Config(TAGS, SUBS, backend=args.backend, fuzzy=args.fuzzy_headings, rules=opts['rules'])
+            results, skipped = run_legacy(infile, out, config, award, jobs=args.jobs)
+            log_summary(results, time.perf_counter() - start)
+            if skipped:
+                log.info(f'{skipped} files already up to date in {out}, skipped')
+        elif infile.is_dir() or profiling or args.bundle or args.preflight or args.preflight_only or args.max_memory:
+            start = time.perf_counter()
+            from natsort import natsorted as nat
+            files = nat(infile.glob(r'*.docx')) if infile.is_dir() else [infile]
+            recorded = infile.is_dir() and (args.resume or args.retries) and not args.preflight_only
+            queue = JobQueue(JobQueue.file(args.cache_dir, infile)) if recorded else None
+            if queue:
+                files = queue.plan(files, resume=args.resume)
+            skipped = []
+            if args.preflight or args.preflight_only:
+                checks = run_preflight([f for f in files if f.suffix == '.docx'], SUBS, award, jobs=args.jobs,
+                                       headings=opts['headings'])
+                log_preflight(checks, time.perf_counter() - start)
+                bad = {c['file']: c['error'] for c in checks if not c['ok']}
+                if args.preflight_only:
+                    raise SystemExit(1 if bad else 0)
+                files = [f for f in files if f.name not in bad]
+                skipped = [{'file': k, 'ok': False, 'seconds': None, 'error': f'preflight: {v}', 'missing': []}
+                           for k, v in bad.items()]
+            with Bundle(args.bundle, SUBS[award]['code']) if args.bundle else nullcontext() as bundle:
+                if queue:
+                    with queue:
+                        results = run_jobs(files, TAGS, SUBS, award, queue, jobs=args.jobs, retries=args.retries,
+                                           backoff=args.backoff, done=bundle and bundle.add, **opts)
+                        for r in skipped:
+                            queue.finish(r)
+                else:
+                    results = run_batch(files, TAGS, SUBS, award, jobs=args.jobs, done=bundle and bundle.add, **opts)
+                if bundle:
+                    for r in skipped + (queue.resumed if queue else []):
+                        bundle.add(r)
+            results = sorted(results + skipped, key=lambda r: r['file'])
+            log_summary(results, time.perf_counter() - start, resumed=len(queue.resumed) if queue else 0)
+            if args.profile:
+                write_report(results, args.profile)
+            if args.trace:
+                write_trace(results, args.trace)
         else:
-            log.debug(f'did not remove temp folder: {temp_dir}')
+            process(infile, TAGS, SUBS, award, **opts)
+        if args.shared_assets and not (args.watch or args.serve or args.legacy_html):
+            AssetStore((infile if infile.is_dir() else infile.parent) / 'htm' / AssetStore.FOLDER).index()
+        if opts['cache_dir']:
+            ConversionCache(opts['cache_dir'], opts['cache_size']).evict()
         log.info('# FINISHED #')
 
     except AttributeError as e:
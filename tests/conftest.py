@@ -0,0 +1,41 @@
+'''
+Shared fixtures. The tests import convert_articles from the repo root like the benches do, and run with
+`python -m pytest -q` from there. Tests that convert docx files are skipped without pandoc.
+'''
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+import convert_articles as ca  # noqa: E402
+
+
+def pandoc_version():
+    '''
+    Returns the version of the pandoc pypandoc runs, or None without one.
+    '''
+    try:
+        import pypandoc
+        return pypandoc.get_pandoc_version()
+    except (ImportError, OSError):
+        return None
+
+
+needs_pandoc = pytest.mark.skipif(not pandoc_version(), reason='pandoc is not installed')
+
+
+@pytest.fixture(scope='session')
+def TAGS():
+    return ca.load_json('JSON/tags.json')
+
+
+@pytest.fixture(scope='session')
+def SUBS():
+    return ca.load_json('JSON/subs.json')
+
+
+@pytest.fixture(scope='session')
+def config():
+    return ca.Config()
@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+'''
+Writes the expected output of tests/golden/ with the original convert_articles.py.
+
+    `python tests/make_golden.py`
+
+Writes any docx inputs missing from tests/golden/input/ with bench/bench_convert.py's make_docx (png images
+only, the original converted tif and emf with a magick call that doesn't run), then converts each input
+with the code and JSON/ of BASELINE, the last commit before the rewrite, taken from git, and copies the
+.htm and images it wrote to tests/golden/expected/. test_golden.py checks the current code writes the same.
+The docx outputs depend on pandoc's version, which is kept in expected/pandoc-version.
+'''
+import io
+import sys
+import json
+import shutil
+import tarfile
+import subprocess
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+GOLDEN = ROOT / 'tests' / 'golden'
+BASELINE = '13734e2'                                                # bleach + BeautifulSoup, one file at a time
+AWARD = 'warc'
+DOCX = {                                                            # name --> make_docx options
+    '100001.docx': dict(paras=40, headings=4, images=2, footnotes=4, lists=2, seed=1),
+    '100002.docx': dict(paras=80, headings=10, images=3, footnotes=0, lists=4, seed=2),
+}
+
+sys.path.insert(0, str(ROOT))
+from bench.bench_convert import make_docx  # noqa: E402
+
+
+def main():
+    import pypandoc
+    SUBS = json.loads((ROOT / 'JSON' / 'subs.json').read_text(encoding='utf-8'))
+    inputs = GOLDEN / 'input'
+    for name, opts in DOCX.items():
+        if not (inputs / name).exists():
+            make_docx(inputs / name, SUBS=SUBS, size=48, **opts)
+    expected = GOLDEN / 'expected'
+    shutil.rmtree(expected, ignore_errors=True)
+    expected.mkdir()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        archive = subprocess.run(['git', 'archive', BASELINE, 'convert_articles.py', 'JSON'], cwd=ROOT,
+                                 capture_output=True, check=True).stdout
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tmp)
+        for f in sorted(inputs.iterdir()):
+            work = tmp / 'in' / f.stem
+            work.mkdir(parents=True)
+            shutil.copyfile(f, work / f.name)
+            subprocess.run([sys.executable, 'convert_articles.py', str(work / f.name), AWARD], cwd=tmp, check=True,
+                           capture_output=True)
+            for out in sorted((work / 'htm').iterdir()):
+                if out.is_file():
+                    shutil.copyfile(out, expected / out.name)
+                    print(f'{f.name} -> {out.name}')
+    (expected / 'pandoc-version').write_text(pypandoc.get_pandoc_version() + '\n')
+
+
+if __name__ == '__main__':
+    main()
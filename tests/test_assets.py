@@ -0,0 +1,52 @@
+'''
+--shared-assets: images named by their contents in one AssetStore for the batch, stored once however many
+articles use them, with a manifest of which articles use which.
+'''
+import json
+import shutil
+
+import convert_articles as ca
+from bench.bench_convert import make_docx
+from conftest import needs_pandoc
+
+AWARD = 'WARC Awards'
+
+
+def test_names_are_content_addressed(tmp_path):
+    store = ca.AssetStore(tmp_path / 'assets')
+    assert store.name(b'logo', '.PNG') == store.name(b'logo', '.png')
+    assert store.name(b'logo', '.png') != store.name(b'badge', '.png')
+    assert len(store.name(b'logo', '.png')) == 16 + len('.png')
+    other = ca.AssetStore(tmp_path / 'assets', {'quality': 70})                     # optimised differently
+    assert other.name(b'logo', '.png') != store.name(b'logo', '.png')
+
+
+def test_index(tmp_path):
+    store = ca.AssetStore(tmp_path / 'assets')
+    (store.path / 'aaa.png').write_bytes(b'12345')
+    store.record('500001', ['aaa.png', 'bbb.jpg'])
+    store.record('500002', ['aaa.png'])
+    images = store.index()
+    assert images == {'aaa.png': {'bytes': 5, 'articles': ['500001', '500002']},
+                      'bbb.jpg': {'bytes': None, 'articles': ['500001']}}
+    assert json.loads((store.path / 'manifest.json').read_text()) == {'images': images}
+    store.record('500001', ['aaa.png'])                                             # replaces its last record
+    assert list(store.index()) == ['aaa.png']
+
+
+@needs_pandoc
+def test_batch_stores_shared_images_once(tmp_path, TAGS, SUBS):
+    make_docx(tmp_path / '500003.docx', paras=30, images=3, footnotes=0, SUBS=SUBS, size=48)
+    shutil.copyfile(tmp_path / '500003.docx', tmp_path / '500004.docx')
+    results = ca.run_batch(sorted(tmp_path.glob('*.docx')), TAGS, SUBS, AWARD, jobs=2, shared_assets=True)
+    assert all(r['ok'] for r in results)
+    assets = tmp_path / 'htm' / 'assets'
+    names = sorted(p.name for p in assets.glob('*.png'))
+    assert len(names) == 3
+    assert [sorted(r['images']) for r in results] == [[f'assets/{name}' for name in names]] * 2   # for a Bundle
+    assert not list((tmp_path / 'htm').glob('*.png'))                              # no per-article copies
+    for r in results:
+        html = (tmp_path / 'htm' / r['htm'].rsplit('/', 1)[-1]).read_text(encoding='utf-8')
+        assert sorted(html.count(f'src="/fulltext/WARC-AWARDS/images/assets/{name}"') for name in names) == [1, 1, 1]
+    images = ca.AssetStore(assets).index()
+    assert {name: v['articles'] for name, v in images.items()} == {name: ['500003', '500004'] for name in names}
@@ -0,0 +1,45 @@
+'''
+--jobs batch mode: run_batch() spreads files over a pool, and one bad file doesn't stop the rest.
+'''
+import shutil
+from pathlib import Path
+
+import pytest
+
+import convert_articles as ca
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+
+
+@pytest.fixture
+def batch(tmp_path):
+    shutil.copyfile(HTML, tmp_path / '200001.html')
+    shutil.copyfile(HTML, tmp_path / '200002.html')
+    (tmp_path / '200003.docx').write_bytes(b'not a zip')
+    return sorted(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_bad_file_does_not_stop_batch(batch, jobs, TAGS, SUBS):
+    results = ca.run_batch(batch, TAGS, SUBS, 'WARC Awards', jobs=jobs)
+    by_file = {r['file']: r for r in results}
+    assert sorted(by_file) == ['200001.html', '200002.html', '200003.docx']
+    assert by_file['200001.html']['ok'] and by_file['200002.html']['ok']
+    assert not by_file['200003.docx']['ok'] and by_file['200003.docx']['error']
+    assert all(r['seconds'] is not None for r in results)
+    assert (batch[0].parent / 'htm' / '200001.htm').exists()
+    assert (batch[0].parent / 'htm' / '200002.htm').exists()
+
+
+def test_done_called_per_file(batch, TAGS, SUBS):
+    done = []
+    ca.run_batch(batch, TAGS, SUBS, 'WARC Awards', jobs=2, done=done.append)
+    assert sorted(r['file'] for r in done) == [f.name for f in batch]
+
+
+def test_summary(batch, TAGS, SUBS, caplog):
+    results = ca.run_batch(batch, TAGS, SUBS, 'WARC Awards')
+    with caplog.at_level('INFO'):
+        ca.log_summary(results, 1.5)
+    assert 'FAILED 200003.docx' in caplog.text
+    assert '2 succeeded, 1 failed in 1.50s' in caplog.text
@@ -0,0 +1,66 @@
+'''
+The benchmark's synthetic docx corpus, and the output hashes it compares against its baseline.
+'''
+import io
+import random
+import zipfile
+
+import pytest
+
+from articles.article import DocxMedia
+from bench import bench_convert as bc
+from conftest import needs_pandoc
+
+
+def make(path, SUBS, **opts):
+    bc.make_docx(path, SUBS=SUBS, size=16, **opts)
+    with zipfile.ZipFile(path) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+
+def test_same_corpus_each_time(tmp_path, SUBS):
+    opts = dict(paras=30, headings=4, images=3, formats=('png', 'tif', 'emf'), footnotes=3, lists=2)
+    assert make(tmp_path / 'a.docx', SUBS, **opts) == make(tmp_path / 'b.docx', SUBS, **opts)
+    assert make(tmp_path / 'a.docx', SUBS, **opts) != make(tmp_path / 'c.docx', SUBS, seed=1, **opts)
+
+
+def test_contents(tmp_path, SUBS):
+    files = make(tmp_path / 'a.docx', SUBS, paras=30, headings=4, images=3, formats=('png', 'tif', 'emf'),
+                 footnotes=3, lists=2)
+    document = files['word/document.xml'].decode('utf-8')
+    for heading in ['Market background and objectives', 'Performance against objectives']:
+        assert f'<w:b/></w:rPr><w:t xml:space="preserve">{heading}</w:t>' in document
+    assert document.count('<w:footnoteReference') == 3
+    assert document.count('<w:numId w:val="1"/>') == 6
+    with DocxMedia(tmp_path / 'a.docx') as media:
+        assert media.images() == ['word/media/image1.png', 'word/media/image2.tif', 'word/media/image3.emf']
+
+
+def test_images():
+    Image = pytest.importorskip('PIL.Image')
+    for make_image, fmt in [(bc.make_png, 'PNG'), (bc.make_tif, 'TIFF')]:
+        with Image.open(io.BytesIO(make_image(20, 10, random.Random(0)))) as im:
+            im.load()
+            assert (im.format, im.size, im.mode) == (fmt, (20, 10), 'RGB')
+    assert bc.make_emf(20, 10, random.Random(0))[40:44] == b' EMF'
+
+
+def test_compare(tmp_path):
+    (tmp_path / 'htm').mkdir()
+    (tmp_path / 'htm' / '1.htm').write_text('<p>a</p>')
+    (tmp_path / 'htm' / '.1.manifest.json').write_text('{}')
+    before = bc.outputs(tmp_path)
+    assert list(before) == ['1.htm']
+    assert bc.compare(before, before) == []
+    (tmp_path / 'htm' / '1.htm').write_text('<p>b</p>')
+    (tmp_path / 'htm' / '1f01.png').write_bytes(b'png')
+    assert bc.compare(before, bc.outputs(tmp_path)) == ['changed 1.htm', 'new     1f01.png']
+    assert bc.compare(before, {}) == ['missing 1.htm']
+
+
+@needs_pandoc
+def test_converts(tmp_path, TAGS, SUBS):
+    bc.make_docx(tmp_path / '600001.docx', paras=20, headings=4, images=2, footnotes=2, lists=1, SUBS=SUBS, size=16)
+    seconds, totals = bc.run([tmp_path / '600001.docx'], TAGS, SUBS, 'WARC Awards', 'pandoc')
+    assert seconds > 0 and {'convert_docx', 'amend_html'} <= {t['stage'] for t in totals}
+    assert sorted(bc.outputs(tmp_path)) == ['600001.htm', '600001f01.png', '600001f02.png']
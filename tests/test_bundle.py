@@ -0,0 +1,97 @@
+'''
+--bundle: a batch's articles, images and a manifest.json in one zip or tar, for a single CMS import.
+'''
+import json
+import hashlib
+import shutil
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import convert_articles as ca
+from bench.bench_convert import make_docx
+from conftest import needs_pandoc
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+AWARD = 'WARC Awards'
+CODE = 'WARC-AWARDS'
+
+
+def read(path):
+    '''
+    Returns arcname --> bytes of a bundle, in the order they were added.
+    '''
+    if path.suffix == '.zip':
+        with zipfile.ZipFile(path) as z:
+            return {name: z.read(name) for name in z.namelist()}
+    with tarfile.open(path) as tar:
+        return {m.name: tar.extractfile(m).read() for m in tar.getmembers()}
+
+
+def bundle(path, files, TAGS, SUBS, **opts):
+    with ca.Bundle(path, CODE) as b:
+        ca.run_batch(files, TAGS, SUBS, AWARD, done=b.add, **opts)
+    return read(path)
+
+
+@pytest.mark.parametrize('name', ['600000.zip', '600000.tar', '600000.tar.gz', '600000.tgz'])
+def test_manifest(name, tmp_path, TAGS, SUBS):
+    shutil.copyfile(HTML, tmp_path / '600001.html')
+    (tmp_path / '600002.docx').write_bytes(b'not a zip')
+    files = bundle(tmp_path / name, sorted(tmp_path.glob('6*.*')), TAGS, SUBS)
+    assert list(files) == ['articles/600001.htm', 'manifest.json']                  # the manifest goes in last
+    htm = (tmp_path / 'htm' / '600001.htm').read_bytes()
+    assert files['articles/600001.htm'] == htm
+    manifest = json.loads(files['manifest.json'])
+    assert manifest['award'] == CODE and manifest['created']
+    assert manifest['articles'] == [{
+        'id': '600001',
+        'file': '600001.html',
+        'award': CODE,
+        'html': {'path': 'articles/600001.htm', 'bytes': len(htm), 'sha256': hashlib.sha256(htm).hexdigest()},
+        'sections': ['Executive summary', 'Market background and objectives', 'Insight and strategic thinking',
+                     'Client’s view', 'Performance against objectives', 'Sources'],
+        'missing': ['Implementation, including creative and media development'],
+        'images': [],
+        'outputs': [],
+    }]
+    [failed] = manifest['failed']
+    assert failed['file'] == '600002.docx' and failed['error'].startswith('BadZipFile')
+
+
+def test_only_whole_bundles(tmp_path):
+    with pytest.raises(ValueError, match='must be a .zip'):
+        ca.Bundle(tmp_path / 'out.rar', CODE).__enter__()
+    with pytest.raises(RuntimeError):
+        with ca.Bundle(tmp_path / 'out.zip', CODE):
+            raise RuntimeError('interrupted')
+    assert list(tmp_path.iterdir()) == []                                           # no partial archive
+
+
+@needs_pandoc
+def test_images(tmp_path, TAGS, SUBS):
+    make_docx(tmp_path / '600003.docx', paras=30, images=2, footnotes=0, SUBS=SUBS, size=48)
+    files = bundle(tmp_path / 'out.zip', [tmp_path / '600003.docx'], TAGS, SUBS)
+    [article] = json.loads(files['manifest.json'])['articles']
+    assert [i['path'] for i in article['images']] == ['images/600003f01.png', 'images/600003f02.png']
+    for image in article['images']:
+        data = (tmp_path / 'htm' / Path(image['path']).name).read_bytes()
+        assert files[image['path']] == data
+        assert (image['bytes'], image['sha256']) == (len(data), hashlib.sha256(data).hexdigest())
+    with zipfile.ZipFile(tmp_path / 'out.zip') as z:
+        compress = {i.filename: i.compress_type for i in z.infolist()}
+    assert compress['images/600003f01.png'] == zipfile.ZIP_STORED                 # already compressed
+    assert compress['articles/600003.htm'] == zipfile.ZIP_DEFLATED
+
+
+@needs_pandoc
+def test_shared_assets_added_once(tmp_path, TAGS, SUBS):
+    make_docx(tmp_path / '600004.docx', paras=30, images=2, footnotes=0, SUBS=SUBS, size=48)
+    shutil.copyfile(tmp_path / '600004.docx', tmp_path / '600005.docx')
+    files = bundle(tmp_path / 'out.tar', sorted(tmp_path.glob('*.docx')), TAGS, SUBS, shared_assets=True)
+    images = [name for name in files if name.startswith('images/')]
+    assert len(images) == 2 and all(name.startswith('images/assets/') for name in images)
+    articles = json.loads(files['manifest.json'])['articles']
+    assert [sorted(i['path'] for i in a['images']) for a in articles] == [sorted(images)] * 2
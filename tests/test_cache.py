@@ -0,0 +1,64 @@
+'''
+The content-hash conversion cache that skips unchanged files on re-runs.
+'''
+import os
+import shutil
+from pathlib import Path
+
+import convert_articles as ca
+from articles.article import ConversionCache
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+
+
+def test_key(tmp_path, TAGS, SUBS):
+    f = tmp_path / '200001.html'
+    shutil.copyfile(HTML, f)
+    key = ConversionCache.key(f, TAGS, SUBS, 'WARC Awards')
+    assert key == ConversionCache.key(f, TAGS, SUBS, 'WARC Awards')
+    assert key != ConversionCache.key(f, TAGS, SUBS, 'Media Awards')
+    assert key != ConversionCache.key(f, TAGS, SUBS, 'WARC Awards', 0.9)
+    assert key != ConversionCache.key(f, {**TAGS, 'tags': []}, SUBS, 'WARC Awards')
+    renamed = tmp_path / '200002.html'                              # the ID goes into image names
+    shutil.copyfile(f, renamed)
+    assert key != ConversionCache.key(renamed, TAGS, SUBS, 'WARC Awards')
+    f.write_text(f.read_text(encoding='utf-8') + '<p>Edit.</p>', encoding='utf-8')
+    assert key != ConversionCache.key(f, TAGS, SUBS, 'WARC Awards')
+
+
+def test_rerun_restores(tmp_path, TAGS, SUBS, monkeypatch):
+    f = tmp_path / '200001.html'
+    shutil.copyfile(HTML, f)
+    cache = tmp_path / 'cache'
+    Art = ca.process(f, TAGS, SUBS, 'WARC Awards', cache_dir=cache)
+    written = Art.OUT_FILE.read_bytes()
+    Art.OUT_FILE.unlink()
+
+    def build(*args):
+        raise AssertionError('converted again')
+    monkeypatch.setattr(ca.Article, 'build', build)
+    Art = ca.process(f, TAGS, SUBS, 'WARC Awards', cache_dir=cache)
+    assert Art.OUT_FILE.read_bytes() == written
+    assert Art.MISSING == ['Implementation, including creative and media development']
+
+
+def test_put_fetch(tmp_path):
+    cache = ConversionCache(tmp_path)
+    assert cache.fetch('abc') is None
+    cache.put('abc', {'article.htm': b'<p>x</p>', 'images/1f01.png': b'png'}, file='1.htm')
+    entry, meta = cache.fetch('abc')
+    assert (entry / 'images' / '1f01.png').read_bytes() == b'png'
+    assert meta == {'size': 11, 'file': '1.htm'}
+    cache.put('abc', {'article.htm': b'other'})                     # first one stays
+    assert (entry / 'article.htm').read_bytes() == b'<p>x</p>'
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith('.')]
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = ConversionCache(tmp_path, max_size=25)
+    for i, key in enumerate(['old', 'used', 'new']):
+        cache.put(key, {'article.htm': b'x' * 10})
+        os.utime(tmp_path / key, (1000 + i, 1000 + i))
+    cache.fetch('old')                                              # now the most recently used
+    cache.evict()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['new', 'old']
@@ -0,0 +1,92 @@
+'''
+--outputs: json, plain text and word counts of an article written from the same tree as its .htm.
+'''
+import csv
+import json
+import shutil
+import zipfile
+from pathlib import Path
+
+import convert_articles as ca
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+AWARD = 'WARC Awards'
+SMALL = '''<p>Intro text.</p>
+<p><strong>Market background and objectives</strong></p>
+<p>Sales grew.<a href="#fn1" class="footnote-ref" id="fnref1" role="doc-noteref"><sup>1</sup></a></p>
+<ul>
+<li><p>One</p></li>
+<li><p>Two</p></li>
+</ul>
+<p><img src="media/image1.png" alt="Chart" /></p>
+<section id="footnotes" class="footnotes footnotes-end-of-document" role="doc-endnotes">
+<hr />
+<ol>
+<li id="fn1"><p>Kantar, 2022.<a href="#fnref1" class="footnote-back" role="doc-backlink">↩︎</a></p></li>
+</ol>
+</section>
+'''
+
+
+def test_outputs(tmp_path, TAGS, SUBS):
+    (tmp_path / '120001.html').write_text(SMALL, encoding='utf-8')
+    Art = ca.process(tmp_path / '120001.html', TAGS, SUBS, AWARD, outputs=['json', 'txt', 'words'])
+    htm = tmp_path / 'htm'
+    assert Art.OUTPUTS == {name: htm / name for name in ('120001.json', '120001.txt', '120001.words.csv')}
+    assert json.loads((htm / '120001.json').read_text(encoding='utf-8')) == {
+        'version': 1, 'id': '120001', 'award': AWARD, 'code': 'WARC-AWARDS', 'words': 10,
+        'missing': ['Insight and strategic thinking', 'Implementation, including creative and media development',
+                    'Performance against objectives'],
+        'sections': [
+            {'heading': '(start)', 'words': 2, 'paragraphs': [{'type': 'paragraph', 'text': 'Intro text.'}],
+             'images': []},
+            {'heading': 'Market background and objectives', 'words': 8,
+             'paragraphs': [{'type': 'paragraph', 'text': 'Sales grew.1'}, {'type': 'item', 'text': 'One'},
+                            {'type': 'item', 'text': 'Two'}],
+             'images': [{'src': 'media/image1.png', 'alt': ''}]},
+        ],
+        'sources': ['Kantar, 2022.'],
+    }
+    assert (htm / '120001.txt').read_text(encoding='utf-8') == ('Intro text.\n\nMarket background and objectives\n\n'
+                                                               'Sales grew.1\n\n- One\n- Two\n\nSources\n\n'
+                                                               '1. Kantar, 2022.\n')
+    assert (htm / '120001.words.csv').read_text(encoding='utf-8') == ('section,words\n(start),2\n'
+                                                                     'Market background and objectives,8\n'
+                                                                     '(total),10\n')
+
+
+def test_words_match_manifest(tmp_path, TAGS, SUBS):
+    shutil.copyfile(HTML, tmp_path / '120002.html')
+    Art = ca.Article(tmp_path / '120002.html', TAGS, SUBS, AWARD)
+    tree = Art.build()
+    doc = ca.Document(Art, tree)
+    sections = {heading: words for heading, _, words in ca.Manifest.sections(tree)}
+    assert {s['heading']: s['words'] for s in doc.data['sections']} == {k: v for k, v in sections.items()
+                                                                        if k != 'Sources'}
+    assert doc.data['sources'] == ['Company data, 2023.', 'Kantar, 2022.', 'Client interview.']
+    assert doc.data['words'] == sum(s['words'] for s in doc.data['sections'])
+    rows = list(csv.reader(doc.words().splitlines()))
+    assert rows[-1] == ['(total)', str(doc.data['words'])] and len(rows) == len(doc.data['sections']) + 2
+
+
+def test_no_empty_start_section(tmp_path, TAGS, SUBS):
+    (tmp_path / '120003.html').write_text('<p><strong>Market background and objectives</strong></p><p>Text.</p>')
+    Art = ca.Article(tmp_path / '120003.html', TAGS, SUBS, AWARD)
+    doc = ca.Document(Art, Art.build())
+    assert [s['heading'] for s in doc.data['sections']] == ['Market background and objectives']
+    assert doc.txt() == 'Market background and objectives\n\nText.\n'
+
+
+def test_outputs_cached_and_bundled(tmp_path, TAGS, SUBS):
+    shutil.copyfile(HTML, tmp_path / '120004.html')
+    opts = dict(cache_dir=tmp_path / 'cache', outputs=['json'])
+    ca.process(tmp_path / '120004.html', TAGS, SUBS, AWARD, **opts)
+    first = (tmp_path / 'htm' / '120004.json').read_bytes()
+    shutil.rmtree(tmp_path / 'htm')
+    with ca.Bundle(tmp_path / 'out.zip', 'WARC-AWARDS') as bundle:
+        ca.run_batch([tmp_path / '120004.html'], TAGS, SUBS, AWARD, done=bundle.add, **opts)   # from the cache
+    assert (tmp_path / 'htm' / '120004.json').read_bytes() == first
+    with zipfile.ZipFile(tmp_path / 'out.zip') as z:
+        assert z.read('articles/120004.json') == first
+        [article] = json.loads(z.read('manifest.json'))['articles']
+    assert [o['path'] for o in article['outputs']] == ['articles/120004.json']
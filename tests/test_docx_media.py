@@ -0,0 +1,69 @@
+'''
+DocxMedia: images read straight from the docx zip, rather than extracted by pandoc and renamed on disk.
+'''
+import io
+import re
+import shutil
+import zipfile
+from pathlib import Path
+
+import convert_articles as ca
+from articles.article import DocxMedia
+from conftest import needs_pandoc
+
+DOCX = Path(__file__).resolve().parent / 'golden' / 'input' / '100001.docx'
+RELS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def rels(*rows):
+    return ('<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(f'<Relationship Id="{i}" Type="{RELS}/{kind}" Target="{target}"{extra}/>'
+                      for i, kind, target, extra in rows)
+            + '</Relationships>')
+
+
+def docx():
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as z:
+        z.writestr('word/document.xml', '<w:document><a:blip r:embed="rId3"/><a:blip r:embed="rId2"/>'
+                                        '<v:imagedata r:id="rId3"/><a:blip r:link="rId4"/></w:document>')
+        z.writestr('word/_rels/document.xml.rels', rels(
+            ('rId2', 'image', 'media/image2.png', ''), ('rId3', 'image', 'media/image1.png', ''),
+            ('rId4', 'image', 'https://example.com/a.png', ' TargetMode="External"'),
+            ('rId5', 'hyperlink', 'media/image9.png', '')))
+        z.writestr('word/footnotes.xml', '<w:footnotes><a:blip r:embed="rId1"/></w:footnotes>')
+        z.writestr('word/_rels/footnotes.xml.rels', rels(('rId1', 'image', '/word/media/image5.png', '')))
+        for n in (1, 2, 5, 9):
+            z.writestr(f'word/media/image{n}.png', f'png{n}')
+    return out.getvalue()
+
+
+def test_images_in_order_of_use():
+    with DocxMedia(docx()) as media:
+        assert media.images() == ['word/media/image1.png', 'word/media/image2.png', 'word/media/image5.png']
+        assert media.read('word/media/image5.png') == b'png5'
+
+
+def test_path_or_file(tmp_path):
+    (tmp_path / 'a.docx').write_bytes(docx())
+    with DocxMedia(tmp_path / 'a.docx') as media:
+        assert len(media.images()) == 3
+    with open(tmp_path / 'a.docx', 'rb') as f, DocxMedia(f) as media:
+        assert len(media.images()) == 3
+
+
+def test_no_images():
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as z:
+        z.writestr('word/document.xml', '<w:document/>')
+    with DocxMedia(out.getvalue()) as media:
+        assert media.images() == []
+
+
+@needs_pandoc
+def test_nothing_extracted(tmp_path, TAGS, SUBS):
+    shutil.copyfile(DOCX, tmp_path / DOCX.name)
+    Art = ca.process(tmp_path / DOCX.name, TAGS, SUBS, 'WARC Awards')
+    assert sorted(p.name for p in (tmp_path / 'htm').iterdir()) == ['100001.htm', '100001f01.png', '100001f02.png']
+    srcs = re.findall(r'src="([^"]+)"', Art.OUT_FILE.read_text(encoding='utf-8'))
+    assert srcs == ['/fulltext/WARC-AWARDS/images/100001f01.png', '/fulltext/WARC-AWARDS/images/100001f02.png']
@@ -0,0 +1,78 @@
+'''
+The current pipeline has to write exactly what the original bleach + BeautifulSoup code wrote for the
+corpus in tests/golden/, see make_golden.py, apart from the deliberate changes in CHANGED.
+'''
+import shutil
+from pathlib import Path
+
+import pytest
+
+import convert_articles as ca
+from conftest import pandoc_version
+
+GOLDEN = Path(__file__).resolve().parent / 'golden'
+INPUTS = sorted((GOLDEN / 'input').iterdir())
+EXPECTED = GOLDEN / 'expected'
+AWARD = 'warc'
+CHANGED = [                                                         # original output --> output now
+    # HeadingIndex ignores whitespace, so finds award headings pandoc wrapped onto two lines
+    ('<h5>Implementation, including creative and media\ndevelopment</h5>',
+     '<h3>Implementation, including creative and media\ndevelopment</h3>'),
+]
+
+
+def expected(f):
+    '''
+    Returns the names of the .htm and images the original wrote for input f.
+    '''
+    return sorted(p.name for p in EXPECTED.glob(f'{f.stem}*'))
+
+
+def expected_html(stem):
+    '''
+    Returns the .htm the original wrote for stem, with CHANGED applied.
+    '''
+    html = (EXPECTED / f'{stem}.htm').read_text(encoding='utf-8')
+    for before, after in CHANGED:
+        html = html.replace(before, after)
+    return html.encode('utf-8')
+
+
+def skip_docx(f):
+    if f.suffix != '.docx':
+        return
+    version = pandoc_version()
+    if not version:
+        pytest.skip('pandoc is not installed')
+    made = (EXPECTED / 'pandoc-version').read_text().strip()
+    if version != made:
+        pytest.skip(f'expected output was made with pandoc {made}, this is {version}')
+
+
+@pytest.mark.parametrize('f', INPUTS, ids=lambda f: f.name)
+def test_process_matches_original(f, tmp_path, TAGS, SUBS):
+    skip_docx(f)
+    shutil.copyfile(f, tmp_path / f.name)
+    ca.process(tmp_path / f.name, TAGS, SUBS, ca.find_award(AWARD, SUBS))
+    written = sorted(p.name for p in (tmp_path / 'htm').iterdir() if p.is_file())
+    assert written == expected(f)
+    for name in written:
+        want = expected_html(f.stem) if name.endswith('.htm') else (EXPECTED / name).read_bytes()
+        assert (tmp_path / 'htm' / name).read_bytes() == want, name
+
+
+@pytest.mark.parametrize('f', INPUTS, ids=lambda f: f.name)
+def test_convert_matches_original(f, config):
+    skip_docx(f)
+    data = f.read_bytes() if f.suffix == '.docx' else f.read_text(encoding='utf-8')
+    html, images = ca.convert(data, AWARD, config, name=f.stem)
+    assert html.encode('utf-8') == expected_html(f.stem)
+    assert sorted(images) == [name for name in expected(f) if name.endswith('.png')]
+    for name, data in images.items():
+        assert data == (EXPECTED / name).read_bytes(), name
+
+
+def test_changes_are_in_corpus():
+    originals = [p.read_text(encoding='utf-8') for p in EXPECTED.glob('*.htm')]
+    for before, _ in CHANGED:
+        assert any(before in html for html in originals), before
@@ -0,0 +1,64 @@
+'''
+HeadingIndex: award headings compiled once from subs.json, matched loosely, with aliases.
+'''
+import copy
+
+import pytest
+
+import convert_articles as ca
+
+
+@pytest.fixture(scope='module')
+def index(SUBS):
+    return ca.HeadingIndex(SUBS)
+
+
+@pytest.mark.parametrize('text', [
+    'Market background and objectives',
+    'MARKET BACKGROUND AND OBJECTIVES',
+    '  Market   background and\nobjectives ',                          # split across lines by pandoc
+    'Market background and objectives:',
+    'Market background and objectives.',
+])
+def test_loose_match(index, text):
+    assert index.match(text, 'WARC Awards') == ('market', 'Market background and objectives', False)
+
+
+def test_apostrophes(index):
+    for quote in "’‘ʼ`´′'":
+        assert index.match(f'Client{quote}s view', 'WARC Awards') == ('client', "Client's view", False)
+
+
+def test_not_headings(index):
+    assert index.match('Market background', 'WARC Awards') is None
+    assert index.match('Market background and objectives', 'Media Awards') is None   # another award's
+
+
+def test_aliases(SUBS):
+    SUBS = copy.deepcopy(SUBS)
+    SUBS['WARC Awards']['aliases'] = {'market': ['Background'], 'results': ['re:results?( and measurement)?']}
+    index = ca.HeadingIndex(SUBS)
+    assert index.match('Background:', 'WARC Awards') == ('market', 'Market background and objectives', True)
+    assert index.match('Results and measurement', 'WARC Awards')[:2] == ('results', 'Performance against objectives')
+    assert index.match('Results and more', 'WARC Awards') is None
+    assert index.expected['WARC Awards'] == ['market', 'insight', 'execution', 'results']
+
+
+def test_fuzzy(SUBS):
+    assert ca.HeadingIndex(SUBS).match('Market backgruond and objectives', 'WARC Awards') is None
+    assert ca.HeadingIndex(SUBS, fuzzy=0.9).match('Market backgruond and objectives', 'WARC Awards') == \
+        ('market', 'Market background and objectives', True)
+
+
+def test_article_rewrites_alias_and_lists_missing(SUBS):
+    SUBS = copy.deepcopy(SUBS)
+    SUBS['WARC Awards']['aliases'] = {'market': ['Background']}
+    config = ca.Config(SUBS=SUBS)
+    html = ('<p><strong>Background</strong></p>\n<p>Text.</p>\n'
+            '<p><strong>Insight and strategic\nthinking</strong></p>\n<p>Text.</p>')
+    Art = config.article(html, 'warc', '200001')
+    out = Art.convert()
+    assert '<h3>Market background and objectives</h3>' in out
+    assert '<h3>Insight and strategic\nthinking</h3>' in out
+    assert Art.MISSING == ['Implementation, including creative and media development', 'Performance against objectives']
+    assert config.article(html, 'warc', '200002').HEADINGS is Art.HEADINGS   # shared, compiled once
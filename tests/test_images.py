@@ -0,0 +1,72 @@
+'''
+Image conversion: tiff, tif and emf converted to jpg once per distinct image, on a pool of threads.
+'''
+import io
+
+import pytest
+
+import convert_articles as ca
+from bench.bench_convert import make_docx
+
+
+@pytest.fixture
+def article(config):
+    return config.article('<p>Text</p>', 'warc', '300001')
+
+
+@pytest.fixture
+def docx(tmp_path, SUBS):
+    make_docx(tmp_path / '300001.docx', paras=10, headings=0, images=4, formats=('png', 'tif'), footnotes=0,
+              lists=0, SUBS=SUBS, size=32)
+    return (tmp_path / '300001.docx').read_bytes()
+
+
+def fake_cleanup(calls):
+    def image_cleanup(cls, data, suffix, timeout=None):
+        calls.append(data)
+        if data == b'bad':
+            raise RuntimeError('cannot read')
+        return b'jpg ' + data
+    return classmethod(image_cleanup)
+
+
+def test_identical_images_converted_once(article, monkeypatch):
+    calls = []
+    monkeypatch.setattr(ca.Article, 'image_cleanup', fake_cleanup(calls))
+    done = article.convert_images([('a.tif', b'same'), ('b.tif', b'same'), ('c.emf', b'other'), ('d.emf', b'bad')])
+    assert sorted(calls) == [b'bad', b'other', b'same']
+    assert done['a.tif'][0] == done['b.tif'][0] == b'jpg same'
+    assert done['c.emf'][0] == b'jpg other'
+    assert done['d.emf'] == (None, None)
+
+
+def test_tif_to_jpg(article):
+    Image = pytest.importorskip('PIL.Image')
+    tif = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(tif, 'TIFF')
+    jpg = article.image_cleanup(tif.getvalue(), '.tif')
+    assert jpg.startswith(b'\xff\xd8')
+
+
+def test_docx_images_renamed_and_converted(docx, config, monkeypatch):
+    monkeypatch.setattr(ca.Article, 'image_cleanup', fake_cleanup([]))
+    Art = config.article(docx, 'warc', '300001')
+    imgs = Art.rename_docx_images()
+    assert imgs == {
+        'media/image1.png': '/fulltext/WARC-AWARDS/images/300001f01.png',
+        'media/image2.tif': '/fulltext/WARC-AWARDS/images/300001f02.jpg',
+        'media/image3.png': '/fulltext/WARC-AWARDS/images/300001f03.png',
+        'media/image4.tif': '/fulltext/WARC-AWARDS/images/300001f04.jpg',
+    }
+    assert Art.IMAGES['300001f02.jpg'].startswith(b'jpg ')
+    assert Art.IMAGES['300001f01.png'].startswith(b'\x89PNG')
+
+
+def test_failed_conversion_keeps_original(docx, config, monkeypatch):
+    def image_cleanup(cls, data, suffix, timeout=None):
+        raise RuntimeError('no magick')
+    monkeypatch.setattr(ca.Article, 'image_cleanup', classmethod(image_cleanup))
+    Art = config.article(docx, 'warc', '300001')
+    imgs = Art.rename_docx_images()
+    assert imgs['media/image2.tif'] == '/fulltext/WARC-AWARDS/images/300001f02.tif'
+    assert '300001f02.tif' in Art.IMAGES and Art.IMAGE_TIMES['300001f02.tif'] is None
@@ -0,0 +1,99 @@
+'''
+--incremental: a Manifest of each section and image next to the .htm, so a re-run reports what changed,
+leaves an unchanged .htm alone and reuses unchanged images.
+'''
+import json
+import shutil
+from pathlib import Path
+
+import convert_articles as ca
+from bench.bench_convert import make_docx
+from conftest import needs_pandoc
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+AWARD = 'WARC Awards'
+
+
+def run(f, TAGS, SUBS, **opts):
+    return ca.process(f, TAGS, SUBS, AWARD, incremental=True, **opts)
+
+
+def test_first_run_writes_manifest(tmp_path, TAGS, SUBS):
+    f = tmp_path / '400001.html'
+    shutil.copyfile(HTML, f)
+    Art = run(f, TAGS, SUBS)
+    assert Art.CHANGES is None
+    data = json.loads((tmp_path / 'htm' / '.400001.manifest.json').read_text())
+    assert [s[0] for s in data['sections']] == [ca.Manifest.START, 'Executive summary',
+                                                'Market background and objectives', 'Insight and strategic thinking',
+                                                'Client’s view', 'Performance against objectives', 'Sources']
+    assert data['html'] == ca.Manifest.digest(Art.OUT_FILE.read_bytes())
+
+
+def test_unchanged_rerun(tmp_path, TAGS, SUBS, caplog):
+    f = tmp_path / '400002.html'
+    shutil.copyfile(HTML, f)
+    run(f, TAGS, SUBS)
+    before = (f.parent / 'htm' / '400002.htm').stat()
+    with caplog.at_level('INFO'):
+        Art = run(f, TAGS, SUBS)
+    assert Art.CHANGES['sections'] == {'changed': [], 'added': [], 'removed': [], 'unchanged': 7}
+    assert ca.Manifest.describe(Art.CHANGES) == 'no sections changed'
+    assert 'unchanged, not rewritten' in caplog.text
+    after = Art.OUT_FILE.stat()
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+
+
+def test_edited_sections(tmp_path, TAGS, SUBS):
+    f = tmp_path / '400003.html'
+    shutil.copyfile(HTML, f)
+    run(f, TAGS, SUBS)
+    html = HTML.read_text(encoding='utf-8')
+    html = html.replace('Sales up 40%.', 'Sales up 45% in total.')
+    html = html.replace('<p><strong>Client’s view</strong></p>\n', '')
+    f.write_text(html, encoding='utf-8')
+    Art = run(f, TAGS, SUBS)
+    assert Art.CHANGES['sections'] == {
+        'changed': ['Insight and strategic thinking (27 -> 33 words)',      # took in the removed section
+                    'Performance against objectives (10 -> 12 words)'],
+        'added': [], 'removed': ['Client’s view'], 'unchanged': 4}
+    assert ca.Manifest.describe(Art.CHANGES).startswith('sections changed: Insight')
+    assert 'Sales up 45% in total.' in Art.OUT_FILE.read_text(encoding='utf-8')
+
+
+def test_repeated_headings_are_numbered():
+    keyed = ca.Manifest.keyed([['Results', 'a', 1], ['Results', 'b', 2], ['Other', 'c', 3]])
+    assert keyed == {'Results': ('a', 1), 'Results (2)': ('b', 2), 'Other': ('c', 3)}
+
+
+def test_sections_make_whole_document(tmp_path, TAGS, SUBS):
+    f = tmp_path / '400004.html'
+    shutil.copyfile(HTML, f)
+    tree = ca.Article(f, TAGS, SUBS, AWARD).build()
+    assert ''.join(html for _, html, _ in ca.Manifest.sections(tree)) == str(tree)
+
+
+@needs_pandoc
+def test_unchanged_images_reused(tmp_path, TAGS, SUBS):
+    f = tmp_path / '400005.docx'
+    make_docx(f, paras=30, images=3, footnotes=0, SUBS=SUBS, size=48, seed=1)
+    run(f, TAGS, SUBS)
+    images = sorted((tmp_path / 'htm').glob('*.png'))
+    before = [p.stat().st_ino for p in images]
+    Art = run(f, TAGS, SUBS)
+    assert Art.CHANGES['images'] == {'changed': [], 'added': [], 'removed': [], 'reused': 3}
+    assert [p.stat().st_ino for p in images] == before                                  # not written again
+    make_docx(f, paras=30, images=3, footnotes=0, SUBS=SUBS, size=48, seed=2)              # different pictures
+    Art = run(f, TAGS, SUBS)
+    assert Art.CHANGES['images']['changed'] == ['400005f01', '400005f02', '400005f03']
+    assert Art.CHANGES['images']['reused'] == 0
+
+
+@needs_pandoc
+def test_other_settings_not_reused(tmp_path, TAGS, SUBS):
+    f = tmp_path / '400006.docx'
+    make_docx(f, paras=30, images=2, footnotes=0, SUBS=SUBS, size=48)
+    run(f, TAGS, SUBS)
+    Art = run(f, TAGS, SUBS, optimiser=ca.ImageOptimiser(webp=True))
+    assert Art.CHANGES['images']['reused'] == 0 and not Art.REUSED
+    assert sorted(p.suffix for p in (tmp_path / 'htm').glob('400006f*')) == ['.png', '.png', '.webp', '.webp']
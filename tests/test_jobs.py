@@ -0,0 +1,136 @@
+'''
+--resume and --retries: the JobQueue record of a directory run, skipping files already converted and
+retrying failures a retry might fix.
+'''
+import shutil
+from pathlib import Path
+
+import pytest
+
+import convert_articles as ca
+from articles import jobs
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+AWARD = 'WARC Awards'
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'in'
+    folder.mkdir()
+    for name in ('800001.html', '800002.html', '800003.html'):
+        shutil.copyfile(HTML, folder / name)
+    return folder
+
+
+@pytest.fixture
+def queue(tmp_path, folder):
+    with ca.JobQueue(ca.JobQueue.file(tmp_path / 'cache', folder)) as queue:
+        yield queue
+
+
+def attempts(queue):
+    return dict(queue.db.execute('SELECT file, attempts FROM jobs'))
+
+
+def test_database_in_cache(tmp_path, folder):
+    path = ca.JobQueue.file(tmp_path / 'cache', folder)
+    assert path.parent == tmp_path / 'cache' / 'jobs' and path.suffix == '.sqlite' and len(path.stem) == 16
+    assert ca.JobQueue.file(tmp_path / 'cache', folder / '..' / 'in') == path
+    assert ca.JobQueue.file(tmp_path / 'cache', tmp_path) != path
+    ca.JobQueue(path).__exit__(None, None, None)
+    assert path.is_file() and sorted(p.name for p in folder.iterdir()) == ['800001.html', '800002.html', '800003.html']
+
+
+def test_resume(folder, queue, TAGS, SUBS):
+    files = sorted(folder.iterdir())
+    assert queue.plan(files) == files
+    ca.run_jobs(files, TAGS, SUBS, AWARD, queue)
+    assert queue.counts() == {'done': 3}
+    (folder / '800002.html').write_text('<p>Edited</p>')                            # changed since
+    (folder / 'htm' / '800003.htm').unlink()                                        # output gone
+    assert queue.plan(files, resume=True) == [folder / '800002.html', folder / '800003.html']
+    [resumed] = queue.resumed
+    assert resumed['file'] == '800001.html' and resumed['ok']
+    assert resumed['htm'] == str(folder / 'htm' / '800001.htm')
+    assert resumed['missing'] == ['Implementation, including creative and media development']
+    assert queue.counts() == {'done': 1, 'queued': 2}
+
+
+def test_without_resume_converts_everything(folder, queue, TAGS, SUBS):
+    files = sorted(folder.iterdir())
+    queue.plan(files)
+    ca.run_jobs(files, TAGS, SUBS, AWARD, queue)
+    assert queue.plan(files) == files and queue.resumed == []
+
+
+@pytest.mark.parametrize('error, retry', [
+    ('TimeoutError: pandoc took longer than 5s, stopped it', True),
+    ('RuntimeError: Pandoc died with exitcode "1" during conversion', True),
+    ('BrokenProcessPool: A process in the process pool was terminated abruptly', True),
+    ('BadZipFile: File is not a zip file', False),
+    ('ValueError: not a docx or html file: x.txt', False),
+    ('MemoryError: ran out of memory, over the --max-memory limit of 500 MB', False),
+])
+def test_retryable(error, retry):
+    assert ca.JobQueue.retryable({'ok': False, 'error': error}) == retry
+    assert not ca.JobQueue.retryable({'ok': True, 'error': None})
+
+
+@pytest.fixture
+def flaky(monkeypatch):
+    '''
+    Replaces run_batch with one where 800001 times out the first fails[0] times and 800002 is never a docx.
+    '''
+    fails, runs, waits = [0], [], []
+
+    def run_batch(files, TAGS, SUBS, award, jobs=1, done=None, **opts):
+        runs.append([f.name for f in files])
+        for f in files:
+            tries = sum(f.name in run for run in runs)
+            if f.name == '800001.html' and tries <= fails[0]:
+                done({'file': f.name, 'ok': False, 'seconds': 1.0, 'error': 'TimeoutError: too slow', 'missing': []})
+            elif f.name == '800002.html':
+                done({'file': f.name, 'ok': False, 'seconds': 0.1, 'error': 'BadZipFile: no', 'missing': []})
+            else:
+                done({'file': f.name, 'ok': True, 'seconds': 0.1, 'error': None, 'missing': [], 'htm': 'x.htm',
+                      'images': []})
+    monkeypatch.setattr(jobs, 'run_batch', run_batch)
+    monkeypatch.setattr(jobs.time, 'sleep', waits.append)
+    return fails, runs, waits
+
+
+def test_retries_with_backoff(folder, queue, flaky, TAGS, SUBS):
+    fails, runs, waits = flaky
+    fails[0] = 2
+    files = queue.plan(sorted(folder.iterdir()))
+    done = []
+    results = ca.run_jobs(files, TAGS, SUBS, AWARD, queue, retries=2, backoff=5, done=done.append)
+    assert runs == [['800001.html', '800002.html', '800003.html'], ['800001.html'], ['800001.html']]
+    assert waits == [5, 10]                                                         # doubling each time
+    assert [r['ok'] for r in results] == [True, False, True]
+    assert sorted(r['file'] for r in done) == ['800001.html', '800002.html', '800003.html']   # last result only
+    assert attempts(queue) == {'800001.html': 3, '800002.html': 1, '800003.html': 1}
+    assert queue.counts() == {'done': 2, 'failed': 1}
+
+
+def test_gives_up_after_retries(folder, queue, flaky, TAGS, SUBS):
+    fails, runs, waits = flaky
+    fails[0] = 10
+    files = queue.plan(sorted(folder.iterdir()))
+    results = ca.run_jobs(files, TAGS, SUBS, AWARD, queue, retries=1, backoff=0.5)
+    assert len(runs) == 2 and waits == [0.5]
+    assert results[0]['error'] == 'TimeoutError: too slow'
+    assert queue.counts() == {'done': 1, 'failed': 2}
+
+
+def test_attempts_kept_on_resume_until_file_changes(folder, queue, flaky, TAGS, SUBS):
+    fails, _, _ = flaky
+    fails[0] = 10
+    files = sorted(folder.iterdir())
+    ca.run_jobs(queue.plan(files), TAGS, SUBS, AWARD, queue, retries=0)
+    ca.run_jobs(queue.plan(files, resume=True), TAGS, SUBS, AWARD, queue, retries=0)
+    assert attempts(queue)['800001.html'] == 2
+    (folder / '800001.html').write_text('<p>Edited</p>')
+    queue.plan(files, resume=True)
+    assert attempts(queue)['800001.html'] == 0
@@ -0,0 +1,109 @@
+'''
+--legacy-html: re-cleaning a tree or tar archive of already converted html to the same paths in a folder
+or archive, skipping files up to date on a rerun.
+'''
+import io
+import os
+import json
+import shutil
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import convert_articles as ca
+from articles.legacy import LegacyState, legacy_sources
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+AWARD = 'warc'
+
+
+@pytest.fixture
+def tree(tmp_path):
+    src = tmp_path / 'legacy'
+    (src / 'b' / 'c').mkdir(parents=True)
+    shutil.copyfile(HTML, src / 'a.html')
+    shutil.copyfile(HTML, src / 'b' / 'c' / 'y.htm')
+    (src / 'b' / 'z.txt').write_text('not html')
+    (src / 'b' / 'w.html').write_bytes(b'<p>Caf\xe9 \x93quoted\x94</p>')
+    return src
+
+
+def test_folder(tree, tmp_path, config, caplog):
+    out = tmp_path / 'out'
+    with caplog.at_level('WARNING'):
+        results, skipped = ca.run_legacy(tree, out, config, AWARD)
+    assert [r['file'] for r in results] == ['a.html', 'b/c/y.htm', 'b/w.html'] and skipped == 0
+    assert all(r['ok'] and 'html' not in r for r in results)
+    want = ca.convert(HTML.read_text(encoding='utf-8'), AWARD, config, name='a')[0]
+    assert (out / 'a.html').read_text(encoding='utf-8') == want
+    assert (out / 'b' / 'c' / 'y.htm').read_text(encoding='utf-8') == want.replace('/a', '/y')
+    assert (out / 'b' / 'w.html').read_text(encoding='utf-8') == '<p>Café “quoted”</p>'
+    assert 'b/w.html is not utf-8, read as cp1252' in caplog.text
+    assert not (out / 'b' / 'z.txt').exists()
+    assert results[0]['missing'] == ['Implementation, including creative and media development']
+
+
+def test_rerun_skips_up_to_date(tree, tmp_path, config):
+    out = tmp_path / 'out'
+    ca.run_legacy(tree, out, config, AWARD)
+    assert ca.run_legacy(tree, out, config, AWARD) == ([], 3)
+    (tree / 'a.html').write_text('<p>Edited</p>')
+    (out / 'b' / 'c' / 'y.htm').unlink()
+    results, skipped = ca.run_legacy(tree, out, config, AWARD)
+    assert [r['file'] for r in results] == ['a.html', 'b/c/y.htm'] and skipped == 1
+    assert (out / 'a.html').read_text() == '<p>Edited</p>'
+    other = ca.Config(TAGS={**config.TAGS, 'tags': config.TAGS['tags'] + ['div']})   # tags.json changed
+    assert ca.run_legacy(tree, out, other, AWARD)[1] == 0
+
+
+def test_state_forgets_failures(tmp_path):
+    state = LegacyState(tmp_path, ['settings'])
+    (tmp_path / 'a.html').write_text('x')
+    state.done('a.html', [1, 2])
+    assert state.fresh('a.html', [1, 2]) and not state.fresh('a.html', [1, 3])
+    state.done('a.html')
+    state.save()
+    assert json.loads((tmp_path / LegacyState.FILE).read_text())['files'] == {}
+    assert LegacyState(tmp_path, ['other']).files == {}
+
+
+def make_tar(tree, path):
+    with tarfile.open(path, 'w:gz') as tar:
+        tar.add(tree, arcname='.')
+        data = b'<p>escaped</p>'
+        info = tarfile.TarInfo('../escape.html')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def test_tar_to_zip(tree, tmp_path, config, caplog):
+    make_tar(tree, tmp_path / 'legacy.tar.gz')
+    with caplog.at_level('WARNING'):
+        results, skipped = ca.run_legacy(tmp_path / 'legacy.tar.gz', tmp_path / 'out.zip', config, AWARD, jobs=2)
+    assert [r['file'] for r in results] == ['a.html', 'b/c/y.htm', 'b/w.html']
+    assert 'skipped unsafe path in legacy.tar.gz: ../escape.html' in caplog.text
+    with zipfile.ZipFile(tmp_path / 'out.zip') as z:
+        assert sorted(z.namelist()) == ['a.html', 'b/c/y.htm', 'b/w.html', 'manifest.json']
+        assert z.read('b/w.html').decode('utf-8') == '<p>Café “quoted”</p>'
+        manifest = json.loads(z.read('manifest.json'))
+    assert manifest['award'] == 'WARC-AWARDS' and len(manifest['articles']) == 3
+    assert not (tmp_path / LegacyState.FILE).exists()                               # archives are made whole
+
+
+def test_sources_not_read_when_fresh(tree):
+    sources = list(legacy_sources(tree, fresh=lambda name, stamp: name == 'a.html'))
+    assert [(name, source) for name, _, source in sources][0] == ('a.html', None)
+    assert [name for name, _, _ in sources] == ['a.html', 'b/w.html', 'b/c/y.htm']    # each folder's files first
+    st = os.stat(tree / 'b' / 'w.html')
+    assert sources[1][1:] == ([st.st_size, st.st_mtime_ns], tree / 'b' / 'w.html')
+
+
+def test_jobs_same_output(tree, tmp_path, config):
+    written = []
+    for jobs in (1, 3):
+        out = tmp_path / f'out{jobs}'
+        ca.run_legacy(tree, out, config, AWARD, jobs=jobs)
+        written.append({p.relative_to(out).as_posix(): p.read_bytes() for p in out.rglob('*.htm*')})
+    assert sorted(written[0]) == ['a.html', 'b/c/y.htm', 'b/w.html'] and written[0] == written[1]
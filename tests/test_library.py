@@ -0,0 +1,52 @@
+'''
+Library use: convert() takes bytes or text in memory and returns the html and images, touching no files.
+'''
+from pathlib import Path
+
+import pytest
+
+import convert_articles as ca
+from conftest import needs_pandoc
+
+GOLDEN = Path(__file__).resolve().parent / 'golden' / 'input'
+
+
+def test_api():
+    for name in ca.__all__:
+        assert hasattr(ca, name), name
+
+
+def test_html_text(config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    html, images = ca.convert((GOLDEN / '100003.html').read_text(encoding='utf-8'), 'warc', config, name='700001')
+    assert '<h3>Market background and objectives</h3>' in html and images == {}
+    assert list(tmp_path.iterdir()) == []
+
+
+@needs_pandoc
+def test_docx_bytes(config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    html, images = ca.convert((GOLDEN / '100001.docx').read_bytes(), 'warc', config, name='700001')
+    assert sorted(images) == ['700001f01.png', '700001f02.png']
+    assert all(data.startswith(b'\x89PNG') for data in images.values())
+    assert '<img src="/fulltext/WARC-AWARDS/images/700001f01.png"/>' in html
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_bad_award(config):
+    with pytest.raises(ValueError, match='nope not a valid award'):
+        ca.convert('<p>Text</p>', 'nope', config)
+
+
+def test_config_shared(config):
+    a, b = config.article('<p>a</p>', 'warc', 'a'), config.article('<p>b</p>', 'media', 'b')
+    assert a.HEADINGS is b.HEADINGS and a.RULES is b.RULES and a.TAGS is b.TAGS
+    assert (a.AWARD, b.AWARD) == ('WARC Awards', 'Media Awards')
+
+
+def test_document(config):
+    Art = config.article((GOLDEN / '100003.html').read_text(encoding='utf-8'), 'warc', '700001')
+    data = ca.Document(Art, Art.build()).data
+    assert data['id'] == '700001' and data['award'] == 'WARC Awards'
+    assert [s['heading'] for s in data['sections']][:3] == [
+        ca.Manifest.START, 'Executive summary', 'Market background and objectives']
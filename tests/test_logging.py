@@ -0,0 +1,130 @@
+'''
+Logging: sampled per-tag events with a summary per stage, JSON lines, each article's records in its own file,
+and records from worker processes tagged with their article.
+'''
+import sys
+import json
+import shutil
+import logging as log
+import multiprocessing
+from pathlib import Path
+from logging.handlers import QueueListener
+
+import pytest
+
+import convert_articles as ca
+from articles import logger
+from articles.logger import ArticleFilter, ArticleLogs, JsonFormatter, log_article
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+AWARD = 'WARC Awards'
+
+
+class Records(log.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def article(tmp_path, TAGS, SUBS):
+    return ca.Article(tmp_path / '110001.html', TAGS, SUBS, AWARD)
+
+
+@pytest.mark.parametrize('sample, logged', [(2, 2), (0, 5)])
+def test_events_sampled(article, caplog, sample, logged):
+    article.LOG_SAMPLE = sample
+    with caplog.at_level('DEBUG', 'test'):
+        for i in range(5):
+            article.event(log.getLogger('test'), 'footnote ref', 'ref %s', i)
+        article.log_events(log.getLogger('test'), 'amend_html')
+    *events, summary = caplog.records
+    assert [r.getMessage() for r in events] == [f'ref {i}' for i in range(logged)]
+    assert summary.getMessage() == 'amend_html: footnote ref x5'
+    assert (summary.stage, summary.counts) == ('amend_html', {'footnote ref': 5})
+    assert article.EVENTS == {}                                                     # counted afresh
+
+
+def test_events_not_formatted_above_debug(article, caplog):
+    class Loud:
+        def __str__(self):
+            raise AssertionError('formatted')
+    with caplog.at_level('INFO', 'test'):
+        article.event(log.getLogger('test'), 'tag', '%s', Loud())
+        article.log_events(log.getLogger('test'), 'amend_html')
+    assert not caplog.records
+
+
+def test_process_log_sample(tmp_path, TAGS, SUBS, caplog):
+    shutil.copyfile(HTML, tmp_path / '110002.html')
+    with caplog.at_level('DEBUG', 'amend_html'):
+        ca.process(tmp_path / '110002.html', TAGS, SUBS, AWARD, log_sample=1)
+    refs = [r for r in caplog.records if r.name == 'amend_html' and r.getMessage().startswith('collect_notes')]
+    assert len(refs) == 1
+    [summary] = [r for r in caplog.records if getattr(r, 'stage', None) == 'amend_html']
+    assert summary.counts['collect_notes'] == 6
+
+
+def record(msg, **extra):
+    r = log.LogRecord('ArticleClass', log.WARNING, __file__, 1, msg, (), None)
+    r.__dict__.update(extra)
+    ArticleFilter().filter(r)
+    return r
+
+
+def test_json_lines():
+    with log_article('110003'):
+        r = record('missing headings', stage='amend_html', counts={'tag': 2})
+    entry = json.loads(JsonFormatter().format(r))
+    assert entry['article'] == '110003' and entry['level'] == 'WARNING' and entry['logger'] == 'ArticleClass'
+    assert (entry['message'], entry['stage'], entry['counts']) == ('missing headings', 'amend_html', {'tag': 2})
+    assert entry['time'] and entry['pid']
+    assert json.loads(JsonFormatter().format(record('outside')))['article'] is None
+    try:
+        raise KeyError('x')
+    except KeyError:
+        r = record('failed', exc_info=sys.exc_info())
+    assert 'KeyError' in json.loads(JsonFormatter().format(r))['exception']
+
+
+def test_article_tags_nest():
+    with log_article('a'):
+        with log_article('b'):
+            assert record('x').article == 'b'
+        assert record('x').article == 'a'
+    assert record('x').article is None
+
+
+def test_article_logs(tmp_path, monkeypatch):
+    monkeypatch.setattr(ArticleLogs, 'OPEN', 2)
+    h = ArticleLogs(tmp_path / 'run')
+    h.setFormatter(log.Formatter('%(message)s'))
+    h.handle(record('no article'))
+    assert not (tmp_path / 'run').exists()
+    for article, msg in [('a', 'one'), ('b', 'two'), ('c', 'three'), ('a', 'four')]:
+        with log_article(article):
+            h.handle(record(msg))
+        assert len(h.files) <= 2                                                    # least recently used closed
+    h.close()
+    files = {p.name: p.read_text() for p in (tmp_path / 'run').iterdir()}
+    assert files == {'a.log': 'one\nfour\n', 'b.log': 'two\n', 'c.log': 'three\n'}
+
+
+def test_workers_log_through_queue(tmp_path, TAGS, SUBS, monkeypatch):
+    for name in ('110004.html', '110005.html'):
+        shutil.copyfile(HTML, tmp_path / name)
+    queue, records = multiprocessing.Queue(), Records()
+    monkeypatch.setattr(logger, '_log_queue', queue)
+    listener = QueueListener(queue, records)
+    listener.start()
+    try:
+        ca.run_batch(sorted(tmp_path.glob('*.html')), TAGS, SUBS, AWARD, jobs=2)
+    finally:
+        listener.stop()
+    wrote = {r.article: r.process for r in records.records if r.getMessage().startswith('wrote file')}
+    assert sorted(wrote) == ['110004', '110005']
+    assert multiprocessing.current_process().pid not in wrote.values()
+    assert all(r.article for r in records.records if r.name == 'amend_html')
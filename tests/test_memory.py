@@ -0,0 +1,91 @@
+'''
+Low memory mode and --max-memory: the same output with less of the article held at once, and a clear
+MemoryError when a worker goes over its limit.
+'''
+import os
+import shutil
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import convert_articles as ca
+from articles.util import memory_limit
+from bench.bench_convert import make_docx
+from conftest import needs_pandoc
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+AWARD = 'WARC Awards'
+
+
+def convert_both(src, tmp_path, TAGS, SUBS):
+    '''
+    Processes src normally and in low memory mode, returning the two htm folders.
+    '''
+    folders = []
+    for low_memory in (False, True):
+        work = tmp_path / ('low' if low_memory else 'normal')
+        work.mkdir()
+        shutil.copyfile(src, work / src.name)
+        Art = ca.process(work / src.name, TAGS, SUBS, AWARD, low_memory=low_memory)
+        assert all(isinstance(v, Path) for v in Art.IMAGES.values()) == low_memory or not Art.IMAGES
+        folders.append(work / 'htm')
+    return folders
+
+
+def assert_same(a, b):
+    assert sorted(p.name for p in a.iterdir()) == sorted(p.name for p in b.iterdir())
+    for p in a.iterdir():
+        assert p.read_bytes() == (b / p.name).read_bytes(), p.name
+
+
+def test_low_memory_html_same_output(tmp_path, TAGS, SUBS):
+    assert_same(*convert_both(HTML, tmp_path, TAGS, SUBS))
+
+
+@needs_pandoc
+def test_low_memory_docx_same_output(tmp_path, TAGS, SUBS):
+    src = tmp_path / '300001.docx'
+    make_docx(src, paras=30, images=4, formats=('png', 'tif'), footnotes=2, SUBS=SUBS, size=48)
+    normal, low = convert_both(src, tmp_path, TAGS, SUBS)
+    assert_same(normal, low)
+    assert sorted(p.suffix for p in low.iterdir()) == ['.htm', '.jpg', '.jpg', '.png', '.png']   # no spilled tifs
+
+
+def test_low_memory_drops_data_uris(tmp_path, TAGS, SUBS):
+    f = tmp_path / '300002.html'
+    f.write_text('<p>Logo <img alt="logo" src="data:image/png;base64,iVBORw0KGgo="> here</p>')
+    assert 'data:image' in ca.Article(f, TAGS, SUBS, AWARD).html()
+    assert ca.Article(f, TAGS, SUBS, AWARD, LOW_MEMORY=True).html() == '<p>Logo <img alt="logo"> here</p>'
+
+
+def allocate(limit, mb):
+    with memory_limit(limit):
+        return len(bytearray(mb * 2**20))
+
+
+def out_of_memory(limit):
+    with memory_limit(limit):
+        raise RuntimeError('Pandoc died with exitcode "251": pandoc: out of memory')
+
+
+def test_limit_in_worker():
+    with ProcessPoolExecutor(1) as pool:
+        assert pool.submit(allocate, 500, 10).result() == 10 * 2**20
+        with pytest.raises(MemoryError, match='over the --max-memory limit of 500 MB'):
+            pool.submit(allocate, 500, 2000).result()
+        with pytest.raises(MemoryError, match='^pandoc ran out of memory'):
+            pool.submit(out_of_memory, 500).result()
+        assert pool.submit(allocate, None, 1000).result() == 1000 * 2**20      # the limit was lifted after
+
+
+def test_no_limit_in_main_process(caplog):
+    with caplog.at_level('WARNING'):
+        assert allocate(1, 10) == 10 * 2**20
+    assert 'only limits worker processes' in caplog.text
+
+
+def test_batch_with_limit_runs_in_worker(tmp_path, TAGS, SUBS):
+    shutil.copyfile(HTML, tmp_path / '300003.html')
+    [result] = ca.run_batch([tmp_path / '300003.html'], TAGS, SUBS, AWARD, max_memory=500, profile=True)
+    assert result['ok'] and result['pid'] != os.getpid()
@@ -0,0 +1,59 @@
+'''
+ImageOptimiser: resizes and recompresses images for the web, with optional .webp / .avif siblings.
+'''
+import io
+
+import pytest
+
+import convert_articles as ca
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def image(fmt, width=400, height=200):
+    out = io.BytesIO()
+    im = Image.new('RGB', (width, height))
+    im.putdata([((x * 7) % 256, (y * 3) % 256, (x * y) % 256) for y in range(height) for x in range(width)])
+    im.save(out, fmt)
+    return out.getvalue()
+
+
+def size(data):
+    with Image.open(io.BytesIO(data)) as im:
+        return im.size
+
+
+def test_resizes_wide_images_keeping_names():
+    out = ca.ImageOptimiser(max_width=100)({'1f01.png': image('PNG'), '1f02.jpg': image('JPEG', 50, 50)})
+    assert sorted(out) == ['1f01.png', '1f02.jpg']
+    assert size(out['1f01.png']) == (100, 50)
+    assert size(out['1f02.jpg']) == (50, 50)
+
+
+def test_keeps_original_unless_smaller():
+    low = io.BytesIO()
+    Image.open(io.BytesIO(image('PNG'))).save(low, 'JPEG', quality=10)
+    low = low.getvalue()
+    assert ca.ImageOptimiser(quality=95)({'1f01.jpg': low})['1f01.jpg'] == low      # would be bigger
+    png = image('PNG')
+    assert len(ca.ImageOptimiser()({'1f01.png': png})['1f01.png']) <= len(png)
+
+
+def test_siblings():
+    out = ca.ImageOptimiser(max_width=100, webp=True)({'1f01.png': image('PNG')})
+    assert sorted(out) == ['1f01.png', '1f01.webp']
+    with Image.open(io.BytesIO(out['1f01.webp'])) as im:
+        assert (im.format, im.size) == ('WEBP', (100, 50))
+
+
+def test_skips_other_formats():
+    assert ca.ImageOptimiser()({'1f01.gif': b'GIF89a'}) == {}
+
+
+def test_cache(tmp_path, monkeypatch):
+    png = image('PNG')
+    first = ca.ImageOptimiser(max_width=100, webp=True, cache_dir=tmp_path)({'1f01.png': png})
+    monkeypatch.setattr(Image, 'open', lambda *args: pytest.fail('optimised again'))
+    again = ca.ImageOptimiser(max_width=100, webp=True, cache_dir=tmp_path)({'2f01.png': png})
+    assert again == {'2f01.png': first['1f01.png'], '2f01.webp': first['1f01.webp']}
+    assert ca.ImageOptimiser(max_width=100).settings() != ca.ImageOptimiser(max_width=200).settings()
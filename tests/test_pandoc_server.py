@@ -0,0 +1,97 @@
+'''
+The warm pandoc server backend, against a stand-in for `pandoc server`'s JSON api.
+'''
+import json
+import time
+import base64
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import convert_articles as ca
+from articles import pandoc
+
+DOCX = Path(__file__).resolve().parent / 'golden' / 'input' / '100001.docx'
+
+
+class FakePandoc(BaseHTTPRequestHandler):
+    '''
+    Answers like pandoc server: the html for docx, an error for 'fail' and nothing for a while for 'slow'.
+    '''
+    requests = []
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.requests.append(req)
+        if req['text'] == 'fail':
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b'Unknown input format')
+            return
+        if req['text'] == 'slow':
+            time.sleep(0.5)
+        out = {'output': '<p><strong>Executive summary</strong></p>\n<p>Text.</p>', 'base64': False,
+               'messages': [{'message': 'note'}]}
+        if req['text'] == 'b64':
+            out.update(output=base64.b64encode('<p>é</p>'.encode('utf-8')).decode('ascii'), base64=True)
+        body = json.dumps(out).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakePandoc)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    FakePandoc.requests.clear()
+    yield ca.PandocServer(url=f'http://127.0.0.1:{httpd.server_address[1]}/', timeout=5)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_sends_docx_base64(server):
+    html = server.convert(b'PK\x03\x04docx', 'docx', 'html5')
+    assert html.startswith('<p><strong>Executive summary')
+    req = FakePandoc.requests[-1]
+    assert (req['from'], req['to']) == ('docx', 'html5')
+    assert base64.b64decode(req['text']) == b'PK\x03\x04docx'
+
+
+def test_base64_output(server):
+    assert server.convert('b64', 'html', 'html5') == '<p>é</p>'
+
+
+def test_error(server):
+    with pytest.raises(RuntimeError, match='Unknown input format'):
+        server.convert('fail', 'html', 'html5')
+
+
+def test_timeout(server):
+    with pytest.raises(TimeoutError):
+        server.convert('slow', 'html', 'html5', timeout=0.2)
+
+
+def test_unreachable():
+    with pytest.raises(RuntimeError, match='not reachable'):
+        ca.PandocServer(url='http://127.0.0.1:9/', timeout=1).convert('x', 'html', 'html5')
+
+
+def test_workers_use_servers_url(server, monkeypatch):
+    monkeypatch.setenv('PANDOC_SERVER_URL', server.url)
+    monkeypatch.setattr(pandoc, '_pandoc_server', None)
+    assert ca.pandoc_server().url == server.url
+    assert ca.pandoc_server() is ca.pandoc_server()
+
+
+def test_server_backend(server, monkeypatch):
+    monkeypatch.setattr(pandoc, '_pandoc_server', server)
+    html, _ = ca.convert(DOCX.read_bytes(), 'warc', ca.Config(backend='server'), name='100001')
+    assert '<h3>Executive summary</h3>' in html
+    assert FakePandoc.requests[-1]['from'] == 'docx'
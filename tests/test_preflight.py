@@ -0,0 +1,81 @@
+'''
+--preflight: quick checks of each docx from its zip and XML, without pandoc, so broken files are skipped
+and problems flagged before converting anything.
+'''
+import zipfile
+
+import pytest
+
+import convert_articles as ca
+from articles.preflight import Preflight
+from bench.bench_convert import make_docx
+
+AWARD = 'WARC Awards'
+CHART = ('<Relationship Id="rId900" Target="charts/chart1.xml" '
+         'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/chart"/>')
+
+
+def edit_docx(path, part, edit):
+    '''
+    Rewrites one part of a docx with edit(text).
+    '''
+    with zipfile.ZipFile(path) as z:
+        parts = {name: z.read(name) for name in z.namelist()}
+    parts[part] = edit(parts[part].decode('utf-8')).encode('utf-8')
+    with zipfile.ZipFile(path, 'w') as z:
+        for name, data in parts.items():
+            z.writestr(name, data)
+
+
+@pytest.fixture
+def docx(tmp_path, SUBS):
+    path = tmp_path / '700001.docx'
+    make_docx(path, paras=30, images=3, formats=('png', 'tif', 'emf'), footnotes=0, headings=4, SUBS=SUBS, size=48)
+    return path
+
+
+def test_good_docx(docx, SUBS):
+    result = Preflight(SUBS, AWARD).check(docx)
+    assert result == {'file': '700001.docx', 'ok': True, 'error': None, 'images': {'.png': 1, '.tif': 1, '.emf': 1},
+                      'tables': 0, 'charts': 0, 'missing': [], 'warnings': ['1 tif, 1 emf images converted to jpg, '
+                                                                            'check them']}
+
+
+def test_tables_charts_and_missing_headings(tmp_path, SUBS):
+    path = tmp_path / '700002.docx'
+    make_docx(path, paras=30, images=0, footnotes=0, headings=2, SUBS=SUBS)
+    edit_docx(path, 'word/document.xml', lambda xml: xml.replace('</w:body>', '<w:tbl/><w:tbl/></w:body>'))
+    edit_docx(path, 'word/_rels/document.xml.rels',
+              lambda xml: xml.replace('</Relationships>', CHART + '</Relationships>'))
+    result = Preflight(SUBS, AWARD).check(path)
+    assert (result['ok'], result['tables'], result['charts']) == (True, 2, 1)
+    assert result['missing'] == ['Implementation, including creative and media development',
+                                 'Performance against objectives']
+    assert result['warnings'] == ['2 tables, check their layout', '1 charts, pandoc leaves them out',
+                                  'missing headings: Implementation, including creative and media development, '
+                                  'Performance against objectives']
+
+
+def test_broken_files(tmp_path, docx, SUBS):
+    (tmp_path / 'notzip.docx').write_bytes(b'not a zip')
+    with zipfile.ZipFile(tmp_path / 'nodoc.docx', 'w') as z:
+        z.writestr('word/other.xml', '<x/>')
+    edit_docx(docx, 'word/document.xml', lambda xml: xml)                          # stored, not deflated
+    (tmp_path / 'crc.docx').write_bytes(docx.read_bytes().replace(b'<w:body>', b'<w:BODY>'))
+    errors = {f: Preflight(SUBS, AWARD).check(tmp_path / f)['error'] for f in ('notzip.docx', 'nodoc.docx', 'crc.docx')}
+    assert errors['notzip.docx'].startswith('BadZipFile')
+    assert errors['nodoc.docx'] == 'ValueError: no word/document.xml, not a docx'
+    assert errors['crc.docx'] == 'BadZipFile: corrupt part word/document.xml'
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_batch_in_order(tmp_path, docx, SUBS, jobs, caplog):
+    (tmp_path / '700000.docx').write_bytes(b'not a zip')
+    files = [docx, tmp_path / '700000.docx']
+    checks = ca.run_preflight(files, SUBS, AWARD, jobs=jobs)
+    assert [c['file'] for c in checks] == ['700001.docx', '700000.docx']
+    assert [c['ok'] for c in checks] == [True, False] and all(c['seconds'] >= 0 for c in checks)
+    with caplog.at_level('INFO'):
+        ca.log_preflight(checks, 0.5)
+    assert 'INVALID 700000.docx' in caplog.text and 'check   700001.docx (1 emf, 1 png, 1 tif)' in caplog.text
+    assert 'preflight: 2 files, 1 invalid, 1 to check in 0.50s' in caplog.text
@@ -0,0 +1,73 @@
+'''
+Per-stage timing and memory, and the run report and trace written from it.
+'''
+import csv
+import json
+import shutil
+import threading
+from pathlib import Path
+
+import convert_articles as ca
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+
+
+def test_nested_stages_summed():
+    p = ca.Profiler()
+    for _ in range(3):
+        with p.stage('amend_html'):
+            with p.stage('rule'):
+                pass
+    rows = {r['stage']: r for r in p.report()}
+    assert list(rows) == ['amend_html', 'amend_html/rule']
+    assert rows['amend_html']['calls'] == 3 and rows['amend_html/rule']['calls'] == 3
+    assert rows['amend_html']['wall'] >= rows['amend_html/rule']['wall']
+    assert rows['amend_html']['peak_kb'] is None
+
+
+def test_threads_nest_apart():
+    p = ca.Profiler()
+
+    def work():
+        with p.stage('image_cleanup'):
+            pass
+    with p.stage('rename_docx_images'):
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+    assert [r['stage'] for r in p.report()] == ['rename_docx_images', 'image_cleanup']
+
+
+def test_memory():
+    p = ca.Profiler(memory=True)
+    with p.stage('big'):
+        data = [bytearray(1024) for _ in range(1000)]
+    del data
+    assert p.report()[0]['peak_kb'] >= 1000
+
+
+def test_report_and_trace(tmp_path, TAGS, SUBS):
+    files = []
+    for name in ('500001.html', '500002.html'):
+        shutil.copyfile(HTML, tmp_path / name)
+        files.append(tmp_path / name)
+    results = ca.run_batch(files, TAGS, SUBS, 'WARC Awards', profile=True, trace=True)
+    stages = {row['stage'] for row in results[0]['stages']}
+    assert {'parse', 'amend_html', 'write_html'} <= stages
+    totals = {t['stage']: t for t in ca.stage_totals(results)}
+    assert totals['amend_html']['files'] == 2 and totals['amend_html']['slowest'] in ('500001.html', '500002.html')
+
+    ca.write_report(results, tmp_path / 'report.json')
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert report['version'] == ca.__version__
+    assert [f['file'] for f in report['files']] == ['500001.html', '500002.html']
+    assert 'events' not in report['files'][0]
+    ca.write_report(results, tmp_path / 'report.csv')
+    with open(tmp_path / 'report.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert {r['file'] for r in rows} == {'500001.html', '500002.html'} and rows[0]['stage']
+
+    ca.write_trace(results, tmp_path / 'trace.json')
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert {e['args']['file'] for e in events} == {'500001.html', '500002.html'}
+    assert min(e['ts'] for e in events) == 0 and all(e['ph'] == 'X' for e in events)
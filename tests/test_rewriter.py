@@ -0,0 +1,88 @@
+'''
+The single pass Rewriter amend_html runs its rules on.
+'''
+from contextlib import contextmanager
+
+from bs4 import BeautifulSoup as Soup
+
+from articles.markup import Rewriter, Sanitizer
+
+
+def soup(html):
+    return Soup(html, 'html.parser')
+
+
+def test_children_before_parents():
+    rw, seen = Rewriter(), []
+    rw.rule('p', 'li', 'ul', 'em')(lambda tag: seen.append(tag.name))
+    rw.run(soup('<ul><li><p><em>a</em></p></li></ul><p>b</p>'))
+    assert seen == ['em', 'p', 'li', 'ul', 'p']
+
+
+def test_renamed_tag_gets_later_rules():
+    rw, seen = Rewriter(), []
+
+    @rw.rule('h2')
+    def rename(tag):
+        tag.name = 'p'
+
+    @rw.rule('p')
+    def para(tag):
+        seen.append(tag.get_text())
+    rw.run(soup('<h2>Heading</h2><p>Text</p>'))
+    assert seen == ['Heading', 'Text']
+
+
+def test_new_and_removed_tags():
+    rw, seen = Rewriter(), []
+
+    @rw.rule('img')
+    def wrap(tag):
+        tag.wrap(tree.new_tag('p'))
+
+    @rw.rule('span')
+    def unwrap(tag):
+        tag.unwrap()
+
+    @rw.rule('p', 'span')
+    def after(tag):
+        seen.append(tag.name)
+    tree = soup('<div><img src="a.png"/><span>x</span></div>')
+    rw.run(tree)
+    assert str(tree) == '<div><p><img src="a.png"/></p>x</div>'
+    assert seen == []                                               # made by a rule, or gone
+
+
+def test_deferred_and_finish_order():
+    rw, seen = Rewriter(), []
+    rw.rule('li', defer=True)(lambda tag: seen.append(('deferred', tag.get_text())))
+    rw.rule('li')(lambda tag: seen.append(('walk', tag.get_text())))
+    rw.finish(lambda tree: seen.append(('finish', None)))
+    rw.run(soup('<ol><li>a<ul><li>b</li></ul></li><li>c</li></ol>'))
+    assert seen == [('walk', 'b'), ('walk', 'ab'), ('walk', 'c'),
+                    ('deferred', 'ab'), ('deferred', 'b'), ('deferred', 'c'), ('finish', None)]
+
+
+def test_rules_only_see_allowed_tags():
+    rw, seen = Rewriter(Sanitizer({'tags': ['p', 'a'], 'attrs': {'a': ['href']}})), []
+    rw.rule('p', 'a', 'div', 'span')(lambda tag: seen.append((tag.name, dict(tag.attrs))))
+    tree = soup('<div><p class="x">a <span>b</span> <a href="javascript:x()" id="y">c</a></p></div><!-- c -->')
+    rw.run(tree)
+    assert seen == [('a', {}), ('p', {})]
+    assert str(tree) == '<p>a b <a>c</a></p>'
+
+
+def test_stage_times_walk_and_rules():
+    stages = []
+
+    @contextmanager
+    def stage(name):
+        stages.append(name)
+        yield
+    rw = Rewriter(stage=stage)
+
+    @rw.rule('p')
+    def amend_paras(tag):
+        pass
+    rw.run(soup('<p>a</p><p>b</p>'))
+    assert stages == ['walk', 'amend_paras', 'amend_paras']
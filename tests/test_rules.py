@@ -0,0 +1,101 @@
+'''
+JSON/rules.json: amend_html's rules as data, validated and compiled once, and cached between runs.
+'''
+import os
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+import convert_articles as ca
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100003.html'
+AWARD = 'WARC Awards'
+
+
+def rules(*rules):
+    return {'version': 1, 'rules': list(rules)}
+
+
+def amend(html, TAGS, SUBS, tmp_path, rules=None):
+    f = tmp_path / '900001.html'
+    f.write_text(html, encoding='utf-8')
+    return str(ca.Article(f, TAGS, SUBS, AWARD, RULES=rules).build())
+
+
+@pytest.mark.parametrize('spec, error', [
+    ([], 'expected {"version": 1'),
+    ({'version': 2, 'rules': []}, 'expected {"version": 1'),
+    (rules('p'), 'rule 1 (None): a rule is an object'),
+    (rules({'select': 'p', 'actions': [{'remove': True}], 'when': {}}), 'rule 1 (rule_1): unknown keys when'),
+    (rules({'name': 'x', 'actions': [{'remove': True}]}), 'rule 1 (x): needs "select" tag names'),
+    (rules({'select': 'p', 'finish': True, 'actions': [{'footnotes': {}}]}), 'needs "select" tag names'),
+    (rules({'finish': True, 'if': {'has': 'a'}, 'actions': [{'footnotes': {}}]}), "can't have if, unless or defer"),
+    (rules({'select': 'p', 'if': {'has_text': 'a'}, 'actions': [{'remove': True}]}), 'unknown test has_text'),
+    (rules({'select': 'p', 'if': {'has': 1}, 'actions': [{'remove': True}]}), 'bad argument for has: 1'),
+    (rules({'select': 'p', 'if': {'text_matches': '('}, 'actions': [{'remove': True}]}), 'bad regex for text_matches'),
+    (rules({'select': 'p', 'actions': [{'delete': True}]}), 'unknown action delete'),
+    (rules({'select': 'p', 'actions': [{'remove': True, 'rename': 'div'}]}), 'each action is one'),
+    (rules({'select': 'p', 'actions': [{'rename': True}]}), 'bad argument for rename: True'),
+    (rules({'select': 'p', 'actions': [{'footnotes': {}}]}), 'footnotes is only for finish rules'),
+    (rules({'finish': True, 'actions': [{'remove': True}]}), 'remove is not for finish rules'),
+    (rules({'select': 'p', 'actions': [{'insert_heading': {'tag': 'h3'}}]}), 'insert_heading needs a "text"'),
+    (rules({'select': 'p', 'actions': [{'remove': False}]}), 'no actions'),
+])
+def test_invalid_rules(spec, error):
+    with pytest.raises(ValueError) as e:
+        ca.Rules(spec, source='test.json')
+    assert error in str(e.value) and str(e.value).startswith('test.json')
+
+
+def test_custom_rules(TAGS, SUBS, tmp_path):
+    custom = ca.Rules(rules(
+        {'name': 'drop_notes', 'select': 'p', 'if': {'text_matches': r'^Note:'}, 'actions': [{'remove': True}]},
+        {'select': 'ul', 'unless': {'parent': 'li'}, 'actions': [{'insert_heading': {'text': 'Points'}}]},
+        {'select': 'li', 'if': {'text_endswith': '!'}, 'actions': [{'wrap_text': 'em'}]},
+    ))
+    html = amend('<p>Note: internal</p><p>Kept</p><ul><li>One!</li><li>Two</li></ul>', TAGS, SUBS, tmp_path, custom)
+    assert html == '<p>Kept</p><h3>Points</h3>\n<ul><li><em>One!</em></li><li>Two</li></ul>'
+
+
+def test_rules_only_make_allowed_tags(TAGS, SUBS, tmp_path):
+    custom = ca.Rules(rules({'select': 'p', 'actions': [{'rename': 'marquee'}]}), source='mine.json')
+    with pytest.raises(ValueError, match="mine.json: rules make tags tags.json doesn't allow: marquee"):
+        amend('<p>Text</p>', TAGS, SUBS, tmp_path, custom)
+
+
+def test_dump_restore(TAGS, SUBS, tmp_path):
+    default = ca.Rules.load()
+    restored = ca.Rules.restore(json.loads(json.dumps(default.dump())))
+    assert (restored.rules, restored.digest, restored.creates) == (default.rules, default.digest, default.creates)
+    html = HTML.read_text(encoding='utf-8')
+    assert amend(html, TAGS, SUBS, tmp_path, restored) == amend(html, TAGS, SUBS, tmp_path, default)
+
+
+def test_load_errors(tmp_path):
+    (tmp_path / 'rules.json').write_text('{"version": 1,')
+    with pytest.raises(ValueError, match='^rules.json: '):
+        ca.Rules.load(tmp_path / 'rules.json')
+    with pytest.raises(FileNotFoundError):
+        ca.Rules.load(tmp_path / 'none.json')
+
+
+def test_load_cache(tmp_path, monkeypatch):
+    path = tmp_path / 'rules.json'
+    shutil.copyfile(ca.Rules.FILE, path)
+    cache = tmp_path / 'cache'
+    first = ca.Rules.load(path, cache)
+    [cached] = (cache / 'rules').iterdir()
+    compiled, compile = [], ca.Rules.compile
+    monkeypatch.setattr(ca.Rules, 'compile', lambda self, i, rule: compiled.append(i) or compile(self, i, rule))
+    assert ca.Rules.load(path, cache).rules == first.rules and not compiled        # unchanged, restored
+    os.utime(path, ns=(0, 0))
+    assert ca.Rules.load(path, cache).rules == first.rules and not compiled        # touched, same sha256
+    spec = json.loads(path.read_text())
+    del spec['rules'][0]
+    path.write_text(json.dumps(spec))
+    assert len(ca.Rules.load(path, cache).rules) == len(first.rules) - 1 and compiled
+    compiled.clear()
+    cached.write_text('{not json')
+    assert len(ca.Rules.load(path, cache).rules) == len(first.rules) - 1 and compiled   # corrupt, compiled again
@@ -0,0 +1,47 @@
+'''
+The Sanitizer that replaced bleach.clean gives the same html as bleach followed by a reparse.
+'''
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup as Soup
+
+from articles.markup import Rewriter, Sanitizer
+
+GOLDEN = Path(__file__).resolve().parent / 'golden' / 'input'
+CASES = [
+    '<p>Plain <strong>bold</strong> and <em>em</em>.</p>',
+    '<div class="x"><p id="a" style="color:red">In a div</p></div>\n<p>After</p>',
+    '<section><h2 id="h">Heading</h2>\n<p>Text</p></section>',
+    '<p>Image <img src="media/image1.png" style="width:1in" alt="A chart"/> inline</p>',
+    '<p><a href="https://www.warc.com/" target="_blank">ok</a> <a href="javascript:alert(1)">js</a> '
+    '<a href="mailto:a@b.c">mail</a> <a href="/rel">rel</a></p>',
+    '<p>Comment <!-- hidden --> gone</p><!-- top level -->',
+    '<script>alert("x")</script><style>p {}</style><p>After scripts</p>',
+    '<ul>\n<li><p>One</p></li>\n<li><span class="u">Two</span></li>\n</ul>',
+    '<table><thead><tr><th>A</th></tr></thead><tbody><tr><td><p>1</p></td></tr></tbody></table>',
+    '<p>Entities &amp; &lt;tags&gt; &quot;quotes&quot; caf&eacute; x&nbsp;y</p>',
+    '<blockquote><p>Quote</p></blockquote><figure><img src="a.png"/><figcaption>Cap</figcaption></figure>',
+    '<p><span><span>nested</span> spans</span> and <u>underline</u><sup>1</sup></p>',
+]
+
+
+def bleached(html, TAGS):
+    import bleach
+    return str(Soup(bleach.clean(html, tags=TAGS['tags'], attributes=TAGS['attrs'], strip=True), 'html.parser'))
+
+
+def sanitized(html, TAGS):
+    return str(Rewriter(Sanitizer(TAGS)).run(Soup(html, 'html.parser')))
+
+
+@pytest.mark.parametrize('html', CASES + [f.read_text(encoding='utf-8') for f in sorted(GOLDEN.glob('*.html'))])
+def test_same_as_bleach(html, TAGS):
+    pytest.importorskip('bleach')
+    assert sanitized(html, TAGS) == bleached(html, TAGS)
+
+
+def test_allow_list(TAGS):
+    out = sanitized('<p class="x"><a href="http://a" role="doc-noteref" title="t" onclick="x()">a</a>'
+                    '<font>f</font></p>', TAGS)
+    assert out == '<p><a href="http://a" role="doc-noteref">a</a>f</p>'
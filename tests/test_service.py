@@ -0,0 +1,127 @@
+'''
+The --serve http service, run in its own process with a pandoc that never finishes, so docx uploads time out.
+'''
+import io
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import zipfile
+import threading
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from conftest import ROOT
+
+GOLDEN = Path(__file__).resolve().parent / 'golden' / 'input'
+TIMEOUT = 1.5
+SERVE = ('from articles.batch import Config; from articles.service import Service; '
+         f'Service(Config(), port=int(__import__("sys").argv[1]), jobs=1, queue=0, timeout={TIMEOUT}, '
+         'max_upload=2**20).run()')
+
+
+@pytest.fixture(scope='module')
+def port(tmp_path_factory):
+    fake = tmp_path_factory.mktemp('pandoc') / 'pandoc'
+    fake.write_text(f'#!{sys.executable}\nimport sys, time\n'
+                    'if "--version" in sys.argv:\n    print("pandoc 3.9")\nelse:\n    time.sleep(30)\n')
+    fake.chmod(0o755)
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, '-c', SERVE, str(port)], cwd=ROOT,
+                            env={**os.environ, 'PYPANDOC_PANDOC': str(fake)},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while request(port, b'GET /health HTTP/1.1\r\n\r\n', check=False) is None:
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            pytest.fail('service did not start')
+        time.sleep(0.1)
+    yield port
+    proc.send_signal(signal.SIGTERM)
+    assert proc.wait(30) == 0
+
+
+def request(port, raw, check=True):
+    '''
+    Sends a raw request, returns the status, headers and body, or None if the service isn't up yet.
+    '''
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=30) as s:
+            s.sendall(raw)
+            data = b''
+            while chunk := s.recv(65536):
+                data += chunk
+    except OSError:
+        if check:
+            raise
+        return None
+    head, _, body = data.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, body
+
+
+def post(port, body, query='award=warc&name=800001', content_type='application/octet-stream'):
+    head = (f'POST /convert?{query} HTTP/1.1\r\nContent-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n').encode('latin-1')
+    return request(port, head + body)
+
+
+def test_html_upload(port):
+    status, headers, body = post(port, (GOLDEN / '100003.html').read_bytes(), content_type='text/html')
+    assert status == 200 and headers['Content-Type'] == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(body)) as z:
+        assert z.namelist() == ['800001.htm']
+        assert '<h3>Executive summary</h3>' in z.read('800001.htm').decode('utf-8')
+    assert headers['X-Missing-Headings'] == 'Implementation, including creative and media development'
+
+
+def test_form_upload(port):
+    boundary = 'xyz'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="award"\r\n\r\nwarc\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="800002.html"\r\n'
+            f'Content-Type: text/html\r\n\r\n<p>Text</p>\r\n--{boundary}--\r\n').encode('utf-8')
+    status, headers, _ = post(port, body, query='', content_type=f'multipart/form-data; boundary={boundary}')
+    assert status == 200 and headers['Content-Disposition'] == 'attachment; filename="800002.zip"'
+
+
+@pytest.mark.parametrize('raw, status', [
+    (b'POST /convert?award=warc HTTP/1.1\r\n\r\n', 411),
+    (b'POST /convert?award=warc HTTP/1.1\r\nContent-Length: many\r\n\r\n', 400),
+    (b'POST /convert?award=warc HTTP/1.1\r\nContent-Length: 10485760\r\n\r\n', 413),
+    (b'GET /convert HTTP/1.1\r\n\r\n', 405),
+    (b'GET /other HTTP/1.1\r\n\r\n', 404),
+])
+def test_bad_requests(port, raw, status):
+    assert request(port, raw)[0] == status
+
+
+def test_bad_uploads(port):
+    assert post(port, b'<p>Text</p>', query='name=x', content_type='text/html')[0] == 400           # no award
+    assert post(port, b'<p>Text</p>', query='award=nope', content_type='text/html')[0] == 400
+    assert post(port, b'plain text')[0] == 415
+    status, _, body = post(port, b'PK\x03\x04 not really a docx')
+    assert status == 422 and 'could not convert' in json.loads(body)['error']
+
+
+def test_timeout_and_busy(port):
+    docx = (GOLDEN / '100001.docx').read_bytes()
+    slow = {}
+    t = threading.Thread(target=lambda: slow.update(r=post(port, docx)))
+    t.start()
+    time.sleep(TIMEOUT / 3)
+    status, headers, _ = post(port, b'<p>Text</p>', content_type='text/html')
+    assert status == 503 and headers['Retry-After'] == '5'                        # jobs=1, queue=0
+    t.join()
+    assert slow['r'][0] == 504
+    deadline = time.monotonic() + 10                                              # slot freed once pandoc is stopped
+    while json.loads(request(port, b'GET /health HTTP/1.1\r\n\r\n')[2])['busy']:
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+    assert post(port, b'<p>Text</p>', content_type='text/html')[0] == 200
@@ -0,0 +1,33 @@
+'''
+Fast cli startup: importing loads none of the slow dependencies, and --version, --help and argument
+errors return before the logs are set up.
+'''
+import sys
+import subprocess
+
+import pytest
+
+import convert_articles as ca
+from conftest import ROOT
+
+HEAVY = ['bs4', 'pypandoc', 'natsort', 'PIL', 'urllib.request', 'zipfile', 'concurrent.futures.process']
+
+
+def run(*args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True)
+
+
+def test_import_is_light():
+    p = run('-c', f'import sys, convert_articles; print(" ".join(m for m in {HEAVY!r} if m in sys.modules))')
+    assert p.returncode == 0 and p.stdout.split() == []
+
+
+@pytest.mark.parametrize('args, code', [(['--version'], 0), (['--help'], 0), (['a.docx', 'warc', '--jobs', 'many'], 2)])
+def test_no_logs_before_args(args, code):
+    logs = (ROOT / 'logs').exists()
+    p = run('convert.py', *args)
+    assert p.returncode == code
+    if not logs:
+        assert not (ROOT / 'logs').exists()
+    if args == ['--version']:
+        assert ca.__version__ in p.stdout
@@ -0,0 +1,88 @@
+'''
+Watch mode: files are converted once they've settled, and a state file keeps restarts from redoing them.
+'''
+import time
+import shutil
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import convert_articles as ca
+from articles import watch
+from articles.logger import log_args
+
+HTML = Path(__file__).resolve().parent / 'golden' / 'input' / '100004.html'
+
+
+@pytest.fixture
+def watcher(tmp_path, TAGS, SUBS):
+    return ca.Watcher(tmp_path, TAGS, SUBS, 'WARC Awards', settle=0)
+
+
+def drop(folder, name='400001.html'):
+    shutil.copyfile(HTML, folder / name)
+    return folder / name
+
+
+def test_wanted(watcher):
+    names = ['a.docx', 'b.HTML', '~$a.docx', '.a.1-2.docx', 'c.txt', 'htm']
+    assert [n for n in names if watcher.wanted(watcher.path / n)] == ['a.docx', 'b.HTML']
+
+
+def test_waits_to_settle(tmp_path, TAGS, SUBS):
+    w = ca.Watcher(tmp_path, TAGS, SUBS, 'WARC Awards', settle=60)
+    w.scan()
+    drop(tmp_path)
+    w.scan()
+    assert w.pending and w.ready() == []
+
+
+def test_waits_for_whole_docx(tmp_path, TAGS, SUBS):
+    w = ca.Watcher(tmp_path, TAGS, SUBS, 'WARC Awards', settle=0.05)
+    p = tmp_path / '400001.docx'
+    p.write_bytes(b'PK\x03\x04 half a zip')
+    w.scan()
+    time.sleep(0.1)
+    assert w.ready() == [] and p in w.pending                     # settled, but given longer to finish
+
+
+def test_converts_once(watcher, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(watch, '_watch_job', (watcher.args, watcher.opts))
+    p = drop(watcher.path)
+    watcher.scan()
+    with ThreadPoolExecutor(1) as pool:
+        watcher.submit(pool)
+        watcher.collect(block=True)
+    assert (watcher.path / 'htm' / '400001.htm').exists()
+    assert watcher.state['400001.html']['ok']
+    restarted = ca.Watcher(watcher.path, *watcher.args, settle=0)  # from the state file
+    restarted.scan()
+    assert restarted.ready() == []
+    time.sleep(0.01)
+    p.write_text(p.read_text(encoding='utf-8') + '<p>Edit.</p>', encoding='utf-8')
+    restarted.scan()
+    assert [f for f, _ in restarted.ready()] == [p]
+    p.unlink()
+    restarted.scan()
+    assert restarted.state == {}
+
+
+def test_workers_get_settings_once(watcher):
+    p = drop(watcher.path)
+    initargs = (watcher.args, watcher.opts, *log_args())
+    with ProcessPoolExecutor(1, initializer=watch.watch_init, initargs=initargs) as pool:
+        r = pool.submit(watch.watch_convert, p).result()
+    assert r['ok'] and r['file'] == '400001.html'
+
+
+def test_inotify(tmp_path):
+    notify = watch.Inotify.open(tmp_path)
+    if notify is None:
+        pytest.skip('no inotify here')
+    try:
+        drop(tmp_path)
+        assert '400001.html' in notify.read(1)
+    finally:
+        notify.close()